@@ -1,98 +1,421 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File
-from pydantic import BaseModel
-from typing import List, Dict, Any, Optional, Union
+import time
+_import_started = time.perf_counter()
+
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Header
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
+from fastapi.routing import APIRoute
+from pydantic import BaseModel, ValidationError
+from typing import List, Dict, Any, Callable, Optional, Tuple, Type, Union
 import pandas as pd
-import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-from scipy import stats
-import statsmodels.api as sm
-from sklearn.linear_model import LinearRegression
-from sklearn.cluster import KMeans, DBSCAN
-from sklearn.preprocessing import StandardScaler
-from sklearn.metrics import silhouette_score
-import io
-import base64
-import json
 from datetime import datetime
+import inspect
+import itertools
 import os
 
+import analyses
+import excel_io
+import metrics
+import pipeline
+import plotting
+import profiling
+from analyses import AnalysisInputError
+
+from dataset_store import DatasetStore, DatasetAppendError, DatasetNotFoundError, DatasetTooLargeError
+from shared_datasets import SHARED_DATASETS_DIR, SharedDatasetStore
+from wire_format import (
+    ARROW_STREAM_MEDIA_TYPE, META_HEADER, FastJSONResponse, FrameRoute, binary_frame_response, frame_from_json,
+    frame_to_json, in_memory_request, metadata_header, request_frame, response_media_type, response_orient
+)
+from chunked_io import (
+    DEFAULT_CHUNK_SIZE, CsvChunkReader, arrow_stream, csv_reader_kwargs, export_stream, ndjson_stream, read_csv_page,
+    stable_dtypes
+)
+from executor import PLOT_POOL, PROCESS_POOL, THREAD_POOL, RequestContextMiddleware, WorkerPools
+from result_cache import ResultCache, cache_key, file_fingerprint, frame_fingerprint
+from source_cache import SourceCache
+from jobs import JOB_CANCELLED, JOB_FAILED, JOB_SUCCEEDED, JobManager, JobNotFoundError, JobQueueFullError
+from startup import SUBSYSTEM_MODULES, WARM_UP_ENABLED, StartupMonitor
+
+# Import, readiness and warm-up timings reported by /health
+startup_monitor = StartupMonitor(started=_import_started)
+
+# Parsed datasets shared across requests, referenced by dataset_id. Server processes started
+# together by run_stats_service.py share them through a registry in shared memory.
+dataset_store = SharedDatasetStore(SHARED_DATASETS_DIR) if SHARED_DATASETS_DIR else DatasetStore()
+
+# CPU-bound analyses and plots run on worker processes, light operations on threads.
+# Workers import the heavy subsystems up front so first requests do not pay for them.
+worker_pools = WorkerPools(
+    preload=["analyses", *(module for modules in SUBSYSTEM_MODULES.values() for module in modules)],
+    warm_up={PLOT_POOL: plotting.warm_up}
+)
+
+# Per-endpoint latency, phase, size and memory histograms served at /metrics
+metrics_registry = metrics.MetricsRegistry()
+
+# Profiles of requests sent with X-Stats-Profile, retrieved through /profiles
+profile_store = profiling.ProfileStore()
+
+# Analysis and plot results keyed by dataset content and parameters
+result_cache = ResultCache()
+
+# Parsed CSV and Excel files stored as memory-mapped Arrow files, keyed by file and load options
+source_cache = SourceCache()
+
+async def run_job_endpoint(endpoint: str, request: Dict[str, Any]) -> Any:
+    """Call a POST endpoint directly on behalf of a job"""
+    fn, model = job_target(endpoint)
+    return await fn(model.model_validate(request))
+
+# Long-running calls submitted through /jobs and polled for their results, through any server process
+# when they share a dataset registry
+job_manager = JobManager(
+    run_job_endpoint, shared_dir=os.path.join(SHARED_DATASETS_DIR, "jobs") if SHARED_DATASETS_DIR else None
+)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await job_manager.start()
+    startup_monitor.ready()
+    if WARM_UP_ENABLED:
+        startup_monitor.warm_up({"worker_pools": worker_pools.start})
+    yield
+    await job_manager.stop()
+    worker_pools.shutdown()
+
 app = FastAPI(
     title="Advanced Statistical Analysis Service",
     description="Comprehensive statistical analysis and data mining service inspired by Orange3",
     version="2.0.0",
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse,
 )
-
-# Global settings
-plt.style.use('seaborn-v0_8')
-sns.set_palette("husl")
+# Accept and return datasets as Arrow IPC / Parquet bodies when negotiated
+app.router.route_class = FrameRoute
+app.add_middleware(RequestContextMiddleware)
+app.add_middleware(profiling.ProfilingMiddleware, store=profile_store)
+app.add_middleware(metrics.MetricsMiddleware, registry=metrics_registry)
 
 class DataLoadRequest(BaseModel):
     file_path: str
     options: Dict[str, Any] = {}
 
-class ColumnSelectionRequest(BaseModel):
-    data: List[Dict[str, Any]]
+class DatasetRequest(BaseModel):
+    """Base for requests that operate on a dataset, given inline or by handle.
+
+    Inline data is a list of records or a columnar {"columns", "data"} object.
+    Over HTTP it is decoded by FrameRoute before validation.
+    """
+    data: Optional[Union[List[Dict[str, Any]], Dict[str, Any]]] = None
+    dataset_id: Optional[str] = None
+
+class AppendRequest(DatasetRequest):
+    options: Dict[str, Any] = {}
+
+class ColumnSelectionRequest(DatasetRequest):
     columns: List[str]
 
-class MissingValuesRequest(BaseModel):
-    data: List[Dict[str, Any]]
+class MissingValuesRequest(DatasetRequest):
     method: str = 'drop'
     fill_value: Optional[Union[str, float, int]] = None
 
-class AnalysisRequest(BaseModel):
-    data: List[Dict[str, Any]]
+class AnalysisRequest(DatasetRequest):
     columns: Optional[List[str]] = None
     options: Dict[str, Any] = {}
 
-class RegressionRequest(BaseModel):
-    data: List[Dict[str, Any]]
-    target_column: str
+class RegressionRequest(DatasetRequest):
+    target_column: Optional[str] = None
+    target_columns: Optional[List[str]] = None
     feature_columns: Optional[List[str]] = None
+    options: Dict[str, Any] = {}
 
-class ClusteringRequest(BaseModel):
-    data: List[Dict[str, Any]]
+class ClusteringRequest(DatasetRequest):
     n_clusters: int = 3
     algorithm: str = 'kmeans'
     columns: Optional[List[str]] = None
+    options: Dict[str, Any] = {}
 
-class HypothesisTestRequest(BaseModel):
-    data: List[Dict[str, Any]]
+class HypothesisTestRequest(DatasetRequest):
     test_type: str
     columns: List[str]
     options: Dict[str, Any] = {}
 
-class ANOVARequest(BaseModel):
-    data: List[Dict[str, Any]]
+class ANOVARequest(DatasetRequest):
     group_column: str
     value_column: str
+    options: Dict[str, Any] = {}
 
-class VisualizationRequest(BaseModel):
-    data: List[Dict[str, Any]]
+class VisualizationRequest(DatasetRequest):
     options: Dict[str, Any] = {}
 
-class ExportRequest(BaseModel):
-    data: List[Dict[str, Any]]
+class ExportRequest(DatasetRequest):
     file_path: str
     options: Dict[str, Any] = {}
 
-def dataframe_to_dict(df: pd.DataFrame) -> List[Dict[str, Any]]:
-    """Convert DataFrame to list of dictionaries for JSON serialization"""
-    return df.to_dict('records')
+class DownloadRequest(DatasetRequest):
+    format: str = 'csv'
+    options: Dict[str, Any] = {}
+
+class JobRequest(BaseModel):
+    endpoint: str
+    request: Dict[str, Any] = {}
+
+class PipelineStep(BaseModel):
+    id: str
+    op: str
+    input: Optional[str] = None
+    params: Dict[str, Any] = {}
+
+class PipelineRequest(DatasetRequest):
+    steps: List[PipelineStep]
+    outputs: Optional[List[str]] = None
+
+def dataframe_to_dict(df: pd.DataFrame) -> Union[List[Dict[str, Any]], Dict[str, Any]]:
+    """Convert DataFrame for JSON serialization in the layout the client asked for (records by default)"""
+    return frame_to_json(df, response_orient())
+
+def dict_to_dataframe(data: Union[List[Dict[str, Any]], Dict[str, Any]]) -> pd.DataFrame:
+    """Convert records or a columnar object to DataFrame"""
+    return frame_from_json(data)
+
+def resolve_dataframe(request: DatasetRequest) -> pd.DataFrame:
+    """Return the request's DataFrame from a binary body, dataset handle or inline rows"""
+    frame = request_frame()
+    if frame is None and request.dataset_id is not None:
+        try:
+            frame = dataset_store.get(request.dataset_id)
+        except DatasetNotFoundError:
+            raise HTTPException(status_code=404, detail=f"Dataset not found: {request.dataset_id}")
+    if frame is None:
+        if request.data is None:
+            raise HTTPException(status_code=400, detail="Either data or dataset_id is required")
+        try:
+            frame = dict_to_dataframe(request.data)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid data: {str(e)}")
+    metrics.record_frame(frame)
+    return frame
+
+def register_dataframe(df: pd.DataFrame, name: Optional[str] = None, source: Optional[str] = None) -> str:
+    """Register a DataFrame in the dataset store, mapping budget overflow to 413"""
+    try:
+        return dataset_store.put(df, name=name, source=source)
+    except DatasetTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+def frame_response(df: pd.DataFrame, payload: Dict[str, Any]):
+    """Return df with payload as JSON records, or as the negotiated binary format"""
+    media_type = response_media_type()
+    if media_type is not None:
+        return binary_frame_response(df, media_type, payload)
+    payload["data"] = dataframe_to_dict(df)
+    return payload
+
+def loaded_dataset_response(df: pd.DataFrame, dataset_id: str, options: Dict[str, Any]):
+    """Build the response for a freshly loaded and registered dataset"""
+    response = {
+        "success": True,
+        "dataset_id": dataset_id,
+        "shape": df.shape,
+        "columns": df.columns.tolist(),
+        "dtypes": df.dtypes.astype(str).to_dict()
+    }
+    if options.get('include_data', True):
+        return frame_response(df, response)
+    return response
+
+def stream_csv_response(request: DataLoadRequest) -> StreamingResponse:
+    """Stream a CSV file chunk by chunk as NDJSON rows or Arrow record batches"""
+    reader = CsvChunkReader(
+        request.file_path,
+        request.options,
+        chunk_size=int(request.options.get('chunk_size', DEFAULT_CHUNK_SIZE))
+    )
+    metadata = {
+        "columns": reader.columns,
+        "dtypes": {str(column): str(dtype) for column, dtype in reader.dtypes.items()},
+        "chunk_size": reader.chunk_size
+    }
+    if response_media_type() == ARROW_STREAM_MEDIA_TYPE:
+        body, media_type = arrow_stream(iter(reader)), ARROW_STREAM_MEDIA_TYPE
+    else:
+        body, media_type = ndjson_stream(iter(reader)), "application/x-ndjson"
+    return StreamingResponse(body, media_type=media_type, headers={META_HEADER: metadata_header(metadata)})
+
+async def load_source(reader: Callable[..., pd.DataFrame], file_path: str, options: Dict[str, Any],
+                      **reader_kwargs) -> pd.DataFrame:
+    """Parse a source file on the thread pool, through the source cache unless options.cache is false"""
+    if not options.get('cache', True):
+        return await run_analysis(reader, file_path, pool=THREAD_POOL, **reader_kwargs)
+    df, _ = await run_analysis(source_cache.load, file_path, reader, pool=THREAD_POOL, **reader_kwargs)
+    return df
+
+async def load_excel_sheets(request: DataLoadRequest) -> Dict[str, pd.DataFrame]:
+    """Read the requested worksheets, serving unchanged ones from the source cache.
+
+    Sheets missing from the cache are parsed on the process pool, up to
+    options.max_workers of them in parallel.
+    """
+    options = request.options
+    kwargs = {
+        "header": bool(options.get('header', True)),
+        "cell_range": options.get('range'),
+        "engine": options.get('engine', 'auto')
+    }
+    sheets = await run_analysis(
+        excel_io.resolve_sheets, request.file_path, options.get('sheet_name', 0), kwargs["engine"], pool=THREAD_POOL
+    )
+    use_cache = source_cache.enabled and options.get('cache', True)
+    keys, frames = {}, {}
+    if use_cache:
+        for sheet in sheets:
+            keys[sheet] = source_cache.entry_key(
+                request.file_path, excel_io.read_excel_sheet, sheet_name=sheet, **kwargs
+            )
+            frames[sheet] = await run_analysis(source_cache.get, keys[sheet], pool=THREAD_POOL)
+
+    missing = [sheet for sheet in sheets if frames.get(sheet) is None]
+    if missing:
+        parsed = await run_analysis(
+            excel_io.read_sheets, request.file_path, missing,
+            max_workers=int(options.get('max_workers', 1)),
+            chunk_size=int(options.get('chunk_size', excel_io.DEFAULT_CHUNK_SIZE)),
+            **kwargs
+        )
+        for sheet, df in parsed.items():
+            frames[sheet] = df
+            if use_cache:
+                await run_analysis(
+                    source_cache.put, keys[sheet], df, request.file_path, excel_io.read_excel_sheet,
+                    pool=THREAD_POOL, sheet_name=sheet, **kwargs
+                )
+    return {sheet: frames[sheet] for sheet in sheets}
+
+def stream_excel_response(request: DataLoadRequest) -> StreamingResponse:
+    """Stream one worksheet chunk by chunk as NDJSON rows or Arrow record batches"""
+    options = request.options
+    sheet, = excel_io.resolve_sheets(request.file_path, options.get('sheet_name', 0), engine='openpyxl')
+    chunks = excel_io.iter_sheet_chunks(
+        request.file_path, sheet, header=bool(options.get('header', True)), cell_range=options.get('range'),
+        chunk_size=int(options.get('chunk_size', DEFAULT_CHUNK_SIZE))
+    )
+    # The first chunk fixes the schema, widened as for CSV streams so later chunks can hold decimals and gaps
+    first = next(chunks)
+    dtypes = stable_dtypes(first)
+    metadata = {
+        "sheet_name": sheet,
+        "columns": first.columns.tolist(),
+        "dtypes": {str(column): str(dtype) for column, dtype in dtypes.items()},
+        "chunk_size": int(options.get('chunk_size', DEFAULT_CHUNK_SIZE))
+    }
+    typed = (chunk.astype(dtypes) for chunk in itertools.chain([first], chunks))
+    if response_media_type() == ARROW_STREAM_MEDIA_TYPE:
+        body, media_type = arrow_stream(typed), ARROW_STREAM_MEDIA_TYPE
+    else:
+        body, media_type = ndjson_stream(typed), "application/x-ndjson"
+    return StreamingResponse(body, media_type=media_type, headers={META_HEADER: metadata_header(metadata)})
+
+def download_response(df: pd.DataFrame, fmt: str, options: Dict[str, Any], name: str) -> StreamingResponse:
+    """Stream df as a file download, encoded chunk by chunk as it is sent"""
+    try:
+        body, media_type, extension = export_stream(df, fmt, options)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    filename = options.get('filename') or f"{name}.{extension}"
+    return StreamingResponse(body, media_type=media_type,
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+async def run_analysis(fn: Callable, *args, pool: str = PROCESS_POOL, **kwargs) -> Any:
+    """Run an analysis function on a worker pool, reporting input errors as 400"""
+    try:
+        with metrics.phase("render" if pool == PLOT_POOL else "compute"):
+            return await worker_pools.run(fn, *args, pool=pool, **kwargs)
+    except AnalysisInputError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+async def run_cached_analysis(fn: Callable, df: pd.DataFrame, *args, pool: str = PROCESS_POOL) -> Any:
+    """run_analysis(fn, df, *args) with its result cached by dataset content and arguments"""
+    fingerprint = await run_analysis(frame_fingerprint, df, pool=THREAD_POOL)
+    key = cache_key(f"{fn.__module__}.{fn.__name__}", fingerprint, args)
+    return await result_cache.get_or_compute(key, lambda: run_analysis(fn, df, *args, pool=pool))
+
+async def run_incremental(request: DatasetRequest, fn: Callable, *args) -> Any:
+    """Run fn(trackers, *args) on the incremental statistics of the request's stored dataset"""
+    if request.dataset_id is None:
+        raise HTTPException(status_code=400, detail="Incremental statistics require a dataset_id")
+
+    def compute():
+        with dataset_store.incremental(request.dataset_id) as trackers:
+            return fn(trackers, *args)
+
+    try:
+        return await run_analysis(compute, pool=THREAD_POOL)
+    except DatasetNotFoundError:
+        raise HTTPException(status_code=404, detail=f"Dataset not found: {request.dataset_id}")
+
+async def run_plot(fn: Callable, df: pd.DataFrame, options: Dict[str, Any]):
+    """Render a plot on the plot pool, returning raw image bytes with the other fields in X-Stats-Meta"""
+    payload = await run_cached_analysis(fn, df, options, pool=PLOT_POOL)
+    if "image" not in payload:
+        return payload
+    image = payload.pop("image")
+    return Response(content=image, media_type=payload.pop("media_type"),
+                    headers={META_HEADER: metadata_header(payload)})
+
+async def run_frame_operation(fn: Callable, *args):
+    """Run a preprocessing function that returns (DataFrame, payload) on the thread pool"""
+    df, payload = await run_analysis(fn, *args, pool=THREAD_POOL)
+    return frame_response(df, payload)
+
+def post_endpoint(path: str) -> Optional[Tuple[Callable, Type[BaseModel]]]:
+    """Return the endpoint function and body model of a POST route taking a single model"""
+    for route in app.routes:
+        if isinstance(route, APIRoute) and route.path == path and "POST" in route.methods:
+            parameters = list(inspect.signature(route.endpoint).parameters.values())
+            if len(parameters) == 1 and inspect.isclass(parameters[0].annotation) \
+                    and issubclass(parameters[0].annotation, BaseModel):
+                return route.endpoint, parameters[0].annotation
+    return None
+
+def job_target(path: str) -> Tuple[Callable, Type[BaseModel]]:
+    """Return the endpoint function and body model of a POST route that can run as a job"""
+    target = None if path.startswith("/jobs") else post_endpoint(path)
+    if target is None:
+        raise HTTPException(status_code=404, detail=f"Endpoint cannot run as a job: {path}")
+    return target
 
-def dict_to_dataframe(data: List[Dict[str, Any]]) -> pd.DataFrame:
-    """Convert list of dictionaries to DataFrame"""
-    return pd.DataFrame(data)
+# Operations that transform a dataset: body model, function, and its arguments taken from the body.
+# Inside a pipeline these pass their DataFrame to the next step instead of serializing it.
+FRAME_OPERATIONS: Dict[str, Tuple[Type[BaseModel], Callable, Callable[[Any], tuple]]] = {
+    "/select-columns": (ColumnSelectionRequest, analyses.select_columns, lambda body: (body.columns,)),
+    "/remove-duplicates": (AnalysisRequest, analyses.remove_duplicates, lambda body: (body.options.get('subset', None),)),
+    "/handle-missing": (MissingValuesRequest, analyses.handle_missing_values, lambda body: (body.method, body.fill_value)),
+}
 
-def create_plot_image(fig) -> str:
-    """Convert matplotlib figure to base64 image string"""
-    buffer = io.BytesIO()
-    fig.savefig(buffer, format='png', dpi=150, bbox_inches='tight')
-    buffer.seek(0)
-    image_data = base64.b64encode(buffer.getvalue()).decode()
-    buffer.close()
-    plt.close(fig)
-    return image_data
+def pipeline_operation(op: str) -> Tuple[str, Callable, Type[BaseModel]]:
+    """Return the path, endpoint function and body model of an operation usable as a pipeline step"""
+    path = op if op.startswith("/") else f"/{op}"
+    if path in FRAME_OPERATIONS:
+        model, fn, _ = FRAME_OPERATIONS[path]
+        return path, fn, model
+    target = post_endpoint(path)
+    if target is None or not issubclass(target[1], DatasetRequest) or target[1] is PipelineRequest:
+        raise HTTPException(status_code=400, detail=f"Operation cannot run in a pipeline: {op}")
+    return (path, *target)
+
+async def run_pipeline_step(path: str, fn: Callable, body: BaseModel,
+                            df: pd.DataFrame) -> Tuple[Optional[pd.DataFrame], Dict[str, Any]]:
+    """Apply one pipeline operation to df, returning (resulting DataFrame or None, payload)"""
+    if path in FRAME_OPERATIONS:
+        _, operation, arguments = FRAME_OPERATIONS[path]
+        return await run_analysis(operation, df, *arguments(body), pool=THREAD_POOL)
+    with in_memory_request(df):
+        payload = await fn(body)
+    if isinstance(payload, Response):
+        raise HTTPException(status_code=400, detail=f"{path} returned a binary response; request a JSON format")
+    return None, payload
 
 # Health Check
 @app.get("/health")
@@ -104,129 +427,393 @@ async def health_check():
         "features": [
             "data_loading", "preprocessing", "descriptive_stats", 
             "correlation_analysis", "regression", "clustering",
-            "hypothesis_testing", "anova", "visualization", "export"
-        ]
+            "hypothesis_testing", "anova", "visualization", "export",
+            "dataset_registry", "jobs", "result_cache", "pipeline"
+        ],
+        "datasets": dataset_store.usage(),
+        "workers": worker_pools.status(),
+        "jobs": job_manager.status(),
+        "cache": result_cache.stats(),
+        "source_cache": source_cache.stats(),
+        "startup": startup_monitor.report()
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Request metrics and current resource gauges in Prometheus text format"""
+    workers = worker_pools.status()
+    datasets = dataset_store.usage()
+    cache = result_cache.stats()
+    lines = metrics_registry.render()
+    lines += metrics.format_gauge("stats_process_resident_bytes", "Resident memory of the server process",
+                                  {(): metrics.rss_bytes() or 0})
+    lines += metrics.format_gauge("stats_process_peak_resident_bytes", "Peak resident memory of the server process",
+                                  {(): metrics.peak_rss_bytes() or 0})
+    lines += metrics.format_gauge("stats_tasks_in_flight", "Tasks queued or running per worker pool",
+                                  {(("pool", pool),): count for pool, count in workers["in_flight"].items()})
+    lines += metrics.format_gauge("stats_dataset_bytes", "Memory held by registered datasets",
+                                  {(): datasets["memory_bytes"]})
+    lines += metrics.format_gauge("stats_result_cache_bytes", "Memory held by the result cache",
+                                  {(): cache["memory_bytes"]})
+    return PlainTextResponse("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
+
+def require_profile_token(token: Optional[str]):
+    if not profiling.authorized(token):
+        raise HTTPException(status_code=403, detail="Profiles require a valid profile token")
+
+def stored_profile(profile_id: str) -> profiling.RequestProfile:
+    profile = profile_store.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail=f"Profile not found: {profile_id}")
+    return profile
+
+ProfileToken = Header(None, alias=profiling.PROFILE_TOKEN_HEADER)
+
+@app.get("/profiles")
+async def list_profiles(token: Optional[str] = ProfileToken):
+    require_profile_token(token)
+    sampler = profiling.sampler()
+    return {
+        "success": True,
+        "profiles": profile_store.list(),
+        "sampling": sampler.status() if sampler is not None else None
     }
 
+@app.delete("/profiles")
+async def clear_profiles(token: Optional[str] = ProfileToken):
+    require_profile_token(token)
+    return {"success": True, "profiles_removed": profile_store.clear()}
+
+@app.get("/profiles/sampled")
+async def sampled_profile(format: str = 'collapsed', top: int = profiling.DEFAULT_TOP,
+                          token: Optional[str] = ProfileToken):
+    """Stacks recorded by the service-wide sampler, as collapsed stacks or the top functions"""
+    require_profile_token(token)
+    sampler = profiling.sampler()
+    if sampler is None:
+        raise HTTPException(status_code=404, detail="Sampling is disabled; set STATS_PROFILE_SAMPLE_HZ to enable it")
+    if format == 'collapsed':
+        return PlainTextResponse(sampler.collapsed())
+    if format == 'json':
+        return {"success": True, **sampler.status(), "functions": sampler.top(top)}
+    raise HTTPException(status_code=400, detail=f"Unsupported sample format: {format}")
+
+@app.delete("/profiles/sampled")
+async def reset_sampled_profile(token: Optional[str] = ProfileToken):
+    require_profile_token(token)
+    sampler = profiling.sampler()
+    return {"success": True, "samples_removed": sampler.reset() if sampler is not None else 0}
+
+@app.get("/profiles/{profile_id}")
+async def get_profile(profile_id: str, top: int = profiling.DEFAULT_TOP, token: Optional[str] = ProfileToken):
+    require_profile_token(token)
+    return {"success": True, **stored_profile(profile_id).summary(top)}
+
+@app.get("/profiles/{profile_id}/pstats")
+async def download_profile_stats(profile_id: str, token: Optional[str] = ProfileToken):
+    """The CPU profile as a pstats file"""
+    require_profile_token(token)
+    profile = stored_profile(profile_id)
+    if profile.mode != 'cpu':
+        raise HTTPException(status_code=400, detail=f"Profile {profile_id} is an allocation profile")
+    return Response(profile.pstats_bytes(), media_type="application/octet-stream",
+                    headers={"Content-Disposition": f'attachment; filename="profile-{profile_id}.pstats"'})
+
 # Data Loading Endpoints
 @app.post("/load-csv")
 async def load_csv(request: DataLoadRequest):
     try:
-        df = pd.read_csv(
-            request.file_path,
-            delimiter=request.options.get('delimiter', ','),
-            header=0 if request.options.get('header', True) else None,
-            encoding=request.options.get('encoding', 'utf-8')
-        )
-        
-        return {
-            "success": True,
-            "data": dataframe_to_dict(df),
-            "shape": df.shape,
-            "columns": df.columns.tolist(),
-            "dtypes": df.dtypes.astype(str).to_dict()
-        }
+        # Streaming mode: bounded memory, rows are not registered as a dataset
+        if request.options.get('stream', False):
+            return await run_analysis(stream_csv_response, request, pool=THREAD_POOL)
+        
+        # Page mode: preview a window of rows without reading the whole file
+        if 'limit' in request.options:
+            offset = int(request.options.get('offset', 0))
+            limit = int(request.options['limit'])
+            page, has_more = await run_analysis(
+                read_csv_page, request.file_path, request.options, offset, limit, pool=THREAD_POOL
+            )
+            return frame_response(page, {
+                "success": True,
+                "offset": offset,
+                "limit": limit,
+                "has_more": has_more,
+                "shape": page.shape,
+                "columns": page.columns.tolist(),
+                "dtypes": page.dtypes.astype(str).to_dict()
+            })
+        
+        df = await load_source(pd.read_csv, request.file_path, request.options, **csv_reader_kwargs(request.options))
+        dataset_id = register_dataframe(df, name=request.options.get('name'), source=request.file_path)
+        
+        return loaded_dataset_response(df, dataset_id, request.options)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to load CSV: {str(e)}")
 
 @app.post("/load-excel")
 async def load_excel(request: DataLoadRequest):
     try:
-        df = pd.read_excel(
-            request.file_path,
-            sheet_name=request.options.get('sheet_name', 0),
-            header=0 if request.options.get('header', True) else None
-        )
-        
-        return {
-            "success": True,
-            "data": dataframe_to_dict(df),
-            "shape": df.shape,
-            "columns": df.columns.tolist(),
-            "dtypes": df.dtypes.astype(str).to_dict()
-        }
+        # Streaming mode: one sheet, rows are not registered as a dataset
+        if request.options.get('stream', False):
+            return await run_analysis(stream_excel_response, request, pool=THREAD_POOL)
+
+        frames = await load_excel_sheets(request)
+        if len(frames) == 1:
+            df, = frames.values()
+            dataset_id = register_dataframe(df, name=request.options.get('name'), source=request.file_path)
+            return loaded_dataset_response(df, dataset_id, request.options)
+
+        # Several sheets: each becomes a dataset, without echoing the rows
+        sheets = {}
+        for sheet, df in frames.items():
+            name = f"{request.options['name']}:{sheet}" if request.options.get('name') else sheet
+            dataset_id = register_dataframe(df, name=name, source=f"{request.file_path}#{sheet}")
+            sheets[sheet] = loaded_dataset_response(df, dataset_id, {"include_data": False})
+        return {"success": True, "sheets": sheets}
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Failed to load Excel: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to load Excel: {str(e)}")
 
+# Dataset Registry Endpoints
+@app.post("/datasets/upload")
+async def upload_dataset(
+    file: UploadFile = File(...),
+    name: Optional[str] = Form(None),
+    delimiter: str = Form(','),
+    header: bool = Form(True),
+    encoding: str = Form('utf-8'),
+    sheet_name: Optional[str] = Form(None),
+    include_data: bool = Form(False)
+):
+    try:
+        filename = file.filename or ''
+        extension = os.path.splitext(filename)[1].lower()
+        
+        if extension in ('.xlsx', '.xlsm', '.xls'):
+            df = await run_analysis(
+                pd.read_excel,
+                file.file,
+                pool=THREAD_POOL,
+                sheet_name=sheet_name if sheet_name is not None else 0,
+                header=0 if header else None
+            )
+        elif extension in ('.csv', '.tsv', '.txt', ''):
+            df = await run_analysis(
+                pd.read_csv,
+                file.file,
+                pool=THREAD_POOL,
+                delimiter='\t' if extension == '.tsv' else delimiter,
+                header=0 if header else None,
+                encoding=encoding
+            )
+        else:
+            raise HTTPException(status_code=415, detail=f"Unsupported file type: {extension}")
+        dataset_id = register_dataframe(df, name=name or filename, source=filename)
+        
+        return loaded_dataset_response(df, dataset_id, {"include_data": include_data})
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to upload dataset: {str(e)}")
+
+@app.get("/datasets")
+async def list_datasets():
+    return {
+        "success": True,
+        "datasets": dataset_store.list(),
+        "usage": dataset_store.usage()
+    }
+
+@app.get("/datasets/{dataset_id}")
+async def get_dataset_info(dataset_id: str):
+    try:
+        return {"success": True, **dataset_store.info(dataset_id)}
+    except DatasetNotFoundError:
+        raise HTTPException(status_code=404, detail=f"Dataset not found: {dataset_id}")
+
+@app.post("/datasets/{dataset_id}/append")
+async def append_dataset(dataset_id: str, request: AppendRequest):
+    try:
+        rows = resolve_dataframe(request.model_copy(update={"dataset_id": None}))
+        info = await run_analysis(dataset_store.append, dataset_id, rows, pool=THREAD_POOL)
+        return {"success": True, "rows_appended": len(rows), **info}
+    except HTTPException:
+        raise
+    except DatasetNotFoundError:
+        raise HTTPException(status_code=404, detail=f"Dataset not found: {dataset_id}")
+    except DatasetAppendError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except DatasetTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to append to dataset: {str(e)}")
+
+@app.delete("/datasets/{dataset_id}")
+async def delete_dataset(dataset_id: str):
+    if not dataset_store.delete(dataset_id):
+        raise HTTPException(status_code=404, detail=f"Dataset not found: {dataset_id}")
+    return {"success": True, "dataset_id": dataset_id}
+
+# Result Cache Endpoints
+@app.get("/cache")
+async def cache_stats():
+    return {"success": True, **result_cache.stats(), "source_cache": source_cache.stats()}
+
+@app.delete("/cache")
+async def clear_cache():
+    return {
+        "success": True,
+        "entries_removed": await run_analysis(result_cache.clear, pool=THREAD_POOL),
+        "source_entries_removed": await run_analysis(source_cache.clear, pool=THREAD_POOL)
+    }
+
+# Job Endpoints
+@app.post("/jobs", status_code=202)
+async def submit_job(request: JobRequest):
+    _, model = job_target(request.endpoint)
+    try:
+        model.model_validate(request.request)
+    except ValidationError as e:
+        raise RequestValidationError(e.errors(include_url=False))
+    try:
+        job = await job_manager.submit(request.endpoint, request.request)
+    except JobQueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    return {"success": True, **job.to_dict()}
+
+@app.get("/jobs")
+async def list_jobs():
+    return {
+        "success": True,
+        "jobs": job_manager.list(),
+        "status": job_manager.status()
+    }
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    try:
+        return {"success": True, **job_manager.get(job_id).to_dict()}
+    except JobNotFoundError:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+
+@app.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str):
+    try:
+        job = job_manager.get(job_id)
+    except JobNotFoundError:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+    if job.status == JOB_SUCCEEDED:
+        try:
+            return job_manager.result(job)
+        except JobNotFoundError:
+            raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+    if job.status == JOB_FAILED:
+        raise HTTPException(status_code=job.error["status_code"], detail=job.error["detail"])
+    if job.status == JOB_CANCELLED:
+        raise HTTPException(status_code=409, detail=f"Job was cancelled: {job_id}")
+    # Still queued or running
+    return FastJSONResponse(status_code=202, content={"success": True, **job.to_dict()})
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    try:
+        return {"success": True, **job_manager.cancel(job_id).to_dict()}
+    except JobNotFoundError:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+
+# Pipeline Endpoint
+@app.post("/pipeline")
+async def run_pipeline(request: PipelineRequest):
+    try:
+        inputs, order, outputs = pipeline.plan([(step.id, step.input) for step in request.steps], request.outputs)
+    except pipeline.PipelineError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # Validate every step before running any
+    calls: Dict[str, Tuple[str, Callable, BaseModel]] = {}
+    errors = []
+    for index, step in enumerate(request.steps):
+        path, fn, model = pipeline_operation(step.op)
+        try:
+            calls[step.id] = (path, fn, model.model_validate(step.params))
+        except ValidationError as e:
+            errors.extend(
+                {**error, "loc": ("body", "steps", index, "params", *error["loc"])}
+                for error in e.errors(include_url=False)
+            )
+    if errors:
+        raise RequestValidationError(errors)
+    for step_id, source in inputs.items():
+        if source != pipeline.PIPELINE_INPUT and calls[source][0] not in FRAME_OPERATIONS:
+            raise HTTPException(
+                status_code=400, detail=f"Step '{step_id}' reads from '{source}', which does not produce a dataset"
+            )
+
+    try:
+        df = resolve_dataframe(request)
+        results = await pipeline.execute(
+            inputs, order, (df, None),
+            lambda step_id, value: run_pipeline_step(*calls[step_id], value[0])
+        )
+    except pipeline.StepFailedError as e:
+        if isinstance(e.error, HTTPException):
+            raise HTTPException(status_code=e.error.status_code, detail=f"Step '{e.step_id}' failed: {e.error.detail}")
+        raise HTTPException(status_code=500, detail=str(e))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to run pipeline: {str(e)}")
+
+    response = {}
+    for step_id in outputs:
+        frame, payload = results[step_id]
+        response[step_id] = payload if frame is None else {**payload, "data": dataframe_to_dict(frame)}
+    return {"success": True, "outputs": response}
+
 # Preprocessing Endpoints
 @app.post("/data-info")
 async def data_info(request: AnalysisRequest):
     try:
-        df = dict_to_dataframe(request.data)
-        
-        return {
-            "success": True,
-            "shape": df.shape,
-            "columns": df.columns.tolist(),
-            "dtypes": df.dtypes.astype(str).to_dict(),
-            "missing_values": df.isnull().sum().to_dict(),
-            "memory_usage": df.memory_usage(deep=True).sum(),
-            "summary": {
-                "numeric_columns": df.select_dtypes(include=[np.number]).columns.tolist(),
-                "categorical_columns": df.select_dtypes(include=['object']).columns.tolist(),
-                "datetime_columns": df.select_dtypes(include=['datetime64']).columns.tolist()
-            }
-        }
+        df = resolve_dataframe(request)
+        return await run_analysis(analyses.data_info, df, pool=THREAD_POOL)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get data info: {str(e)}")
 
 @app.post("/select-columns")
 async def select_columns(request: ColumnSelectionRequest):
     try:
-        df = dict_to_dataframe(request.data)
-        selected_df = df[request.columns]
-        
-        return {
-            "success": True,
-            "data": dataframe_to_dict(selected_df),
-            "shape": selected_df.shape
-        }
+        df = resolve_dataframe(request)
+        return await run_frame_operation(analyses.select_columns, df, request.columns)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to select columns: {str(e)}")
 
 @app.post("/remove-duplicates")
 async def remove_duplicates(request: AnalysisRequest):
     try:
-        df = dict_to_dataframe(request.data)
-        subset = request.options.get('subset', None)
-        
-        original_shape = df.shape
-        df_cleaned = df.drop_duplicates(subset=subset)
-        duplicates_removed = original_shape[0] - df_cleaned.shape[0]
-        
-        return {
-            "success": True,
-            "data": dataframe_to_dict(df_cleaned),
-            "duplicates_removed": duplicates_removed,
-            "shape": df_cleaned.shape
-        }
+        df = resolve_dataframe(request)
+        return await run_frame_operation(analyses.remove_duplicates, df, request.options.get('subset', None))
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to remove duplicates: {str(e)}")
 
 @app.post("/handle-missing")
 async def handle_missing_values(request: MissingValuesRequest):
     try:
-        df = dict_to_dataframe(request.data)
-        original_missing = df.isnull().sum().sum()
-        
-        if request.method == 'drop':
-            df_cleaned = df.dropna()
-        elif request.method == 'fill':
-            if request.fill_value is not None:
-                df_cleaned = df.fillna(request.fill_value)
-            else:
-                df_cleaned = df.fillna(df.mean(numeric_only=True))
-        else:
-            df_cleaned = df
-        
-        missing_handled = original_missing - df_cleaned.isnull().sum().sum()
-        
-        return {
-            "success": True,
-            "data": dataframe_to_dict(df_cleaned),
-            "missing_handled": missing_handled,
-            "shape": df_cleaned.shape
-        }
+        df = resolve_dataframe(request)
+        return await run_frame_operation(analyses.handle_missing_values, df, request.method, request.fill_value)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to handle missing values: {str(e)}")
 
@@ -234,280 +821,110 @@ async def handle_missing_values(request: MissingValuesRequest):
 @app.post("/descriptive-stats")
 async def descriptive_statistics(request: AnalysisRequest):
     try:
-        df = dict_to_dataframe(request.data)
-        
-        if request.columns:
-            numeric_df = df[request.columns].select_dtypes(include=[np.number])
-        else:
-            numeric_df = df.select_dtypes(include=[np.number])
-        
-        if numeric_df.empty:
-            raise HTTPException(status_code=400, detail="No numeric columns found")
-        
-        stats_dict = {
-            "count": numeric_df.count().to_dict(),
-            "mean": numeric_df.mean().to_dict(),
-            "std": numeric_df.std().to_dict(),
-            "min": numeric_df.min().to_dict(),
-            "max": numeric_df.max().to_dict(),
-            "percentiles": {
-                "25%": numeric_df.quantile(0.25).to_dict(),
-                "50%": numeric_df.quantile(0.5).to_dict(),
-                "75%": numeric_df.quantile(0.75).to_dict()
-            },
-            "skewness": numeric_df.skew().to_dict(),
-            "kurtosis": numeric_df.kurtosis().to_dict()
-        }
-        
-        return {
-            "success": True,
-            "statistics": stats_dict
-        }
+        # File-backed mode: scan the file in chunks with mergeable sketches
+        file_path = request.options.get('file_path')
+        if file_path:
+            key = cache_key(
+                analyses.file_descriptive_statistics.__name__, file_fingerprint(file_path),
+                request.options, request.columns
+            )
+            return await result_cache.get_or_compute(key, lambda: run_analysis(
+                analyses.file_descriptive_statistics, file_path, request.options, request.columns
+            ))
+
+        # Incremental mode: running statistics of a stored dataset, refreshed with its appended rows
+        if analyses.incremental_requested(request.options):
+            return await run_incremental(
+                request, analyses.incremental_descriptive_statistics, request.columns, request.options
+            )
+        
+        df = resolve_dataframe(request)
+        return await run_cached_analysis(analyses.descriptive_statistics, df, request.columns, pool=THREAD_POOL)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to calculate descriptive statistics: {str(e)}")
 
 @app.post("/correlation-analysis")
 async def correlation_analysis(request: AnalysisRequest):
     try:
-        df = dict_to_dataframe(request.data)
-        
-        if request.columns:
-            numeric_df = df[request.columns].select_dtypes(include=[np.number])
-        else:
-            numeric_df = df.select_dtypes(include=[np.number])
-        
-        if numeric_df.empty:
-            raise HTTPException(status_code=400, detail="No numeric columns found")
-        
-        method = request.options.get('method', 'pearson')
-        correlation_matrix = numeric_df.corr(method=method)
-        
-        # Calculate p-values for Pearson correlation
-        p_values = None
-        if method == 'pearson':
-            n = len(numeric_df)
-            p_values = {}
-            for i, col1 in enumerate(correlation_matrix.columns):
-                p_values[col1] = {}
-                for j, col2 in enumerate(correlation_matrix.columns):
-                    if i <= j:
-                        corr_coef = correlation_matrix.loc[col1, col2]
-                        if not np.isnan(corr_coef):
-                            # Calculate p-value
-                            t_stat = corr_coef * np.sqrt((n - 2) / (1 - corr_coef**2))
-                            p_val = 2 * (1 - stats.t.cdf(abs(t_stat), n - 2))
-                            p_values[col1][col2] = p_val
-                        else:
-                            p_values[col1][col2] = np.nan
-                    else:
-                        p_values[col1][col2] = p_values[col2][col1]
-        
-        return {
-            "success": True,
-            "correlation_matrix": correlation_matrix.to_dict(),
-            "p_values": p_values,
-            "method": method
-        }
+        if analyses.incremental_requested(request.options):
+            return await run_incremental(
+                request, analyses.incremental_correlation_analysis, request.columns, request.options
+            )
+        df = resolve_dataframe(request)
+        return await run_cached_analysis(analyses.correlation_analysis, df, request.columns, request.options)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to perform correlation analysis: {str(e)}")
 
 @app.post("/linear-regression")
 async def linear_regression(request: RegressionRequest):
     try:
-        df = dict_to_dataframe(request.data)
-        
-        # Prepare target variable
-        y = df[request.target_column]
-        
-        # Prepare feature variables
-        if request.feature_columns:
-            X = df[request.feature_columns].select_dtypes(include=[np.number])
-        else:
-            X = df.select_dtypes(include=[np.number]).drop(columns=[request.target_column])
-        
-        if X.empty:
-            raise HTTPException(status_code=400, detail="No numeric feature columns found")
-        
-        # Add constant for intercept
-        X_with_const = sm.add_constant(X)
-        
-        # Fit the model
-        model = sm.OLS(y, X_with_const).fit()
-        
-        # Get predictions
-        predictions = model.predict(X_with_const)
-        residuals = y - predictions
-        
-        # Prepare results
-        coefficients = model.params.to_dict()
-        p_values = model.pvalues.to_dict()
-        confidence_intervals = model.conf_int().to_dict()
-        
-        return {
-            "success": True,
-            "coefficients": coefficients,
-            "intercept": coefficients.get('const', 0),
-            "r_squared": model.rsquared,
-            "adjusted_r_squared": model.rsquared_adj,
-            "p_values": p_values,
-            "confidence_intervals": confidence_intervals,
-            "predictions": predictions.tolist(),
-            "residuals": residuals.tolist()
-        }
+        targets = request.target_columns or request.target_column
+        if not targets:
+            raise HTTPException(status_code=400, detail="target_column or target_columns is required")
+
+        # File-backed mode: accumulate the cross products over chunks of the file
+        file_path = request.options.get('file_path')
+        if file_path:
+            key = cache_key(
+                analyses.file_linear_regression.__name__, file_fingerprint(file_path),
+                request.options, targets, request.feature_columns
+            )
+            return await result_cache.get_or_compute(key, lambda: run_analysis(
+                analyses.file_linear_regression, file_path, request.options, targets, request.feature_columns
+            ))
+
+        if analyses.incremental_requested(request.options):
+            return await run_incremental(
+                request, analyses.incremental_linear_regression, targets, request.feature_columns, request.options
+            )
+
+        df = resolve_dataframe(request)
+        return await run_cached_analysis(
+            analyses.linear_regression, df, targets, request.feature_columns, request.options
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to perform linear regression: {str(e)}")
 
 @app.post("/clustering")
 async def clustering_analysis(request: ClusteringRequest):
     try:
-        df = dict_to_dataframe(request.data)
-        
-        if request.columns:
-            data = df[request.columns].select_dtypes(include=[np.number])
-        else:
-            data = df.select_dtypes(include=[np.number])
-        
-        if data.empty:
-            raise HTTPException(status_code=400, detail="No numeric columns found")
-        
-        # Standardize the data
-        scaler = StandardScaler()
-        data_scaled = scaler.fit_transform(data)
-        
-        # Perform clustering
-        if request.algorithm == 'kmeans':
-            clusterer = KMeans(n_clusters=request.n_clusters, random_state=42)
-        elif request.algorithm == 'dbscan':
-            clusterer = DBSCAN()
-        else:
-            raise HTTPException(status_code=400, detail=f"Unsupported clustering algorithm: {request.algorithm}")
-        
-        labels = clusterer.fit_predict(data_scaled)
-        
-        # Calculate metrics
-        if request.algorithm == 'kmeans':
-            centers = scaler.inverse_transform(clusterer.cluster_centers_)
-            inertia = clusterer.inertia_
-        else:
-            centers = None
-            inertia = None
-        
-        silhouette = silhouette_score(data_scaled, labels) if len(set(labels)) > 1 else 0
-        
-        return {
-            "success": True,
-            "labels": labels.tolist(),
-            "centers": centers.tolist() if centers is not None else None,
-            "inertia": inertia,
-            "silhouette_score": silhouette,
-            "algorithm": request.algorithm,
-            "n_clusters": request.n_clusters
-        }
+        df = resolve_dataframe(request)
+        return await run_cached_analysis(
+            analyses.clustering_analysis, df, request.n_clusters, request.algorithm, request.columns,
+            request.options
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to perform clustering: {str(e)}")
 
 @app.post("/hypothesis-testing")
 async def hypothesis_testing(request: HypothesisTestRequest):
     try:
-        df = dict_to_dataframe(request.data)
-        
-        if len(request.columns) < 1:
-            raise HTTPException(status_code=400, detail="At least one column required")
-        
-        # Select numeric columns
-        data = df[request.columns].select_dtypes(include=[np.number])
-        
-        if data.empty:
-            raise HTTPException(status_code=400, detail="No numeric columns found")
-        
-        results = {}
-        
-        if request.test_type == 'normality':
-            # Shapiro-Wilk test for normality
-            for col in data.columns:
-                statistic, p_value = stats.shapiro(data[col].dropna())
-                results[col] = {
-                    "statistic": statistic,
-                    "p_value": p_value,
-                    "conclusion": "Normal" if p_value > 0.05 else "Not Normal"
-                }
-        
-        elif request.test_type == 'ttest':
-            # One-sample t-test
-            if len(data.columns) == 1:
-                col = data.columns[0]
-                statistic, p_value = stats.ttest_1samp(data[col].dropna(), 
-                                                     request.options.get('popmean', 0))
-                results = {
-                    "statistic": statistic,
-                    "p_value": p_value,
-                    "conclusion": "Significant" if p_value < 0.05 else "Not Significant"
-                }
-            elif len(data.columns) == 2:
-                # Two-sample t-test
-                col1, col2 = data.columns[0], data.columns[1]
-                statistic, p_value = stats.ttest_ind(data[col1].dropna(), data[col2].dropna())
-                results = {
-                    "statistic": statistic,
-                    "p_value": p_value,
-                    "conclusion": "Significant difference" if p_value < 0.05 else "No significant difference"
-                }
-        
-        elif request.test_type == 'mannwhitney':
-            # Mann-Whitney U test
-            if len(data.columns) == 2:
-                col1, col2 = data.columns[0], data.columns[1]
-                statistic, p_value = stats.mannwhitneyu(data[col1].dropna(), data[col2].dropna())
-                results = {
-                    "statistic": statistic,
-                    "p_value": p_value,
-                    "conclusion": "Significant difference" if p_value < 0.05 else "No significant difference"
-                }
-        
-        return {
-            "success": True,
-            "test_results": results
-        }
+        df = resolve_dataframe(request)
+        return await run_cached_analysis(
+            analyses.hypothesis_testing, df, request.test_type, request.columns, request.options
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to perform hypothesis testing: {str(e)}")
 
 @app.post("/anova")
 async def anova_analysis(request: ANOVARequest):
     try:
-        df = dict_to_dataframe(request.data)
-        
-        # Group the data
-        groups = df.groupby(request.group_column)[request.value_column].apply(list).tolist()
-        
-        # Perform one-way ANOVA
-        f_statistic, p_value = stats.f_oneway(*groups)
-        
-        # Calculate degrees of freedom and sum of squares
-        n_total = len(df)
-        n_groups = len(groups)
-        
-        # Between groups
-        grand_mean = df[request.value_column].mean()
-        ss_between = sum(len(group) * (np.mean(group) - grand_mean)**2 for group in groups)
-        df_between = n_groups - 1
-        ms_between = ss_between / df_between
-        
-        # Within groups
-        ss_within = sum(sum((x - np.mean(group))**2 for x in group) for group in groups)
-        df_within = n_total - n_groups
-        ms_within = ss_within / df_within
-        
-        return {
-            "success": True,
-            "f_statistic": f_statistic,
-            "p_value": p_value,
-            "df_between": df_between,
-            "df_within": df_within,
-            "ss_between": ss_between,
-            "ss_within": ss_within,
-            "ms_between": ms_between,
-            "ms_within": ms_within
-        }
+        df = resolve_dataframe(request)
+        return await run_cached_analysis(
+            analyses.anova_analysis, df, request.group_column, request.value_column, request.options
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to perform ANOVA: {str(e)}")
 
@@ -515,155 +932,50 @@ async def anova_analysis(request: ANOVARequest):
 @app.post("/scatter-plot")
 async def create_scatter_plot(request: VisualizationRequest):
     try:
-        df = dict_to_dataframe(request.data)
-        
-        x_col = request.options.get('x_column')
-        y_col = request.options.get('y_column')
-        
-        if not x_col or not y_col:
-            raise HTTPException(status_code=400, detail="x_column and y_column required")
-        
-        fig, ax = plt.subplots(figsize=(10, 6))
-        
-        # Create scatter plot
-        scatter = ax.scatter(df[x_col], df[y_col], alpha=0.6)
-        
-        # Add trend line
-        z = np.polyfit(df[x_col], df[y_col], 1)
-        p = np.poly1d(z)
-        ax.plot(df[x_col], p(df[x_col]), "r--", alpha=0.8)
-        
-        ax.set_xlabel(request.options.get('x_label', x_col))
-        ax.set_ylabel(request.options.get('y_label', y_col))
-        ax.set_title(request.options.get('title', f'{y_col} vs {x_col}'))
-        ax.grid(True, alpha=0.3)
-        
-        return {
-            "success": True,
-            "image_data": create_plot_image(fig)
-        }
+        df = resolve_dataframe(request)
+        return await run_plot(plotting.scatter_plot, df, request.options)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to create scatter plot: {str(e)}")
 
 @app.post("/histogram")
 async def create_histogram(request: VisualizationRequest):
     try:
-        df = dict_to_dataframe(request.data)
-        
-        column = request.options.get('column')
-        if not column:
-            raise HTTPException(status_code=400, detail="column required")
-        
-        fig, ax = plt.subplots(figsize=(10, 6))
-        
-        # Create histogram
-        n, bins, patches = ax.hist(df[column].dropna(), bins=request.options.get('bins', 30), 
-                                  alpha=0.7, edgecolor='black')
-        
-        ax.set_xlabel(request.options.get('x_label', column))
-        ax.set_ylabel('Frequency')
-        ax.set_title(request.options.get('title', f'Distribution of {column}'))
-        ax.grid(True, alpha=0.3)
-        
-        return {
-            "success": True,
-            "image_data": create_plot_image(fig),
-            "bins": bins.tolist(),
-            "frequencies": n.tolist()
-        }
+        df = resolve_dataframe(request)
+        return await run_plot(plotting.histogram, df, request.options)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to create histogram: {str(e)}")
 
 @app.post("/box-plot")
 async def create_box_plot(request: VisualizationRequest):
     try:
-        df = dict_to_dataframe(request.data)
-        
-        columns = request.options.get('columns', df.select_dtypes(include=[np.number]).columns.tolist())
-        
-        fig, ax = plt.subplots(figsize=(10, 6))
-        
-        # Create box plot
-        data_for_box = [df[col].dropna() for col in columns]
-        box_plot = ax.boxplot(data_for_box, labels=columns, patch_artist=True)
-        
-        ax.set_ylabel('Value')
-        ax.set_title(request.options.get('title', 'Box Plot'))
-        ax.grid(True, alpha=0.3)
-        
-        # Calculate statistics
-        statistics = {}
-        for i, col in enumerate(columns):
-            data_col = df[col].dropna()
-            statistics[col] = {
-                'mean': data_col.mean(),
-                'median': data_col.median(),
-                'q1': data_col.quantile(0.25),
-                'q3': data_col.quantile(0.75),
-                'min': data_col.min(),
-                'max': data_col.max()
-            }
-        
-        return {
-            "success": True,
-            "image_data": create_plot_image(fig),
-            "statistics": statistics
-        }
+        df = resolve_dataframe(request)
+        return await run_plot(plotting.box_plot, df, request.options)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to create box plot: {str(e)}")
 
 @app.post("/heatmap")
 async def create_heatmap(request: VisualizationRequest):
     try:
-        df = dict_to_dataframe(request.data)
-        
-        columns = request.options.get('columns', df.select_dtypes(include=[np.number]).columns.tolist())
-        correlation_matrix = df[columns].corr()
-        
-        fig, ax = plt.subplots(figsize=(12, 10))
-        
-        # Create heatmap
-        sns.heatmap(correlation_matrix, annot=True, cmap='coolwarm', center=0,
-                   square=True, ax=ax, cbar_kws={'shrink': 0.8})
-        
-        ax.set_title(request.options.get('title', 'Correlation Heatmap'))
-        
-        return {
-            "success": True,
-            "image_data": create_plot_image(fig),
-            "correlation_matrix": correlation_matrix.to_dict()
-        }
+        df = resolve_dataframe(request)
+        return await run_plot(plotting.heatmap, df, request.options)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to create heatmap: {str(e)}")
 
 @app.post("/line-chart")
 async def create_line_chart(request: VisualizationRequest):
     try:
-        df = dict_to_dataframe(request.data)
-        
-        x_col = request.options.get('x_column')
-        y_col = request.options.get('y_column')
-        
-        if not x_col or not y_col:
-            raise HTTPException(status_code=400, detail="x_column and y_column required")
-        
-        fig, ax = plt.subplots(figsize=(10, 6))
-        
-        # Sort by x column for proper line plotting
-        df_sorted = df.sort_values(x_col)
-        
-        # Create line plot
-        ax.plot(df_sorted[x_col], df_sorted[y_col], marker='o', linewidth=2, markersize=4)
-        
-        ax.set_xlabel(request.options.get('x_label', x_col))
-        ax.set_ylabel(request.options.get('y_label', y_col))
-        ax.set_title(request.options.get('title', f'{y_col} over {x_col}'))
-        ax.grid(True, alpha=0.3)
-        
-        return {
-            "success": True,
-            "image_data": create_plot_image(fig)
-        }
+        df = resolve_dataframe(request)
+        return await run_plot(plotting.line_chart, df, request.options)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to create line chart: {str(e)}")
 
@@ -671,55 +983,45 @@ async def create_line_chart(request: VisualizationRequest):
 @app.post("/export-csv")
 async def export_csv(request: ExportRequest):
     try:
-        df = dict_to_dataframe(request.data)
-        
-        # Create directory if it doesn't exist
-        os.makedirs(os.path.dirname(request.file_path), exist_ok=True)
-        
-        # Export to CSV
-        df.to_csv(
-            request.file_path,
-            index=request.options.get('index', False),
-            header=request.options.get('header', True),
-            sep=request.options.get('delimiter', ',')
-        )
-        
-        file_size = os.path.getsize(request.file_path)
-        
-        return {
-            "success": True,
-            "file_path": request.file_path,
-            "size": file_size
-        }
+        df = resolve_dataframe(request)
+        return await run_analysis(analyses.export_csv, df, request.file_path, request.options, pool=THREAD_POOL)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to export CSV: {str(e)}")
 
 @app.post("/export-excel")
 async def export_excel(request: ExportRequest):
     try:
-        df = dict_to_dataframe(request.data)
-        
-        # Create directory if it doesn't exist
-        os.makedirs(os.path.dirname(request.file_path), exist_ok=True)
-        
-        # Export to Excel
-        df.to_excel(
-            request.file_path,
-            index=request.options.get('index', False),
-            header=request.options.get('header', True),
-            sheet_name=request.options.get('sheet_name', 'Sheet1')
-        )
-        
-        file_size = os.path.getsize(request.file_path)
-        
-        return {
-            "success": True,
-            "file_path": request.file_path,
-            "size": file_size
-        }
+        df = resolve_dataframe(request)
+        return await run_analysis(analyses.export_excel, df, request.file_path, request.options, pool=THREAD_POOL)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to export Excel: {str(e)}")
 
+@app.post("/export")
+async def export_download(request: DownloadRequest):
+    try:
+        df = resolve_dataframe(request)
+        return download_response(df, request.format, request.options, request.dataset_id or "export")
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to export dataset: {str(e)}")
+
+@app.get("/datasets/{dataset_id}/export")
+async def export_dataset(dataset_id: str, format: str = 'csv', compression: Optional[str] = None,
+                         chunk_size: int = DEFAULT_CHUNK_SIZE):
+    try:
+        df = dataset_store.get(dataset_id)
+    except DatasetNotFoundError:
+        raise HTTPException(status_code=404, detail=f"Dataset not found: {dataset_id}")
+    options = {"compression": compression, "chunk_size": chunk_size}
+    return download_response(df, format, options, dataset_id)
+
+startup_monitor.imported()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8001)
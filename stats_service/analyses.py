@@ -0,0 +1,748 @@
+"""
+Analysis computations for the Advanced Statistical Analysis Service.
+
+Each function takes a DataFrame and plain parameters and returns the payload
+of its endpoint, so it can run in a worker process as well as in the request
+thread. Invalid input is reported with AnalysisInputError, which endpoints
+map to a 400 response. Plots are rendered by plotting.py.
+
+The statistics, regression and clustering subsystems (scipy, statsmodels,
+scikit-learn) are imported inside the functions that use them, so importing
+this module is cheap and each library is loaded on first use.
+"""
+from typing import Any, Dict, List, Optional, Tuple, Union
+import os
+
+import pandas as pd
+import numpy as np
+
+from chunked_io import DEFAULT_CHUNK_SIZE, iter_file_chunks
+from incremental import DatasetTrackers, RunningSummary, Tracker, Window
+from sketches import summarize_file
+
+CLUSTERING_ALGORITHMS = ('kmeans', 'dbscan', 'hdbscan')
+REGRESSION_METHODS = ('auto', 'ols', 'streaming')
+DEFAULT_STREAMING_THRESHOLD = 100000
+
+
+class AnalysisInputError(ValueError):
+    """Raised when a request cannot be analyzed as given (reported as 400)"""
+
+
+def numeric_frame(df: pd.DataFrame, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """Select the numeric columns of df, optionally restricted to columns"""
+    if columns:
+        numeric_df = df[columns].select_dtypes(include=[np.number])
+    else:
+        numeric_df = df.select_dtypes(include=[np.number])
+
+    if numeric_df.empty:
+        raise AnalysisInputError("No numeric columns found")
+    return numeric_df
+
+
+# Preprocessing
+def data_info(df: pd.DataFrame) -> Dict[str, Any]:
+    return {
+        "success": True,
+        "shape": df.shape,
+        "columns": df.columns.tolist(),
+        "dtypes": df.dtypes.astype(str).to_dict(),
+        "missing_values": df.isnull().sum().to_dict(),
+        "memory_usage": df.memory_usage(deep=True).sum(),
+        "summary": {
+            "numeric_columns": df.select_dtypes(include=[np.number]).columns.tolist(),
+            "categorical_columns": df.select_dtypes(include=['object']).columns.tolist(),
+            "datetime_columns": df.select_dtypes(include=['datetime64']).columns.tolist()
+        }
+    }
+
+
+def select_columns(df: pd.DataFrame, columns: List[str]) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+    selected_df = df[columns]
+
+    return selected_df, {
+        "success": True,
+        "shape": selected_df.shape
+    }
+
+
+def remove_duplicates(df: pd.DataFrame, subset: Optional[List[str]] = None) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+    original_shape = df.shape
+    df_cleaned = df.drop_duplicates(subset=subset)
+    duplicates_removed = original_shape[0] - df_cleaned.shape[0]
+
+    return df_cleaned, {
+        "success": True,
+        "duplicates_removed": duplicates_removed,
+        "shape": df_cleaned.shape
+    }
+
+
+def handle_missing_values(df: pd.DataFrame, method: str = 'drop',
+                          fill_value: Optional[Union[str, float, int]] = None) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+    original_missing = df.isnull().sum().sum()
+
+    if method == 'drop':
+        df_cleaned = df.dropna()
+    elif method == 'fill':
+        if fill_value is not None:
+            df_cleaned = df.fillna(fill_value)
+        else:
+            df_cleaned = df.fillna(df.mean(numeric_only=True))
+    else:
+        df_cleaned = df
+
+    missing_handled = original_missing - df_cleaned.isnull().sum().sum()
+
+    return df_cleaned, {
+        "success": True,
+        "missing_handled": missing_handled,
+        "shape": df_cleaned.shape
+    }
+
+
+# Statistical Analysis
+def descriptive_statistics(df: pd.DataFrame, columns: Optional[List[str]] = None) -> Dict[str, Any]:
+    numeric_df = numeric_frame(df, columns)
+
+    stats_dict = {
+        "count": numeric_df.count().to_dict(),
+        "mean": numeric_df.mean().to_dict(),
+        "std": numeric_df.std().to_dict(),
+        "min": numeric_df.min().to_dict(),
+        "max": numeric_df.max().to_dict(),
+        "percentiles": {
+            "25%": numeric_df.quantile(0.25).to_dict(),
+            "50%": numeric_df.quantile(0.5).to_dict(),
+            "75%": numeric_df.quantile(0.75).to_dict()
+        },
+        "skewness": numeric_df.skew().to_dict(),
+        "kurtosis": numeric_df.kurtosis().to_dict()
+    }
+
+    return {
+        "success": True,
+        "statistics": stats_dict
+    }
+
+
+def file_descriptive_statistics(file_path: str, options: Dict[str, Any],
+                                columns: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Scan a CSV/Parquet file in chunks with mergeable sketches"""
+    summary = summarize_file(file_path, options, columns=columns)
+    if not summary.columns:
+        raise AnalysisInputError("No numeric columns found")
+    return {
+        "success": True,
+        "statistics": summary.statistics(),
+        "approximation": summary.approximation()
+    }
+
+
+def correlation_analysis(df: pd.DataFrame, columns: Optional[List[str]], options: Dict[str, Any]) -> Dict[str, Any]:
+    from correlation import SUPPORTED_METHODS as CORRELATION_METHODS, correlation_matrix, strongest_pairs
+
+    numeric_df = numeric_frame(df, columns)
+
+    method = options.get('method', 'pearson')
+    if method not in CORRELATION_METHODS:
+        raise AnalysisInputError(f"Unsupported correlation method: {method}")
+
+    columns = numeric_df.columns.tolist()
+    r, p, n = correlation_matrix(
+        numeric_df.to_numpy(dtype=float, na_value=np.nan),
+        method=method,
+        dtype=np.float32 if options.get('dtype') == 'float32' else np.float64,
+        block_size=int(options.get('block_size', 512)),
+        max_workers=int(options.get('max_workers', 1))
+    )
+
+    # Sparse mode: only the strongest pairs instead of the dense p x p matrices
+    top_k = options.get('top_k')
+    threshold = options.get('threshold')
+    if top_k is not None or threshold is not None:
+        return {
+            "success": True,
+            "pairs": strongest_pairs(
+                columns, r, p, n,
+                top_k=int(top_k) if top_k is not None else None,
+                threshold=float(threshold) if threshold is not None else None
+            ),
+            "method": method
+        }
+
+    return {
+        "success": True,
+        "correlation_matrix": pd.DataFrame(r, index=columns, columns=columns).to_dict(),
+        "p_values": pd.DataFrame(p, index=columns, columns=columns).to_dict(),
+        "method": method
+    }
+
+
+def _regression_targets(target_column: Union[str, List[str], None]) -> List[str]:
+    targets = [target_column] if isinstance(target_column, str) else list(target_column or [])
+    if not targets:
+        raise AnalysisInputError("At least one target column is required")
+    return targets
+
+
+def _regression_outputs(method: str, options: Dict[str, Any]) -> str:
+    from regression import OUTPUT_MODES as REGRESSION_OUTPUTS
+
+    outputs = options.get('outputs', 'full' if method == 'ols' else 'summary')
+    if outputs not in REGRESSION_OUTPUTS:
+        raise AnalysisInputError(f"Unsupported regression outputs: {outputs}")
+    return outputs
+
+
+def _streaming_regression(chunks, features: List[str], targets: List[str], outputs: str,
+                          options: Dict[str, Any], total_rows: Optional[int] = None) -> Dict[str, Any]:
+    """Run streaming_least_squares; a single target's result is flattened, several stay keyed by name"""
+    from regression import streaming_least_squares
+
+    try:
+        result = streaming_least_squares(chunks, features, targets, outputs, options, total_rows=total_rows)
+    except ValueError as e:
+        raise AnalysisInputError(str(e)) from e
+    response = {
+        "success": True,
+        "method": "streaming",
+        "n_observations": result["n_observations"],
+        "rows_skipped": result["rows_skipped"]
+    }
+    if len(targets) == 1:
+        return {**response, **result["targets"][targets[0]]}
+    return {**response, "targets": result["targets"]}
+
+
+def linear_regression(df: pd.DataFrame, target_column: Union[str, List[str]],
+                      feature_columns: Optional[List[str]] = None,
+                      options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    options = options or {}
+    targets = _regression_targets(target_column)
+    missing = [column for column in targets if column not in df.columns]
+    if missing:
+        raise AnalysisInputError(f"Target columns not found: {missing}")
+
+    # Prepare feature variables
+    if feature_columns:
+        X = df[feature_columns].select_dtypes(include=[np.number])
+    else:
+        X = df.select_dtypes(include=[np.number]).drop(columns=targets)
+
+    if X.empty:
+        raise AnalysisInputError("No numeric feature columns found")
+
+    method = options.get('method', 'auto')
+    if method not in REGRESSION_METHODS:
+        raise AnalysisInputError(f"Unsupported regression method: {method}")
+    if method == 'auto':
+        threshold = int(options.get('streaming_threshold', DEFAULT_STREAMING_THRESHOLD))
+        method = 'ols' if len(targets) == 1 and len(df) <= threshold else 'streaming'
+    outputs = _regression_outputs(method, options)
+
+    # Sufficient statistics accumulated over row chunks, one solve for all targets
+    if method == 'streaming':
+        features = X.columns.tolist()
+        frame = df[features + targets]
+        chunk_size = int(options.get('chunk_size', DEFAULT_CHUNK_SIZE))
+        return _streaming_regression(
+            lambda: (frame.iloc[start:start + chunk_size] for start in range(0, len(frame), chunk_size)),
+            features, targets, outputs, options, total_rows=len(frame)
+        )
+
+    if len(targets) > 1:
+        raise AnalysisInputError("Method 'ols' fits one target column; use 'streaming' for several")
+
+    # Prepare target variable
+    y = df[targets[0]]
+
+    import statsmodels.api as sm
+
+    # Add constant for intercept
+    X_with_const = sm.add_constant(X)
+
+    # Fit the model on complete rows, as the streaming method does
+    model = sm.OLS(y, X_with_const, missing='drop').fit()
+
+    # Get predictions
+    predictions = model.predict(X_with_const)
+    residuals = y - predictions
+
+    # Prepare results
+    coefficients = model.params.to_dict()
+    p_values = model.pvalues.to_dict()
+    confidence_intervals = model.conf_int().to_dict()
+
+    result = {
+        "success": True,
+        "method": "ols",
+        "n_observations": int(model.nobs),
+        "rows_skipped": int(len(df) - model.nobs),
+        "coefficients": coefficients,
+        "intercept": coefficients.get('const', 0),
+        "r_squared": model.rsquared,
+        "adjusted_r_squared": model.rsquared_adj,
+        "p_values": p_values,
+        "standard_errors": model.bse.to_dict(),
+        "confidence_intervals": confidence_intervals
+    }
+    if outputs == 'full':
+        result["predictions"] = predictions.tolist()
+        result["residuals"] = residuals.tolist()
+        return result
+
+    from regression import PredictionOutputs
+
+    collector = PredictionOutputs(outputs, 1, options)
+    complete = residuals.notna().to_numpy()
+    collector.update(
+        np.flatnonzero(complete),
+        predictions.to_numpy(dtype=float)[complete, None],
+        residuals.to_numpy(dtype=float)[complete, None]
+    )
+    return {**result, **collector.target_outputs(0)}
+
+
+def file_linear_regression(file_path: str, options: Dict[str, Any], target_column: Union[str, List[str]],
+                           feature_columns: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Fit a CSV/Parquet file chunk by chunk without loading it"""
+    targets = _regression_targets(target_column)
+    chunk_size = int(options.get('chunk_size', DEFAULT_CHUNK_SIZE))
+    if not feature_columns:
+        first_chunk = next(iter(iter_file_chunks(file_path, options, chunk_size=1000)), None)
+        if first_chunk is None:
+            raise AnalysisInputError("File contains no rows")
+        feature_columns = [
+            column for column in first_chunk.select_dtypes(include=[np.number]).columns if column not in targets
+        ]
+    if not feature_columns:
+        raise AnalysisInputError("No numeric feature columns found")
+
+    columns = list(feature_columns) + targets
+    return _streaming_regression(
+        lambda: iter_file_chunks(file_path, options, chunk_size=chunk_size, columns=columns),
+        list(feature_columns), targets, _regression_outputs('streaming', options), options
+    )
+
+
+# Incremental statistics of appended datasets
+def incremental_requested(options: Dict[str, Any]) -> bool:
+    """Whether options ask for a dataset's incremental statistics instead of a pass over its rows"""
+    return bool(options.get('incremental')) or options.get('window') is not None
+
+
+def _incremental_summary(trackers: DatasetTrackers, columns: List[Any],
+                         options: Dict[str, Any]) -> Tuple[Tracker, RunningSummary]:
+    try:
+        tracker = trackers.tracker(columns, Window.from_spec(options.get('window')))
+        return tracker, tracker.summary()
+    except ValueError as e:
+        raise AnalysisInputError(str(e)) from e
+
+
+def _tracked_columns(trackers: DatasetTrackers, columns: Optional[List[Any]] = None) -> List[Any]:
+    try:
+        return trackers.numeric_columns(columns)
+    except ValueError as e:
+        raise AnalysisInputError(str(e)) from e
+
+
+def incremental_descriptive_statistics(trackers: DatasetTrackers, columns: Optional[List[str]],
+                                       options: Dict[str, Any]) -> Dict[str, Any]:
+    """Descriptive statistics of a dataset or window from its running moments and quantile sketches"""
+    tracker, summary = _incremental_summary(trackers, _tracked_columns(trackers, columns), options)
+    return {
+        "success": True,
+        "statistics": summary.values.statistics(),
+        "approximation": summary.values.approximation(),
+        "incremental": tracker.describe(summary)
+    }
+
+
+def incremental_correlation_analysis(trackers: DatasetTrackers, columns: Optional[List[str]],
+                                     options: Dict[str, Any]) -> Dict[str, Any]:
+    """Pearson correlations of a dataset or window from its running co-moment matrix.
+
+    Rows with a missing value in any of the columns are skipped, as in a
+    streaming regression, rather than handled pairwise.
+    """
+    from correlation import correlation_pvalues, strongest_pairs
+
+    method = options.get('method', 'pearson')
+    if method != 'pearson':
+        raise AnalysisInputError(f"Incremental correlation supports the pearson method only, not {method}")
+    columns = _tracked_columns(trackers, columns)
+    tracker, summary = _incremental_summary(trackers, columns, options)
+    cross_products = summary.cross_products
+    scale = np.sqrt(np.diag(cross_products.comoment))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        r = np.clip(cross_products.comoment / np.outer(scale, scale), -1.0, 1.0)
+    n = np.full_like(r, cross_products.count)
+    p = correlation_pvalues(r, n)
+    diagonal = np.arange(len(columns))
+    r[diagonal, diagonal] = 1.0 if cross_products.count > 1 else np.nan
+    p[diagonal, diagonal] = 0.0 if cross_products.count > 1 else np.nan
+
+    response = {"success": True, "method": method, "n_observations": int(cross_products.count)}
+    top_k = options.get('top_k')
+    threshold = options.get('threshold')
+    if top_k is not None or threshold is not None:
+        response["pairs"] = strongest_pairs(
+            columns, r, p, n,
+            top_k=int(top_k) if top_k is not None else None,
+            threshold=float(threshold) if threshold is not None else None
+        )
+    else:
+        response["correlation_matrix"] = pd.DataFrame(r, index=columns, columns=columns).to_dict()
+        response["p_values"] = pd.DataFrame(p, index=columns, columns=columns).to_dict()
+    response["incremental"] = tracker.describe(summary)
+    return response
+
+
+def incremental_linear_regression(trackers: DatasetTrackers, target_column: Union[str, List[str]],
+                                  feature_columns: Optional[List[str]], options: Dict[str, Any]) -> Dict[str, Any]:
+    """Least squares fit of a dataset or window from the running cross products of its features and targets"""
+    from regression import LeastSquaresFit
+
+    targets = _regression_targets(target_column)
+    if options.get('outputs', 'none') != 'none':
+        raise AnalysisInputError("Incremental regression returns no predictions or residuals; omit outputs")
+    numeric = _tracked_columns(trackers)
+    missing = [column for column in targets if column not in numeric]
+    if missing:
+        raise AnalysisInputError(f"Target columns not found or not numeric: {missing}")
+    features = [column for column in _tracked_columns(trackers, feature_columns) if column not in targets]
+    if not features:
+        raise AnalysisInputError("No numeric feature columns found")
+
+    # One tracker per set of columns, so rows are complete in exactly the model's columns
+    tracked = set(features) | set(targets)
+    tracker, summary = _incremental_summary(trackers, [column for column in numeric if column in tracked], options)
+    positions = [tracker.columns.index(column) for column in features + targets]
+    cross_products = summary.cross_products.select(positions)
+    if cross_products.count <= len(features):
+        raise AnalysisInputError(
+            f"Not enough complete rows ({cross_products.count}) for {len(features)} features"
+        )
+    fit = LeastSquaresFit(cross_products, len(features))
+    response = {
+        "success": True,
+        "method": "incremental",
+        "n_observations": int(fit.count),
+        "rows_skipped": int(summary.rows - fit.count),
+        "incremental": tracker.describe(summary)
+    }
+    results = {target: fit.target_result(index, features) for index, target in enumerate(targets)}
+    if len(targets) == 1:
+        return {**response, **results[targets[0]]}
+    return {**response, "targets": results}
+
+
+def _k_candidates(options: Dict[str, Any]) -> Optional[List[int]]:
+    """Cluster counts to sweep, from options.k_values or an inclusive options.k_range"""
+    if options.get('k_values') is not None:
+        k_values = sorted({int(k) for k in options['k_values']})
+    elif options.get('k_range') is not None:
+        if len(options['k_range']) != 2:
+            raise AnalysisInputError("k_range must be [min_k, max_k]")
+        k_values = list(range(int(options['k_range'][0]), int(options['k_range'][1]) + 1))
+    else:
+        return None
+    if not k_values or k_values[0] < 2:
+        raise AnalysisInputError("Candidate cluster counts must be at least 2")
+    return k_values
+
+
+def clustering_analysis(df: pd.DataFrame, n_clusters: int = 3, algorithm: str = 'kmeans',
+                        columns: Optional[List[str]] = None,
+                        options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    from sklearn.preprocessing import StandardScaler
+    from clustering import (
+        DEFAULT_RANDOM_STATE, DEFAULT_SILHOUETTE_SAMPLE, NEIGHBOR_ALGORITHMS,
+        assign_labels, fit_centroids, fit_density, k_sweep, sampled_silhouette
+    )
+
+    options = options or {}
+    if algorithm not in CLUSTERING_ALGORITHMS:
+        raise AnalysisInputError(f"Unsupported clustering algorithm: {algorithm}")
+    if options.get('neighbor_algorithm', 'auto') not in NEIGHBOR_ALGORITHMS:
+        raise AnalysisInputError(f"Unsupported neighbor_algorithm: {options['neighbor_algorithm']}")
+    k_values = _k_candidates(options)
+    if k_values is not None and algorithm != 'kmeans':
+        raise AnalysisInputError("k_range sweeps require the kmeans algorithm")
+
+    data = numeric_frame(df, columns)
+    random_state = int(options.get('random_state', DEFAULT_RANDOM_STATE))
+    sample_size = int(options.get('silhouette_sample_size', DEFAULT_SILHOUETTE_SAMPLE))
+
+    # Standardize the data
+    scaler = StandardScaler()
+    data_scaled = scaler.fit_transform(data)
+
+    result = {"success": True}
+
+    # Perform clustering
+    if k_values is not None:
+        # Fit every candidate, keep the one with the best silhouette
+        sweep = k_sweep(data_scaled, k_values, options, max_workers=int(options.get('max_workers', 1)))
+        best = max(sweep, key=lambda point: point["silhouette"])
+        n_clusters = best["k"]
+        labels = assign_labels(data_scaled, best["centers"])
+        centers = scaler.inverse_transform(best["centers"])
+        inertia = best["inertia"]
+        result["k_sweep"] = [{key: point[key] for key in ("k", "inertia", "silhouette")} for point in sweep]
+        result["best_k"] = n_clusters
+        result["estimator"] = best["estimator"]
+    elif algorithm == 'kmeans':
+        clusterer = fit_centroids(data_scaled, n_clusters, options)
+        labels = clusterer.labels_
+        centers = scaler.inverse_transform(clusterer.cluster_centers_)
+        inertia = clusterer.inertia_
+        result["estimator"] = type(clusterer).__name__
+    else:
+        labels = fit_density(data_scaled, algorithm, options)
+        centers = None
+        inertia = None
+        result["estimator"] = algorithm.upper()
+        result["n_clusters_found"] = int(len(set(labels) - {-1}))
+        result["noise_points"] = int((labels == -1).sum())
+
+    # Calculate metrics on a sample; the full silhouette is O(n^2)
+    silhouette, silhouette_rows = sampled_silhouette(data_scaled, labels, sample_size, random_state)
+
+    result.update({
+        "labels": labels.tolist(),
+        "centers": centers.tolist() if centers is not None else None,
+        "inertia": inertia,
+        "silhouette_score": silhouette,
+        "silhouette_sample_size": silhouette_rows,
+        "algorithm": algorithm,
+        "n_clusters": n_clusters
+    })
+    return result
+
+
+def batch_hypothesis_testing(df: pd.DataFrame, test_type: str, columns: List[str],
+                             options: Dict[str, Any]) -> Dict[str, Any]:
+    """Test every value column between the two groups of options.group_column"""
+    from hypothesis import CORRECTIONS, DEFAULT_BLOCK_SIZE, TWO_GROUP_TESTS, adjust_p_values, two_group_tests
+
+    group_column = options['group_column']
+    if test_type not in TWO_GROUP_TESTS:
+        raise AnalysisInputError(f"Batch mode supports {', '.join(TWO_GROUP_TESTS)}, not: {test_type}")
+    correction = options.get('correction', 'bh')
+    if correction not in CORRECTIONS:
+        raise AnalysisInputError(f"Unsupported multiple-testing correction: {correction}")
+    if group_column not in df.columns:
+        raise AnalysisInputError(f"Group column not found: {group_column}")
+
+    groups = options.get('groups')
+    if groups is None:
+        groups = sorted(df[group_column].dropna().unique().tolist())
+    if len(groups) != 2:
+        raise AnalysisInputError(f"Batch mode compares exactly two groups, found: {groups}")
+    data = numeric_frame(df, columns or None)
+    data = data.drop(columns=[group_column], errors='ignore')
+    if data.empty:
+        raise AnalysisInputError("No numeric columns found")
+
+    keys = df[group_column]
+    results = two_group_tests(
+        data.to_numpy(dtype=float, na_value=np.nan),
+        (keys == groups[0]).to_numpy(), (keys == groups[1]).to_numpy(),
+        test=test_type,
+        block_size=int(options.get('block_size', DEFAULT_BLOCK_SIZE)),
+        max_workers=int(options.get('max_workers', 1))
+    )
+    alpha = float(options.get('alpha', 0.05))
+    adjusted = adjust_p_values(results["p_value"], correction)
+    significant = adjusted < alpha
+
+    test_results = {
+        col: {
+            "statistic": float(results["statistic"][i]),
+            "p_value": float(results["p_value"][i]),
+            "p_adjusted": float(adjusted[i]),
+            "mean_1": float(results["mean_1"][i]),
+            "mean_2": float(results["mean_2"][i]),
+            "n_1": int(results["n_1"][i]),
+            "n_2": int(results["n_2"][i]),
+            "conclusion": "Significant difference" if significant[i] else "No significant difference"
+        }
+        for i, col in enumerate(data.columns)
+    }
+    return {
+        "success": True,
+        "groups": groups,
+        "correction": correction,
+        "n_tests": len(test_results),
+        "n_significant": int(significant.sum()),
+        "test_results": test_results
+    }
+
+
+def hypothesis_testing(df: pd.DataFrame, test_type: str, columns: List[str],
+                       options: Dict[str, Any]) -> Dict[str, Any]:
+    from scipy import stats
+    from hypothesis import normality_test
+
+    # Batch mode: every column compared between two groups of rows
+    if options.get('group_column'):
+        return batch_hypothesis_testing(df, test_type, columns, options)
+
+    if len(columns) < 1:
+        raise AnalysisInputError("At least one column required")
+
+    # Select numeric columns
+    data = numeric_frame(df, columns)
+
+    results = {}
+
+    if test_type == 'normality':
+        # Shapiro-Wilk test for normality, D'Agostino-Pearson beyond Shapiro's sample size limit
+        for col in data.columns:
+            test, statistic, p_value = normality_test(data[col].dropna())
+            results[col] = {
+                "test": test,
+                "statistic": statistic,
+                "p_value": p_value,
+                "conclusion": "Normal" if p_value > 0.05 else "Not Normal"
+            }
+
+    elif test_type in ('ttest', 'welch'):
+        # One-sample t-test
+        if len(data.columns) == 1:
+            col = data.columns[0]
+            statistic, p_value = stats.ttest_1samp(data[col].dropna(),
+                                                 options.get('popmean', 0))
+            results = {
+                "statistic": statistic,
+                "p_value": p_value,
+                "conclusion": "Significant" if p_value < 0.05 else "Not Significant"
+            }
+        elif len(data.columns) == 2:
+            # Two-sample t-test, Welch's when variances may differ
+            col1, col2 = data.columns[0], data.columns[1]
+            statistic, p_value = stats.ttest_ind(data[col1].dropna(), data[col2].dropna(),
+                                                 equal_var=test_type == 'ttest')
+            results = {
+                "statistic": statistic,
+                "p_value": p_value,
+                "conclusion": "Significant difference" if p_value < 0.05 else "No significant difference"
+            }
+
+    elif test_type == 'mannwhitney':
+        # Mann-Whitney U test
+        if len(data.columns) == 2:
+            col1, col2 = data.columns[0], data.columns[1]
+            statistic, p_value = stats.mannwhitneyu(data[col1].dropna(), data[col2].dropna())
+            results = {
+                "statistic": statistic,
+                "p_value": p_value,
+                "conclusion": "Significant difference" if p_value < 0.05 else "No significant difference"
+            }
+
+    return {
+        "success": True,
+        "test_results": results
+    }
+
+
+def anova_analysis(df: pd.DataFrame, group_column: str, value_column: str,
+                   options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    from anova import DEFAULT_MAX_PAIRS, factorial_anova, group_aggregates, one_way_anova, tukey_hsd, welch_anova
+
+    options = options or {}
+    factors = [group_column] + list(options.get('factors') or [])
+    missing = [column for column in factors + [value_column] if column not in df.columns]
+    if missing:
+        raise AnalysisInputError(f"Columns not found: {missing}")
+    if not pd.api.types.is_numeric_dtype(df[value_column]):
+        raise AnalysisInputError(f"Value column must be numeric: {value_column}")
+    post_hoc = options.get('post_hoc')
+    if post_hoc not in (None, 'tukey'):
+        raise AnalysisInputError(f"Unsupported post-hoc test: {post_hoc}")
+
+    # Factorial design: Type II table over the factor cells
+    if len(factors) > 1:
+        if post_hoc or options.get('welch'):
+            raise AnalysisInputError("welch and post_hoc apply to one-way designs")
+        try:
+            table = factorial_anova(df, factors, value_column, interactions=options.get('interactions', True))
+        except ValueError as e:
+            raise AnalysisInputError(str(e)) from e
+        return {
+            "success": True,
+            "design": "factorial",
+            "factors": factors,
+            "anova_table": table
+        }
+
+    # Group count, mean and sum of squares; everything below works on these
+    aggregates = group_aggregates(df, factors, value_column)
+    if len(aggregates) < 2:
+        raise AnalysisInputError("ANOVA needs at least two groups")
+
+    result = {"success": True, **one_way_anova(aggregates)}
+    if options.get('welch'):
+        try:
+            result["welch"] = welch_anova(aggregates)
+        except ValueError as e:
+            raise AnalysisInputError(str(e)) from e
+    if post_hoc == 'tukey':
+        max_pairs = options.get('max_pairs', DEFAULT_MAX_PAIRS)
+        result["tukey_hsd"] = tukey_hsd(
+            aggregates, result["ms_within"], result["df_within"],
+            alpha=float(options.get('alpha', 0.05)),
+            max_pairs=int(max_pairs) if max_pairs is not None else None
+        )
+    return result
+
+
+# Export
+def export_csv(df: pd.DataFrame, file_path: str, options: Dict[str, Any]) -> Dict[str, Any]:
+    # Create directory if it doesn't exist
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+
+    # Export to CSV
+    df.to_csv(
+        file_path,
+        index=options.get('index', False),
+        header=options.get('header', True),
+        sep=options.get('delimiter', ',')
+    )
+
+    file_size = os.path.getsize(file_path)
+
+    return {
+        "success": True,
+        "file_path": file_path,
+        "size": file_size
+    }
+
+
+def export_excel(df: pd.DataFrame, file_path: str, options: Dict[str, Any]) -> Dict[str, Any]:
+    # Create directory if it doesn't exist
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+
+    # Export to Excel, streaming rows through a write-only workbook
+    from excel_io import write_excel
+
+    write_excel(
+        df,
+        file_path,
+        sheet_name=options.get('sheet_name', 'Sheet1'),
+        index=options.get('index', False),
+        header=options.get('header', True),
+        chunk_size=int(options.get('chunk_size', DEFAULT_CHUNK_SIZE))
+    )
+
+    file_size = os.path.getsize(file_path)
+
+    return {
+        "success": True,
+        "file_path": file_path,
+        "size": file_size
+    }
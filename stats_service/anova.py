@@ -0,0 +1,246 @@
+"""
+Analysis of variance from per-group aggregates.
+
+The data is reduced once, with vectorized groupby aggregations, to each
+group's (or factor cell's) count, mean and within-group sum of squares.
+One-way, Welch and factorial ANOVA and Tukey's HSD are all computed from
+those aggregates, so beyond the groupby their cost depends on the number
+of groups rather than the number of rows.
+"""
+from itertools import combinations
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy import linalg, stats
+from scipy.interpolate import PchipInterpolator
+
+# Studentized range tail probabilities are interpolated from this many evaluations
+TUKEY_GRID_POINTS = 32
+DEFAULT_MAX_PAIRS = 1000
+# Largest factorial design matrix (cells x columns) solved densely
+MAX_DESIGN_SIZE = 20_000_000
+
+
+def group_aggregates(df: pd.DataFrame, group_columns: Sequence[str], value_column: str) -> pd.DataFrame:
+    """Count, mean and sum of squared deviations ('ss') of value_column per group.
+
+    Missing values and missing group keys are dropped. Groups are sorted by
+    key; with several group columns the index is a MultiIndex of cells.
+    """
+    values = pd.to_numeric(df[value_column], errors='raise').astype(float)
+    keys = [df[column] for column in group_columns]
+    aggregates = values.groupby(keys if len(keys) > 1 else keys[0], observed=True, sort=True).agg(
+        ['count', 'mean', 'var']
+    )
+    aggregates = aggregates[aggregates['count'] > 0]
+    aggregates['ss'] = aggregates['var'].fillna(0.0) * (aggregates['count'] - 1)
+    return aggregates[['count', 'mean', 'ss']]
+
+
+def one_way_anova(aggregates: pd.DataFrame) -> Dict[str, Any]:
+    """Classic one-way ANOVA table of the groups in aggregates"""
+    n = aggregates['count'].to_numpy(dtype=float)
+    means = aggregates['mean'].to_numpy()
+    n_total = n.sum()
+    grand_mean = np.dot(n, means) / n_total
+
+    ss_between = float(np.dot(n, (means - grand_mean) ** 2))
+    ss_within = float(aggregates['ss'].sum())
+    df_between = len(n) - 1
+    df_within = int(n_total) - len(n)
+    ms_between = ss_between / df_between
+    ms_within = ss_within / df_within if df_within > 0 else float('nan')
+    with np.errstate(divide='ignore', invalid='ignore'):
+        f_statistic = np.float64(ms_between) / ms_within
+    return {
+        "f_statistic": float(f_statistic),
+        "p_value": float(stats.f.sf(f_statistic, df_between, df_within)),
+        "df_between": df_between,
+        "df_within": df_within,
+        "ss_between": ss_between,
+        "ss_within": ss_within,
+        "ms_between": ms_between,
+        "ms_within": ms_within,
+        "n_groups": len(n),
+        "n_observations": int(n_total)
+    }
+
+
+def welch_anova(aggregates: pd.DataFrame) -> Dict[str, Any]:
+    """Welch's ANOVA, which does not assume equal group variances.
+
+    Every group needs at least two observations and a nonzero variance.
+    """
+    n = aggregates['count'].to_numpy(dtype=float)
+    if (n < 2).any():
+        raise ValueError("Welch's ANOVA needs at least two observations per group")
+    variances = aggregates['ss'].to_numpy() / (n - 1)
+    if (variances <= 0).any():
+        raise ValueError("Welch's ANOVA needs a nonzero variance in every group")
+    means = aggregates['mean'].to_numpy()
+    k = len(n)
+
+    weights = n / variances
+    total_weight = weights.sum()
+    weighted_mean = np.dot(weights, means) / total_weight
+    spread = np.dot(weights, (means - weighted_mean) ** 2) / (k - 1)
+    tail = np.sum((1 - weights / total_weight) ** 2 / (n - 1))
+    f_statistic = spread / (1 + 2 * (k - 2) * tail / (k ** 2 - 1))
+    df_within = (k ** 2 - 1) / (3 * tail)
+    return {
+        "f_statistic": float(f_statistic),
+        "p_value": float(stats.f.sf(f_statistic, k - 1, df_within)),
+        "df_between": k - 1,
+        "df_within": float(df_within)
+    }
+
+
+def _studentized_range_sf(q: np.ndarray, k: int, df: float) -> np.ndarray:
+    """Upper tail of the studentized range at many q, interpolated from a small grid.
+
+    scipy evaluates each point by numerical integration, so the tail is
+    evaluated on TUKEY_GRID_POINTS values and interpolated monotonically in
+    log space.
+    """
+    if q.size <= TUKEY_GRID_POINTS:
+        return stats.studentized_range.sf(q, k, df)
+    grid = np.linspace(q.min(), q.max(), TUKEY_GRID_POINTS)
+    log_sf = np.log(np.maximum(stats.studentized_range.sf(grid, k, df), 1e-300))
+    return np.minimum(np.exp(PchipInterpolator(grid, log_sf)(q)), 1.0)
+
+
+def tukey_hsd(aggregates: pd.DataFrame, ms_within: float, df_within: int, alpha: float = 0.05,
+              max_pairs: Optional[int] = DEFAULT_MAX_PAIRS) -> Dict[str, Any]:
+    """Tukey-Kramer pairwise comparisons of every pair of groups.
+
+    All pairs are tested; the max_pairs pairs with the largest studentized
+    differences are listed, most significant first.
+    """
+    n = aggregates['count'].to_numpy(dtype=float)
+    means = aggregates['mean'].to_numpy()
+    labels = aggregates.index.tolist()
+    k = len(n)
+
+    first, second = np.triu_indices(k, 1)
+    difference = means[second] - means[first]
+    standard_error = np.sqrt(ms_within / 2 * (1 / n[first] + 1 / n[second]))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        q = np.abs(difference) / standard_error
+    q_critical = float(stats.studentized_range.ppf(1 - alpha, k, df_within))
+    reject = q > q_critical
+
+    if max_pairs is not None and max_pairs < len(q):
+        order = np.argpartition(-q, max_pairs)[:max_pairs]
+        order = order[np.argsort(-q[order], kind='stable')]
+    else:
+        order = np.argsort(-q, kind='stable')
+    p_values = _studentized_range_sf(q[order], k, df_within)
+    margin = q_critical * standard_error[order]
+    pairs = [
+        {
+            "group_a": labels[first[index]],
+            "group_b": labels[second[index]],
+            "mean_difference": float(difference[index]),
+            "lower": float(difference[index] - margin[position]),
+            "upper": float(difference[index] + margin[position]),
+            "q_statistic": float(q[index]),
+            "p_value": float(p_values[position]),
+            "reject": bool(reject[index])
+        }
+        for position, index in enumerate(order)
+    ]
+    return {
+        "alpha": alpha,
+        "q_critical": q_critical,
+        "n_pairs": int(len(q)),
+        "n_significant": int(reject.sum()),
+        "truncated": len(pairs) < len(q),
+        "pairs": pairs
+    }
+
+
+def _term_design(codes: List[np.ndarray], levels: List[int], term: Tuple[int, ...]) -> np.ndarray:
+    """Treatment-coded columns of a term over the cells: products of the factors' dummies"""
+    design = np.ones((len(codes[0]), 1))
+    for factor in term:
+        dummies = np.zeros((len(codes[factor]), levels[factor] - 1))
+        rows = np.flatnonzero(codes[factor] > 0)
+        dummies[rows, codes[factor][rows] - 1] = 1.0
+        design = (design[:, :, None] * dummies[:, None, :]).reshape(len(design), -1)
+    return design
+
+
+def factorial_anova(df: pd.DataFrame, factors: Sequence[str], value_column: str,
+                    interactions: bool = True) -> Dict[str, Dict[str, Any]]:
+    """Type II ANOVA table of a (possibly unbalanced) factorial design.
+
+    The model is fitted to the cell means weighted by cell counts, which
+    gives the same between-cell sums of squares as fitting every row; the
+    pooled within-cell sum of squares is added to the residual.
+    """
+    cells = group_aggregates(df, factors, value_column)
+    index = cells.index if isinstance(cells.index, pd.MultiIndex) else pd.MultiIndex.from_arrays([cells.index])
+    codes, levels = [], []
+    for position in range(len(factors)):
+        factor_codes, uniques = pd.factorize(index.get_level_values(position), sort=True)
+        codes.append(factor_codes)
+        levels.append(len(uniques))
+
+    n = cells['count'].to_numpy(dtype=float)
+    weights = np.sqrt(n)
+    weighted_means = cells['mean'].to_numpy() * weights
+    sizes = range(1, len(factors) + 1) if interactions else [1]
+    terms = [term for size in sizes for term in combinations(range(len(factors)), size)]
+    designs = {term: _term_design(codes, levels, term) for term in terms}
+    columns = 1 + sum(design.shape[1] for design in designs.values())
+    if len(n) * columns > MAX_DESIGN_SIZE:
+        raise ValueError(f"Factorial design too large: {len(n)} cells x {columns} columns")
+
+    fits: Dict[frozenset, Tuple[float, int]] = {}
+    if interactions:
+        # The full factorial model reproduces every cell mean exactly
+        fits[frozenset(terms)] = (0.0, len(n))
+
+    def fit(model: List[Tuple[int, ...]]) -> Tuple[float, int]:
+        """Weighted residual sum of squares and rank of a model over the cells"""
+        key = frozenset(model)
+        if key not in fits:
+            design = np.hstack([np.ones((len(n), 1))] + [designs[term] for term in model]) * weights[:, None]
+            coefficients, _, rank, _ = linalg.lstsq(design, weighted_means, lapack_driver='gelsy')
+            residual = weighted_means - design @ coefficients
+            fits[key] = (float(residual @ residual), int(rank))
+        return fits[key]
+
+    ss_within = float(cells['ss'].sum())
+    n_total = int(n.sum())
+    full_rss, full_rank = fit(terms)
+    residual_ss = full_rss + ss_within
+    residual_df = n_total - full_rank
+    residual_ms = residual_ss / residual_df if residual_df > 0 else float('nan')
+
+    table = {}
+    for term in terms:
+        # Type II: the term adjusted for every term that does not contain it
+        base = [other for other in terms if not set(term) <= set(other)]
+        base_rss, base_rank = fit(base)
+        term_rss, term_rank = fit(base + [term])
+        term_df = term_rank - base_rank
+        sum_sq = max(base_rss - term_rss, 0.0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            f_statistic = np.float64(sum_sq / term_df) / residual_ms if term_df > 0 else np.nan
+        table[":".join(factors[factor] for factor in term)] = {
+            "df": term_df,
+            "sum_sq": sum_sq,
+            "mean_sq": sum_sq / term_df if term_df > 0 else float('nan'),
+            "f_statistic": float(f_statistic),
+            "p_value": float(stats.f.sf(f_statistic, term_df, residual_df)) if term_df > 0 else float('nan')
+        }
+    table["Residual"] = {
+        "df": residual_df,
+        "sum_sq": residual_ss,
+        "mean_sq": residual_ms,
+        "f_statistic": None,
+        "p_value": None
+    }
+    return table
@@ -0,0 +1,714 @@
+#!/usr/bin/env python3
+"""
+Benchmarks of every endpoint of the advanced service.
+
+    python benchmark.py                                     # 1k rows, in-process
+    python benchmark.py --sizes 1k,100k --transport both --output results.json
+    python benchmark.py --save-baseline benchmark-baseline.json
+    python benchmark.py --baseline benchmark-baseline.json --threshold 0.25
+
+Each case sends one request built from a synthetic dataset (see
+synthetic_data.py), either in-process, straight to the ASGI app, or over
+HTTP to a uvicorn server started on a free localhost port; nothing leaves the
+machine. A case runs --warmup times untimed and then --repeat times, and
+records its latency (min, median, p95), throughput in rows per second, and
+the peak resident memory of the service's processes (server and pool
+workers) above what they held before the case.
+
+The result and source caches are disabled so every request computes.
+Comparing against a baseline fails (exit status 1) when a case's median
+latency or peak memory grew by more than --threshold.
+"""
+import argparse
+import asyncio
+import http.client
+import json
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import urlsplit
+
+import numpy as np
+import orjson
+import pandas as pd
+
+import synthetic_data
+
+SERVICE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+TRANSPORTS = ('in-process', 'http')
+DEFAULT_REPEAT = 5
+DEFAULT_THRESHOLD = 0.25
+# Cells (rows x columns) above which a dataset is skipped unless --max-cells allows it
+DEFAULT_MAX_CELLS = 20_000_000
+# Workbooks take minutes to write and read beyond this many cells
+EXCEL_MAX_CELLS = 1_000_000
+# Regressions smaller than these are treated as noise
+LATENCY_NOISE_MS = 2.0
+MEMORY_NOISE_BYTES = 16 * 1024 * 1024
+MEMORY_POLL_INTERVAL = 0.01
+SERVER_START_TIMEOUT = 120.0
+
+# Caches would turn repeated runs into lookups
+SERVICE_ENVIRONMENT = {
+    "STATS_CACHE_MEMORY_MB": "0",
+    "STATS_CACHE_DIR": "",
+    "STATS_SOURCE_CACHE_MB": "0",
+}
+PROFILE_TOKEN = os.environ.get("STATS_PROFILE_TOKEN") or "benchmark"
+
+
+class Call:
+    """One request: method, path (with query), body, headers and the statuses that count as success"""
+
+    def __init__(self, method: str, path: str, body: bytes = b"", headers: Optional[Dict[str, str]] = None,
+                 expect: Sequence[int] = (200,)):
+        self.method = method
+        self.path = path
+        self.body = body
+        self.headers = headers or {}
+        self.expect = tuple(expect)
+
+
+def get(path: str, **kwargs) -> Call:
+    return Call("GET", path, **kwargs)
+
+
+def post(path: str, payload: Dict[str, Any], headers: Optional[Dict[str, str]] = None, **kwargs) -> Call:
+    return Call("POST", path, orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY),
+                {"Content-Type": "application/json", **(headers or {})}, **kwargs)
+
+
+def delete(path: str, **kwargs) -> Call:
+    return Call("DELETE", path, **kwargs)
+
+
+def multipart(fields: Dict[str, str], file_field: str, filename: str, content: bytes) -> Tuple[bytes, str]:
+    boundary = "stats-benchmark-boundary"
+    parts = [
+        f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+        for name, value in fields.items()
+    ]
+    parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{file_field}"; filename="{filename}"\r\n'
+                 f'Content-Type: application/octet-stream\r\n\r\n'.encode() + content + b"\r\n")
+    parts.append(f"--{boundary}--\r\n".encode())
+    return b"".join(parts), f"multipart/form-data; boundary={boundary}"
+
+
+# Clients
+
+class InProcessClient:
+    """Calls the ASGI app directly, on an event loop running in a background thread"""
+
+    name = 'in-process'
+
+    def __init__(self):
+        os.environ.update(SERVICE_ENVIRONMENT)
+        os.environ.setdefault("STATS_PROFILE_TOKEN", PROFILE_TOKEN)
+        import advanced_main
+
+        self.app = advanced_main.app
+        self.pid = os.getpid()
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, name="benchmark-loop", daemon=True).start()
+        self._lifespan = self.app.router.lifespan_context(self.app)
+        self._run(self._lifespan.__aenter__())
+
+    def _run(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    def request(self, call: Call) -> Tuple[int, bytes]:
+        return self._run(self._request(call))
+
+    async def _request(self, call: Call) -> Tuple[int, bytes]:
+        url = urlsplit(call.path)
+        headers = [(name.lower().encode(), value.encode("latin-1")) for name, value in call.headers.items()]
+        headers.append((b"content-length", str(len(call.body)).encode()))
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": call.method,
+            "scheme": "http", "path": url.path, "raw_path": url.path.encode(), "query_string": url.query.encode(),
+            "root_path": "", "headers": headers, "client": ("127.0.0.1", 0), "server": ("127.0.0.1", 80),
+        }
+        finished = asyncio.Event()
+        pending = [{"type": "http.request", "body": call.body, "more_body": False}]
+        response = {"status": 500, "body": []}
+
+        async def receive():
+            if pending:
+                return pending.pop()
+            await finished.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+            elif message["type"] == "http.response.body":
+                response["body"].append(message.get("body", b""))
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            finished.set()
+        return response["status"], b"".join(response["body"])
+
+    def close(self):
+        self._run(self._lifespan.__aexit__(None, None, None))
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+class HttpClient:
+    """Starts the service with uvicorn on a free localhost port and calls it over HTTP"""
+
+    name = 'http'
+
+    def __init__(self):
+        with socket.socket() as probe:
+            probe.bind(("127.0.0.1", 0))
+            self.port = probe.getsockname()[1]
+        environment = {**os.environ, **SERVICE_ENVIRONMENT}
+        environment.setdefault("STATS_PROFILE_TOKEN", PROFILE_TOKEN)
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "advanced_main:app", "--host", "127.0.0.1",
+             "--port", str(self.port), "--log-level", "warning"],
+            cwd=SERVICE_DIR, env=environment
+        )
+        self.pid = self.process.pid
+        self._connection: Optional[http.client.HTTPConnection] = None
+        deadline = time.monotonic() + SERVER_START_TIMEOUT
+        while True:
+            try:
+                self.request(get("/health"))
+                return
+            except OSError:
+                if self.process.poll() is not None or time.monotonic() > deadline:
+                    self.close()
+                    raise RuntimeError("The service did not start")
+                time.sleep(0.2)
+
+    def request(self, call: Call) -> Tuple[int, bytes]:
+        if self._connection is None:
+            self._connection = http.client.HTTPConnection("127.0.0.1", self.port)
+        try:
+            self._connection.request(call.method, call.path, body=call.body, headers=call.headers)
+            response = self._connection.getresponse()
+            return response.status, response.read()
+        except (OSError, http.client.HTTPException):
+            self._connection.close()
+            self._connection = None
+            raise
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+
+def wait_for_warm_up(client, timeout: float = SERVER_START_TIMEOUT):
+    """Wait until the service's background warm-up has finished, so it is not measured"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        _, body = client.request(get("/health"))
+        tasks = orjson.loads(body)["startup"]["warm_up"].values()
+        if all(task["state"] in ("done", "failed") for task in tasks):
+            return
+        time.sleep(0.2)
+
+
+# Memory
+
+def _process_tree(pid: int) -> List[int]:
+    pids, pending = [], [pid]
+    while pending:
+        current = pending.pop()
+        pids.append(current)
+        try:
+            for task in os.listdir(f"/proc/{current}/task"):
+                with open(f"/proc/{current}/task/{task}/children") as f:
+                    pending.extend(int(child) for child in f.read().split())
+        except OSError:
+            continue
+    return pids
+
+
+def tree_rss_bytes(pid: int) -> Optional[int]:
+    """Resident memory of a process and its descendants, where /proc is available"""
+    if not os.path.exists(f"/proc/{pid}/statm"):
+        return None
+    total = 0
+    for member in _process_tree(pid):
+        try:
+            with open(f"/proc/{member}/statm") as f:
+                total += int(f.read().split()[1])
+        except (OSError, ValueError, IndexError):
+            continue
+    return total * os.sysconf("SC_PAGE_SIZE")
+
+
+class PeakMemory:
+    """Polls the resident memory of a process tree and keeps the highest value above the starting one"""
+
+    def __init__(self, pid: int):
+        self.pid = pid
+        self.baseline = tree_rss_bytes(pid)
+        self.peak = self.baseline
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._poll, name="benchmark-memory", daemon=True)
+
+    def __enter__(self):
+        if self.baseline is not None:
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def _poll(self):
+        while not self._stop.wait(MEMORY_POLL_INTERVAL):
+            self.peak = max(self.peak, tree_rss_bytes(self.pid) or 0)
+
+    @property
+    def growth(self) -> Optional[int]:
+        return None if self.baseline is None else self.peak - self.baseline
+
+
+# Datasets
+
+class DatasetContext:
+    """A synthetic dataset registered with the service, with its files and bodies built on demand"""
+
+    def __init__(self, client, shape: str, size: str, layout: str, directory: str):
+        self.client = client
+        self.shape, self.size, self.layout = shape, size, layout
+        self.name = synthetic_data.dataset_name(shape, size, layout)
+        self.df = synthetic_data.generate(shape, synthetic_data.SIZES[size], layout)
+        self.rows = len(self.df)
+        self.features = synthetic_data.feature_columns(layout)
+        self.directory = directory
+        self.csv_path = os.path.join(directory, f"{self.name}.csv")
+        self.df.to_csv(self.csv_path, index=False)
+        self._xlsx_path: Optional[str] = None
+        self._json: Optional[Dict[str, Any]] = None
+        self._arrow: Optional[bytes] = None
+        self.dataset_id = self.load(self.csv_path)
+
+    def load(self, file_path: str) -> str:
+        status, body = self.client.request(post("/load-csv", {"file_path": file_path,
+                                                              "options": {"include_data": False}}))
+        if status != 200:
+            raise RuntimeError(f"Could not register {self.name}: {status} {body[:200]!r}")
+        return orjson.loads(body)["dataset_id"]
+
+    @property
+    def xlsx_path(self) -> str:
+        if self._xlsx_path is None:
+            import excel_io
+
+            self._xlsx_path = os.path.join(self.directory, f"{self.name}.xlsx")
+            excel_io.write_excel(self.df, self._xlsx_path)
+        return self._xlsx_path
+
+    @property
+    def json_data(self) -> Dict[str, Any]:
+        if self._json is None:
+            self._json = synthetic_data.columnar_json(self.df)
+        return self._json
+
+    @property
+    def arrow_body(self) -> bytes:
+        if self._arrow is None:
+            import pyarrow as pa
+
+            table = pa.Table.from_pandas(self.df, preserve_index=False)
+            sink = pa.BufferOutputStream()
+            with pa.ipc.new_stream(sink, table.schema) as writer:
+                writer.write_table(table)
+            self._arrow = sink.getvalue().to_pybytes()
+        return self._arrow
+
+    def body(self, **params) -> Dict[str, Any]:
+        """Request body referencing the registered dataset"""
+        return {"dataset_id": self.dataset_id, **params}
+
+    def plot_columns(self) -> List[str]:
+        return self.features[:8]
+
+    def close(self):
+        self.client.request(delete(f"/datasets/{self.dataset_id}", expect=(200, 404)))
+
+
+def _delete_loaded(ctx: DatasetContext, body: bytes):
+    """Drop the dataset a load case registered, so it does not evict the benchmark's own"""
+    dataset_id = orjson.loads(body).get("dataset_id")
+    if dataset_id:
+        ctx.client.request(delete(f"/datasets/{dataset_id}", expect=(200, 404)))
+
+
+def _wait_for_job(ctx: DatasetContext, body: bytes) -> str:
+    job_id = orjson.loads(body)["job_id"]
+    while True:
+        status, result = ctx.client.request(get(f"/jobs/{job_id}"))
+        if orjson.loads(result)["status"] not in ("queued", "running"):
+            return job_id
+        time.sleep(0.01)
+
+
+def _submitted_job(ctx: DatasetContext) -> str:
+    _, body = ctx.client.request(post("/jobs", {"endpoint": "/descriptive-stats", "request": ctx.body()}))
+    return _wait_for_job(ctx, body)
+
+
+def _profile_id(ctx: DatasetContext) -> str:
+    ctx.client.request(post("/data-info", ctx.body(), headers=_profile_headers("cpu")))
+    return _latest_profile(ctx)
+
+
+def _latest_profile(ctx: DatasetContext) -> str:
+    _, body = ctx.client.request(get("/profiles", headers=_profile_headers()))
+    return orjson.loads(body)["profiles"][0]["profile_id"]
+
+
+def _profile_headers(mode: Optional[str] = None) -> Dict[str, str]:
+    headers = {"X-Stats-Profile-Token": os.environ.get("STATS_PROFILE_TOKEN") or PROFILE_TOKEN}
+    if mode:
+        headers["X-Stats-Profile"] = mode
+    return headers
+
+
+def _upload(ctx: DatasetContext) -> Call:
+    with open(ctx.csv_path, "rb") as f:
+        body, content_type = multipart({"include_data": "false"}, "file", os.path.basename(ctx.csv_path), f.read())
+    return Call("POST", "/datasets/upload", body, {"Content-Type": content_type})
+
+
+def _registered(ctx: DatasetContext) -> Call:
+    return delete(f"/datasets/{ctx.load(ctx.csv_path)}")
+
+
+class Case:
+    """A benchmarked request: build(ctx) returns the Call, after(ctx, body) cleans up untimed.
+
+    Dataset cases run on every selected dataset of their shapes; service
+    cases run once, on the first dataset.
+    """
+
+    def __init__(self, name: str, build: Callable[[DatasetContext], Call],
+                 shapes: Sequence[str] = synthetic_data.SHAPES, per_dataset: bool = True,
+                 max_cells: Optional[int] = None, after: Optional[Callable[[DatasetContext, bytes], Any]] = None):
+        self.name = name
+        self.build = build
+        self.shapes = tuple(shapes)
+        self.per_dataset = per_dataset
+        self.max_cells = max_cells
+        self.after = after
+
+    def applies(self, ctx: DatasetContext) -> bool:
+        return ctx.shape in self.shapes and (self.max_cells is None or ctx.df.size <= self.max_cells)
+
+
+# Shapes without missing values, for analyses that reject them
+COMPLETE_SHAPES = ('numeric', 'categorical', 'grouped')
+
+CASES: List[Case] = [
+    # Service
+    Case("health", lambda ctx: get("/health"), per_dataset=False),
+    Case("metrics", lambda ctx: get("/metrics"), per_dataset=False),
+    Case("cache.stats", lambda ctx: get("/cache"), per_dataset=False),
+    Case("cache.clear", lambda ctx: delete("/cache"), per_dataset=False),
+    Case("datasets.list", lambda ctx: get("/datasets"), per_dataset=False),
+    Case("datasets.info", lambda ctx: get(f"/datasets/{ctx.dataset_id}"), per_dataset=False),
+    Case("datasets.delete", _registered, per_dataset=False),
+    Case("jobs.submit", lambda ctx: post("/jobs", {"endpoint": "/descriptive-stats", "request": ctx.body()},
+                                         expect=(202,)), per_dataset=False, after=_wait_for_job),
+    Case("jobs.list", lambda ctx: get("/jobs"), per_dataset=False),
+    Case("jobs.get", lambda ctx: get(f"/jobs/{_submitted_job(ctx)}"), per_dataset=False),
+    Case("jobs.result", lambda ctx: get(f"/jobs/{_submitted_job(ctx)}/result"), per_dataset=False),
+    Case("jobs.cancel", lambda ctx: delete(f"/jobs/{_submitted_job(ctx)}"), per_dataset=False),
+    Case("profiles.list", lambda ctx: get("/profiles", headers=_profile_headers()), per_dataset=False),
+    Case("profiles.get", lambda ctx: get(f"/profiles/{_profile_id(ctx)}", headers=_profile_headers()),
+         per_dataset=False),
+    Case("profiles.pstats", lambda ctx: get(f"/profiles/{_profile_id(ctx)}/pstats", headers=_profile_headers()),
+         per_dataset=False),
+    Case("profiles.sampled", lambda ctx: get("/profiles/sampled?format=json", headers=_profile_headers(),
+                                             expect=(200, 404)), per_dataset=False),
+    Case("profiles.sampled.reset", lambda ctx: delete("/profiles/sampled", headers=_profile_headers()),
+         per_dataset=False),
+    Case("profiles.clear", lambda ctx: delete("/profiles", headers=_profile_headers()), per_dataset=False),
+
+    # Loading and ingestion
+    Case("load-csv", lambda ctx: post("/load-csv", {"file_path": ctx.csv_path, "options": {"include_data": False}}),
+         after=_delete_loaded),
+    Case("load-excel", lambda ctx: post("/load-excel", {"file_path": ctx.xlsx_path,
+                                                        "options": {"include_data": False}}),
+         max_cells=EXCEL_MAX_CELLS, after=_delete_loaded),
+    Case("datasets.upload", _upload, after=_delete_loaded),
+    Case("data-info.json", lambda ctx: post("/data-info", {"data": ctx.json_data})),
+    Case("data-info.arrow", lambda ctx: Call("POST", "/data-info", ctx.arrow_body, {
+        "Content-Type": "application/vnd.apache.arrow.stream", "X-Stats-Params": "{}"})),
+
+    # Preprocessing
+    Case("data-info", lambda ctx: post("/data-info", ctx.body())),
+    Case("select-columns", lambda ctx: post("/select-columns", ctx.body(columns=["t", "x0", "y"]))),
+    Case("remove-duplicates", lambda ctx: post("/remove-duplicates", ctx.body())),
+    Case("handle-missing", lambda ctx: post("/handle-missing", ctx.body(method="mean")), shapes=('missing',)),
+    Case("pipeline", lambda ctx: post("/pipeline", ctx.body(steps=[
+        {"id": "subset", "op": "select-columns", "params": {"columns": ["x0", "x1", "y"]}},
+        {"id": "stats", "op": "descriptive-stats", "input": "subset"},
+    ]))),
+
+    # Analyses
+    Case("descriptive-stats", lambda ctx: post("/descriptive-stats", ctx.body())),
+    Case("descriptive-stats.profiled", lambda ctx: post("/descriptive-stats", ctx.body(),
+                                                        headers=_profile_headers("cpu")), shapes=('numeric',)),
+    Case("correlation-analysis", lambda ctx: post("/correlation-analysis", ctx.body(columns=ctx.features + ["y"]))),
+    Case("linear-regression", lambda ctx: post("/linear-regression", ctx.body(
+        target_column="y", feature_columns=ctx.features)), shapes=COMPLETE_SHAPES),
+    Case("clustering", lambda ctx: post("/clustering", ctx.body(n_clusters=4, columns=ctx.features)),
+         shapes=COMPLETE_SHAPES),
+    Case("hypothesis-testing", lambda ctx: post("/hypothesis-testing", ctx.body(
+        test_type="welch", columns=["x0", "x1"]))),
+    Case("hypothesis-testing.groups", lambda ctx: post("/hypothesis-testing", ctx.body(
+        test_type="welch", columns=ctx.features, options={"group_column": "group", "groups": ["g0", "g1"]})),
+         shapes=('grouped',)),
+    Case("anova", lambda ctx: post("/anova", ctx.body(group_column="group", value_column="y")), shapes=('grouped',)),
+
+    # Plots
+    Case("scatter-plot", lambda ctx: post("/scatter-plot", ctx.body(options={"x_column": "x0", "y_column": "y"})),
+         shapes=COMPLETE_SHAPES),
+    Case("histogram", lambda ctx: post("/histogram", ctx.body(options={"column": "y"}))),
+    Case("box-plot", lambda ctx: post("/box-plot", ctx.body(options={"columns": ctx.plot_columns()}))),
+    Case("heatmap", lambda ctx: post("/heatmap", ctx.body(options={"columns": ctx.plot_columns()}))),
+    Case("line-chart", lambda ctx: post("/line-chart", ctx.body(options={"x_column": "t", "y_column": "y"}))),
+
+    # Export
+    Case("export-csv", lambda ctx: post("/export-csv", ctx.body(
+        file_path=os.path.join(ctx.directory, "export.csv")))),
+    Case("export-excel", lambda ctx: post("/export-excel", ctx.body(
+        file_path=os.path.join(ctx.directory, "export.xlsx"))), max_cells=EXCEL_MAX_CELLS),
+    Case("export.parquet", lambda ctx: post("/export", ctx.body(format="parquet"))),
+    Case("datasets.export.csv-gzip", lambda ctx: get(f"/datasets/{ctx.dataset_id}/export?format=csv&compression=gzip")),
+]
+
+
+# Running
+
+class CaseFailedError(RuntimeError):
+    """Raised when a benchmarked request returns an unexpected status"""
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    return float(np.percentile(values, fraction * 100))
+
+
+def run_case(client, case: Case, ctx: DatasetContext, repeat: int, warmup: int) -> Dict[str, Any]:
+    def once() -> Tuple[float, int]:
+        call = case.build(ctx)
+        started = time.perf_counter()
+        status, body = client.request(call)
+        elapsed = time.perf_counter() - started
+        if status not in call.expect:
+            raise CaseFailedError(f"{call.method} {call.path} returned {status}: {body[:300]!r}")
+        if case.after is not None:
+            case.after(ctx, body)
+        return elapsed, status
+
+    for _ in range(warmup):
+        once()
+    timings = []
+    with PeakMemory(client.pid) as memory:
+        for _ in range(repeat):
+            elapsed, status = once()
+            timings.append(elapsed)
+    median = statistics.median(timings)
+    rows = ctx.rows if case.per_dataset else None
+    return {
+        "case": case.name,
+        "dataset": ctx.name if case.per_dataset else None,
+        "rows": rows,
+        "transport": client.name,
+        "runs": repeat,
+        "status": status,
+        "latency_ms": {
+            "min": min(timings) * 1000,
+            "median": median * 1000,
+            "p95": _percentile(timings, 0.95) * 1000,
+        },
+        "requests_per_second": 1 / median if median else None,
+        "rows_per_second": rows / median if rows and median else None,
+        "peak_memory_bytes": memory.growth,
+    }
+
+
+def result_key(result: Dict[str, Any]) -> str:
+    return ":".join(filter(None, (result["transport"], result["case"], result["dataset"])))
+
+
+def select_datasets(shapes: Sequence[str], sizes: Sequence[str], layouts: Sequence[str],
+                    max_cells: int) -> List[Tuple[str, str, str]]:
+    selected = []
+    for size in sizes:
+        for layout in layouts:
+            # Index, target and up to two extra columns besides the features
+            if synthetic_data.SIZES[size] * (synthetic_data.LAYOUTS[layout] + 4) > max_cells:
+                print(f"skipping {size}/{layout}: more than {max_cells} cells (see --max-cells)", file=sys.stderr)
+                continue
+            selected.extend((shape, size, layout) for shape in shapes)
+    return selected
+
+
+def run_suite(transport: str, datasets: List[Tuple[str, str, str]], cases: List[Case], repeat: int,
+              warmup: int) -> List[Dict[str, Any]]:
+    client = InProcessClient() if transport == 'in-process' else HttpClient()
+    results = []
+    try:
+        wait_for_warm_up(client)
+        with tempfile.TemporaryDirectory(prefix="stats-benchmark-") as directory:
+            for index, (shape, size, layout) in enumerate(datasets):
+                ctx = DatasetContext(client, shape, size, layout, directory)
+                try:
+                    for case in cases:
+                        if not (case.per_dataset or index == 0) or not case.applies(ctx):
+                            continue
+                        try:
+                            result = run_case(client, case, ctx, repeat, warmup)
+                        except CaseFailedError as e:
+                            # Record the failure and carry on with the other cases
+                            result = {"case": case.name, "dataset": ctx.name if case.per_dataset else None,
+                                      "transport": client.name, "error": str(e)}
+                        results.append(result)
+                        print(_format_result(result), file=sys.stderr)
+                finally:
+                    ctx.close()
+    finally:
+        client.close()
+    return results
+
+
+def _format_bytes(value: Optional[int]) -> str:
+    return "-" if value is None else f"{value / 1024 / 1024:.1f} MB"
+
+
+def _format_result(result: Dict[str, Any]) -> str:
+    if "error" in result:
+        return f"{result_key(result):<70} FAILED: {result['error']}"
+    latency = result["latency_ms"]
+    throughput = f"{result['rows_per_second']:,.0f} rows/s" if result["rows_per_second"] else ""
+    return (f"{result_key(result):<70} median {latency['median']:9.1f} ms  p95 {latency['p95']:9.1f} ms  "
+            f"{throughput:>18}  peak +{_format_bytes(result['peak_memory_bytes'])}")
+
+
+def environment() -> Dict[str, Any]:
+    versions = {"python": platform.python_version(), "pandas": pd.__version__, "numpy": np.__version__}
+    for module in ("scipy", "sklearn", "statsmodels", "matplotlib", "pyarrow", "fastapi"):
+        try:
+            versions[module] = __import__(module).__version__
+        except ImportError:
+            versions[module] = None
+    return {"platform": platform.platform(), "cpu_count": os.cpu_count(), "versions": versions}
+
+
+def compare(results: List[Dict[str, Any]], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """Describe every case whose median latency or peak memory regressed beyond threshold"""
+    previous = {result_key(result): result for result in baseline["results"]}
+    regressions = []
+    for result in results:
+        key = result_key(result)
+        before = previous.get(key)
+        if before is None or "error" in result or "error" in before:
+            continue
+        latency, latency_before = result["latency_ms"]["median"], before["latency_ms"]["median"]
+        if latency > latency_before * (1 + threshold) and latency - latency_before > LATENCY_NOISE_MS:
+            regressions.append(f"{key}: median latency {latency_before:.1f} ms -> {latency:.1f} ms "
+                               f"(+{latency / latency_before - 1:.0%})")
+        memory, memory_before = result["peak_memory_bytes"], before.get("peak_memory_bytes")
+        if memory is not None and memory_before is not None \
+                and memory > memory_before * (1 + threshold) and memory - memory_before > MEMORY_NOISE_BYTES:
+            regressions.append(f"{key}: peak memory {_format_bytes(memory_before)} -> {_format_bytes(memory)}")
+    return regressions
+
+
+def _list_argument(value: str, choices: Sequence[str], name: str) -> List[str]:
+    selected = [item.strip() for item in value.split(",") if item.strip()]
+    unknown = [item for item in selected if item not in choices]
+    if unknown:
+        raise argparse.ArgumentTypeError(f"Unknown {name}: {', '.join(unknown)}. Use: {', '.join(choices)}")
+    return selected
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark every endpoint of the advanced service")
+    parser.add_argument("--sizes", default="1k", help=f"comma-separated: {', '.join(synthetic_data.SIZES)}")
+    parser.add_argument("--shapes", default=",".join(synthetic_data.SHAPES),
+                        help=f"comma-separated: {', '.join(synthetic_data.SHAPES)}")
+    parser.add_argument("--layouts", default="narrow", help=f"comma-separated: {', '.join(synthetic_data.LAYOUTS)}")
+    parser.add_argument("--transport", default="in-process", choices=[*TRANSPORTS, "both"])
+    parser.add_argument("--cases", default=None, help="comma-separated case names or name prefixes to run")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="timed runs per case")
+    parser.add_argument("--warmup", type=int, default=1, help="untimed runs per case before timing")
+    parser.add_argument("--max-cells", type=int, default=DEFAULT_MAX_CELLS, help="skip larger datasets")
+    parser.add_argument("--output", help="write the results as JSON")
+    parser.add_argument("--save-baseline", help="write the results as the baseline to compare later runs with")
+    parser.add_argument("--baseline", help="compare with this baseline and fail on regressions")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="allowed relative growth of median latency and peak memory")
+    args = parser.parse_args(argv)
+
+    try:
+        sizes = _list_argument(args.sizes, list(synthetic_data.SIZES), "sizes")
+        shapes = _list_argument(args.shapes, synthetic_data.SHAPES, "shapes")
+        layouts = _list_argument(args.layouts, list(synthetic_data.LAYOUTS), "layouts")
+    except argparse.ArgumentTypeError as e:
+        parser.error(str(e))
+    cases = CASES
+    if args.cases:
+        prefixes = [name.strip() for name in args.cases.split(",") if name.strip()]
+        cases = [case for case in CASES if any(case.name.startswith(prefix) for prefix in prefixes)]
+        if not cases:
+            parser.error(f"No case matches: {args.cases}")
+    datasets = select_datasets(shapes, sizes, layouts, args.max_cells)
+    if not datasets:
+        parser.error("No dataset selected")
+
+    results = []
+    for transport in (TRANSPORTS if args.transport == "both" else [args.transport]):
+        results.extend(run_suite(transport, datasets, cases, max(1, args.repeat), max(0, args.warmup)))
+
+    report = {"created_at": datetime.now().isoformat(), "environment": environment(), "results": results}
+    for path in filter(None, (args.output, args.save_baseline)):
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+
+    failures = [result for result in results if "error" in result]
+    if failures:
+        print(f"{len(failures)} case(s) failed:", file=sys.stderr)
+        for result in failures:
+            print(f"  {result_key(result)}: {result['error']}", file=sys.stderr)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s) beyond {args.threshold:.0%}:", file=sys.stderr)
+            for regression in regressions:
+                print(f"  {regression}", file=sys.stderr)
+            return 1
+        print(f"No regressions beyond {args.threshold:.0%} against {args.baseline}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,262 @@
+"""
+Chunked file reading and streaming encoders for the Advanced Statistical
+Analysis Service.
+
+Large source files are read a bounded number of rows at a time so peak memory
+depends on the chunk size rather than on the file size.
+"""
+import os
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import pandas as pd
+
+from wire_format import ARROW_FILE_MEDIA_TYPE, PARQUET_MEDIA_TYPE, import_pyarrow, stream_compressor
+
+DEFAULT_CHUNK_SIZE = 50000
+
+# Download formats: media type and file extension
+EXPORT_FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "parquet": (PARQUET_MEDIA_TYPE, "parquet"),
+    "feather": (ARROW_FILE_MEDIA_TYPE, "feather"),
+}
+# Codecs per format; text formats are compressed as a whole, binary ones per column chunk
+EXPORT_COMPRESSION = {
+    "csv": ("gzip", "zstd"),
+    "ndjson": ("gzip", "zstd"),
+    "parquet": ("snappy", "gzip", "zstd", "lz4", "brotli"),
+    "feather": ("zstd", "lz4"),
+}
+COMPRESSED_MEDIA_TYPES = {"gzip": ("application/gzip", "gz"), "zstd": ("application/zstd", "zst")}
+
+
+def csv_reader_kwargs(options: Dict[str, Any]) -> Dict[str, Any]:
+    """Translate load options into pandas read_csv keyword arguments"""
+    return {
+        "delimiter": options.get('delimiter', ','),
+        "header": 0 if options.get('header', True) else None,
+        "encoding": options.get('encoding', 'utf-8'),
+    }
+
+
+def stable_dtypes(sample: pd.DataFrame) -> Dict[Any, Any]:
+    """Widen dtypes inferred from a sample so later chunks can hold missing values.
+
+    Integer columns become float64 rather than a nullable integer type, since
+    a later chunk may also hold decimals.
+    """
+    dtypes = {}
+    for column, dtype in sample.dtypes.items():
+        if pd.api.types.is_bool_dtype(dtype):
+            dtypes[column] = "boolean"
+        elif pd.api.types.is_integer_dtype(dtype) or pd.api.types.is_float_dtype(dtype):
+            dtypes[column] = "float64"
+        else:
+            dtypes[column] = dtype
+    return dtypes
+
+
+class CsvChunkReader:
+    """Iterate over a CSV file in chunks with dtypes fixed by the first chunk.
+
+    The first chunk is parsed on construction so that missing files and
+    malformed headers fail before a streaming response has started. Every
+    chunk, including the first, is then produced by one reader that applies
+    the inferred dtypes, so all chunks share the same schema.
+    """
+
+    def __init__(self, file_path: str, options: Dict[str, Any], chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 usecols: Optional[List[Any]] = None):
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be positive")
+        self.file_path = file_path
+        self.chunk_size = chunk_size
+        self._kwargs = csv_reader_kwargs(options)
+        if usecols:
+            self._kwargs["usecols"] = usecols
+
+        sample = pd.read_csv(file_path, nrows=chunk_size, **self._kwargs)
+        self.columns = sample.columns.tolist()
+        self.dtypes = stable_dtypes(sample)
+
+    def __iter__(self) -> Iterator[pd.DataFrame]:
+        with pd.read_csv(self.file_path, dtype=self.dtypes, chunksize=self.chunk_size, **self._kwargs) as reader:
+            for chunk in reader:
+                yield chunk
+
+
+def file_format(file_path: str, options: Dict[str, Any]) -> str:
+    """Format named by options.file_format, or else by the file extension"""
+    return options.get('file_format') or os.path.splitext(file_path)[1].lstrip('.').lower()
+
+
+def iter_file_chunks(file_path: str, options: Dict[str, Any], chunk_size: int = DEFAULT_CHUNK_SIZE,
+                     columns: Optional[List[Any]] = None) -> Iterator[pd.DataFrame]:
+    """Yield a CSV, Parquet or Excel worksheet as DataFrames of at most chunk_size rows"""
+    fmt = file_format(file_path, options)
+    if fmt in ('parquet', 'pq'):
+        import_pyarrow()
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(file_path).iter_batches(batch_size=chunk_size, columns=columns):
+            yield batch.to_pandas()
+    elif fmt in ('csv', 'tsv', 'txt'):
+        yield from CsvChunkReader(file_path, options, chunk_size=chunk_size, usecols=columns)
+    elif fmt in ('xlsx', 'xlsm'):
+        from excel_io import iter_sheet_chunks, resolve_sheets
+
+        sheet, = resolve_sheets(file_path, options.get('sheet_name', 0), engine='openpyxl')
+        for chunk in iter_sheet_chunks(file_path, sheet, header=options.get('header', True),
+                                       cell_range=options.get('range'), chunk_size=chunk_size):
+            yield chunk if columns is None else chunk[columns]
+    else:
+        raise ValueError(f"Unsupported file format for chunked reading: {fmt}")
+
+
+def read_csv_page(file_path: str, options: Dict[str, Any], offset: int, limit: int) -> Tuple[pd.DataFrame, bool]:
+    """Read rows [offset, offset + limit) of a CSV file and report whether more follow"""
+    if offset < 0 or limit < 0:
+        raise ValueError("offset and limit must be non-negative")
+    kwargs = csv_reader_kwargs(options)
+    first_data_row = 1 if kwargs["header"] == 0 else 0
+    page = pd.read_csv(
+        file_path,
+        skiprows=range(first_data_row, first_data_row + offset),
+        nrows=limit + 1,
+        **kwargs
+    )
+    return page.iloc[:limit], len(page) > limit
+
+
+def ndjson_stream(chunks: Iterator[pd.DataFrame]) -> Iterator[bytes]:
+    """Encode chunks as newline-delimited JSON records, one line per row"""
+    for chunk in chunks:
+        if len(chunk):
+            yield chunk.to_json(orient='records', lines=True, date_format='iso').rstrip("\n").encode() + b"\n"
+
+
+class _ByteSink:
+    """Write-only file object whose buffered bytes are drained after each batch"""
+
+    def __init__(self):
+        self._parts = []
+        self.closed = False
+
+    def write(self, data) -> int:
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts = []
+        return data
+
+
+def arrow_stream(chunks: Iterator[pd.DataFrame]) -> Iterator[bytes]:
+    """Encode chunks as one Arrow IPC stream with a record batch per chunk"""
+    pa = import_pyarrow()
+    sink = _ByteSink()
+    writer, schema = None, None
+    for chunk in chunks:
+        batch = pa.RecordBatch.from_pandas(chunk, schema=schema, preserve_index=False)
+        if writer is None:
+            schema = batch.schema
+            writer = pa.ipc.new_stream(pa.PythonFile(sink, mode='w'), schema)
+        writer.write_batch(batch)
+        yield sink.drain()
+    if writer is not None:
+        writer.close()
+        yield sink.drain()
+
+
+def frame_chunks(df: pd.DataFrame, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[pd.DataFrame]:
+    """Slice a DataFrame into chunks of at most chunk_size rows"""
+    for start in range(0, len(df), chunk_size):
+        yield df.iloc[start:start + chunk_size]
+
+
+def csv_stream(chunks: Iterator[pd.DataFrame], delimiter: str = ',', header: bool = True) -> Iterator[bytes]:
+    """Encode chunks as one CSV document, with the header before the first chunk"""
+    for chunk in chunks:
+        yield chunk.to_csv(index=False, header=header, sep=delimiter).encode()
+        header = False
+
+
+def _arrow_file_stream(chunks: Iterator[pd.DataFrame], schema, open_writer) -> Iterator[bytes]:
+    pa = import_pyarrow()
+    sink = _ByteSink()
+    with open_writer(pa.PythonFile(sink, mode='w'), schema) as writer:
+        for chunk in chunks:
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+            yield sink.drain()
+    yield sink.drain()
+
+
+def parquet_stream(chunks: Iterator[pd.DataFrame], schema, compression: Optional[str] = 'snappy') -> Iterator[bytes]:
+    """Encode chunks as one Parquet file with a row group per chunk"""
+    import_pyarrow()
+    import pyarrow.parquet as pq
+
+    return _arrow_file_stream(chunks, schema, lambda sink, schema: pq.ParquetWriter(
+        sink, schema, compression=compression or 'none'
+    ))
+
+
+def feather_stream(chunks: Iterator[pd.DataFrame], schema, compression: Optional[str] = None) -> Iterator[bytes]:
+    """Encode chunks as one Arrow IPC (Feather v2) file with record batches per chunk"""
+    pa = import_pyarrow()
+    options = pa.ipc.IpcWriteOptions(compression=compression)
+    return _arrow_file_stream(chunks, schema, lambda sink, schema: pa.ipc.new_file(sink, schema, options=options))
+
+
+def compressed_stream(parts: Iterator[bytes], encoding: str) -> Iterator[bytes]:
+    """Compress a byte stream incrementally with gzip or zstd"""
+    compressor = stream_compressor(encoding)
+    for part in parts:
+        data = compressor.compress(part)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_stream(df: pd.DataFrame, fmt: str, options: Dict[str, Any]) -> Tuple[Iterator[bytes], str, str]:
+    """Encode df for download in chunks, returning (byte stream, media type, file extension).
+
+    Options are validated before the stream starts, so bad options fail
+    before any bytes are sent.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format: {fmt}; expected one of {list(EXPORT_FORMATS)}")
+    compression = options.get('compression')
+    compression = None if compression in (None, 'none') else str(compression).lower()
+    if compression is not None and compression not in EXPORT_COMPRESSION[fmt]:
+        raise ValueError(f"Unsupported compression for {fmt}: {compression}; "
+                         f"expected one of {list(EXPORT_COMPRESSION[fmt])}")
+    media_type, extension = EXPORT_FORMATS[fmt]
+    chunks = frame_chunks(df, int(options.get('chunk_size', DEFAULT_CHUNK_SIZE)))
+
+    if fmt in ('parquet', 'feather'):
+        pa = import_pyarrow()
+        # The schema comes from the whole frame so every chunk is written with the same types
+        schema = pa.Schema.from_pandas(df, preserve_index=False)
+        if fmt == 'parquet':
+            return parquet_stream(chunks, schema, compression or 'snappy'), media_type, extension
+        return feather_stream(chunks, schema, compression), media_type, extension
+
+    if fmt == 'csv':
+        parts = csv_stream(chunks, delimiter=options.get('delimiter', ','), header=options.get('header', True))
+    else:
+        parts = ndjson_stream(chunks)
+    if compression is None:
+        return parts, media_type, extension
+    # Fails here rather than mid-stream when zstandard is missing
+    stream_compressor(compression)
+    compressed_media_type, suffix = COMPRESSED_MEDIA_TYPES[compression]
+    return compressed_stream(parts, compression), compressed_media_type, f"{extension}.{suffix}"
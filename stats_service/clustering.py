@@ -0,0 +1,148 @@
+"""
+Clustering engine for large datasets.
+
+KMeans switches to MiniBatchKMeans above a row threshold. The silhouette
+score is estimated on a seeded sample instead of the O(n^2) full pairwise
+distance matrix. DBSCAN and HDBSCAN take their density parameters and
+neighbor-search settings from the request. A sweep over candidate cluster
+counts can be spread across a process pool.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from sklearn.cluster import DBSCAN, HDBSCAN, KMeans, MiniBatchKMeans
+from sklearn.metrics import pairwise_distances_argmin, silhouette_score
+
+from progress import report_progress
+
+KMEANS_MAX_ITER = 300
+KMEANS_PROGRESS_STEP = 10
+DEFAULT_RANDOM_STATE = 42
+DEFAULT_MINIBATCH_THRESHOLD = 100000
+DEFAULT_BATCH_SIZE = 4096
+DEFAULT_SILHOUETTE_SAMPLE = 10000
+NEIGHBOR_ALGORITHMS = ('auto', 'kd_tree', 'ball_tree', 'brute')
+
+# Matrix shared with sweep workers through the initializer
+_worker_data: Optional[np.ndarray] = None
+
+
+def fit_kmeans(data: np.ndarray, n_clusters: int, random_state: int = DEFAULT_RANDOM_STATE) -> KMeans:
+    """Fit KMeans as warm-started runs of Lloyd iterations, reporting progress.
+
+    Each run continues from the previous centers, so the result matches a
+    single run while progress can be reported between runs.
+    """
+    clusterer = KMeans(n_clusters=n_clusters, random_state=random_state, max_iter=KMEANS_PROGRESS_STEP).fit(data)
+    iterations = clusterer.n_iter_
+    report_progress("kmeans", iterations, KMEANS_MAX_ITER, inertia=float(clusterer.inertia_))
+    while clusterer.n_iter_ >= clusterer.max_iter and iterations < KMEANS_MAX_ITER:
+        clusterer = KMeans(
+            n_clusters=n_clusters,
+            init=clusterer.cluster_centers_,
+            n_init=1,
+            max_iter=min(KMEANS_PROGRESS_STEP, KMEANS_MAX_ITER - iterations)
+        ).fit(data)
+        iterations += clusterer.n_iter_
+        report_progress("kmeans", iterations, KMEANS_MAX_ITER, inertia=float(clusterer.inertia_))
+    return clusterer
+
+
+def fit_centroids(data: np.ndarray, n_clusters: int, options: Dict[str, Any]):
+    """Fit KMeans, or MiniBatchKMeans when data has more rows than options.minibatch_threshold"""
+    random_state = int(options.get('random_state', DEFAULT_RANDOM_STATE))
+    threshold = int(options.get('minibatch_threshold', DEFAULT_MINIBATCH_THRESHOLD))
+    if len(data) > threshold:
+        return MiniBatchKMeans(
+            n_clusters=n_clusters,
+            batch_size=int(options.get('batch_size', DEFAULT_BATCH_SIZE)),
+            random_state=random_state
+        ).fit(data)
+    return fit_kmeans(data, n_clusters, random_state)
+
+
+def fit_density(data: np.ndarray, algorithm: str, options: Dict[str, Any]) -> np.ndarray:
+    """Cluster with DBSCAN or HDBSCAN and return the labels (-1 for noise)"""
+    neighbor_algorithm = options.get('neighbor_algorithm', 'auto')
+    if neighbor_algorithm not in NEIGHBOR_ALGORITHMS:
+        raise ValueError(f"Unsupported neighbor_algorithm: {neighbor_algorithm}")
+    leaf_size = int(options.get('leaf_size', 30))
+    if algorithm == 'dbscan':
+        clusterer = DBSCAN(
+            eps=float(options.get('eps', 0.5)),
+            min_samples=int(options.get('min_samples', 5)),
+            algorithm=neighbor_algorithm,
+            leaf_size=leaf_size
+        )
+    else:
+        min_samples = options.get('min_samples')
+        clusterer = HDBSCAN(
+            min_cluster_size=int(options.get('min_cluster_size', 5)),
+            min_samples=int(min_samples) if min_samples is not None else None,
+            cluster_selection_epsilon=float(options.get('cluster_selection_epsilon', 0.0)),
+            algorithm=neighbor_algorithm,
+            leaf_size=leaf_size,
+            copy=False
+        )
+    return clusterer.fit_predict(data)
+
+
+def sampled_silhouette(data: np.ndarray, labels: np.ndarray, sample_size: int,
+                       random_state: int = DEFAULT_RANDOM_STATE) -> Tuple[float, int]:
+    """Silhouette score on a seeded sample of at most sample_size rows, and the rows used"""
+    if len(set(labels)) < 2:
+        return 0.0, 0
+    if len(data) <= sample_size:
+        return float(silhouette_score(data, labels)), len(data)
+    sample = np.random.default_rng(random_state).choice(len(data), size=sample_size, replace=False)
+    if len(set(labels[sample])) < 2:
+        return 0.0, sample_size
+    return float(silhouette_score(data[sample], labels[sample])), sample_size
+
+
+def _sweep_point(data: np.ndarray, k: int, options: Dict[str, Any]) -> Dict[str, Any]:
+    clusterer = fit_centroids(data, k, options)
+    silhouette, _ = sampled_silhouette(
+        data, clusterer.labels_,
+        int(options.get('silhouette_sample_size', DEFAULT_SILHOUETTE_SAMPLE)),
+        int(options.get('random_state', DEFAULT_RANDOM_STATE))
+    )
+    return {
+        "k": k,
+        "estimator": type(clusterer).__name__,
+        "inertia": float(clusterer.inertia_),
+        "silhouette": silhouette,
+        "centers": clusterer.cluster_centers_
+    }
+
+
+def _init_worker(data: np.ndarray):
+    global _worker_data
+    _worker_data = data
+
+
+def _worker_sweep_point(k: int, options: Dict[str, Any]) -> Dict[str, Any]:
+    return _sweep_point(_worker_data, k, options)
+
+
+def k_sweep(data: np.ndarray, k_values: List[int], options: Dict[str, Any],
+            max_workers: int = 1) -> List[Dict[str, Any]]:
+    """Fit each candidate cluster count and return its inertia, silhouette and centers"""
+    results = []
+    if max_workers > 1 and len(k_values) > 1:
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker, initargs=(data,)) as pool:
+            futures = [pool.submit(_worker_sweep_point, k, options) for k in k_values]
+            for done, future in enumerate(futures, start=1):
+                results.append(future.result())
+                report_progress("k_sweep", done, len(k_values))
+    else:
+        for done, k in enumerate(k_values, start=1):
+            results.append(_sweep_point(data, k, options))
+            report_progress("k_sweep", done, len(k_values))
+    return results
+
+
+def assign_labels(data: np.ndarray, centers: np.ndarray) -> np.ndarray:
+    """Label each row with its nearest center"""
+    return pairwise_distances_argmin(data, centers)
@@ -0,0 +1,172 @@
+"""
+Block-wise correlation engine for wide numeric matrices.
+
+Pearson and Spearman correlations are computed as masked matrix products over
+tiles of columns, so pairwise-complete observations are handled without a
+Python loop over column pairs and p-values come from one vectorized
+t-distribution call. Kendall's tau has no such closed form and is computed
+per pair inside each tile. Tiles can be spread across a process pool for very
+wide data.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from scipy import stats
+
+SUPPORTED_METHODS = ('pearson', 'spearman', 'kendall')
+DEFAULT_BLOCK_SIZE = 512
+
+# Matrix shared with pool workers through the initializer
+_worker_values: Optional[np.ndarray] = None
+
+
+def _prepare(values: np.ndarray, method: str, dtype) -> np.ndarray:
+    """Rank-transform for Spearman and center columns to limit cancellation"""
+    values = np.asarray(values, dtype=np.float64)
+    if method == 'spearman':
+        values = stats.rankdata(values, axis=0, nan_policy='omit')
+    with np.errstate(invalid='ignore'):
+        column_means = np.nanmean(values, axis=0) if values.size else np.zeros(values.shape[1])
+    return (values - np.nan_to_num(column_means)).astype(dtype, copy=False)
+
+
+def _pearson_tile(a: np.ndarray, b: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Pairwise-complete Pearson r and observation counts between column blocks"""
+    mask_a, mask_b = ~np.isnan(a), ~np.isnan(b)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        if mask_a.all() and mask_b.all():
+            n = np.full((a.shape[1], b.shape[1]), a.shape[0], dtype=np.float64)
+            a = a - a.mean(axis=0)
+            b = b - b.mean(axis=0)
+            r = (a.T @ b) / np.outer(np.sqrt((a * a).sum(axis=0)), np.sqrt((b * b).sum(axis=0)))
+        else:
+            weight_a, weight_b = mask_a.astype(a.dtype), mask_b.astype(b.dtype)
+            a0, b0 = np.where(mask_a, a, 0), np.where(mask_b, b, 0)
+            n = (weight_a.T @ weight_b).astype(np.float64)
+            sum_a = a0.T @ weight_b
+            sum_b = weight_a.T @ b0
+            cov = a0.T @ b0 - sum_a * sum_b / n
+            var_a = (a0 * a0).T @ weight_b - sum_a * sum_a / n
+            var_b = weight_a.T @ (b0 * b0) - sum_b * sum_b / n
+            r = cov / np.sqrt(var_a * var_b)
+    return np.clip(r, -1.0, 1.0).astype(np.float64), n
+
+
+def _kendall_tile(a: np.ndarray, b: np.ndarray, symmetric: bool) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Pairwise-complete Kendall tau, p-values and counts between column blocks"""
+    r = np.full((a.shape[1], b.shape[1]), np.nan)
+    p = np.full_like(r, np.nan)
+    n = np.zeros_like(r)
+    for i in range(a.shape[1]):
+        for j in range(i if symmetric else 0, b.shape[1]):
+            complete = ~(np.isnan(a[:, i]) | np.isnan(b[:, j]))
+            n[i, j] = complete.sum()
+            if n[i, j] > 1:
+                tau, p_value = stats.kendalltau(a[complete, i], b[complete, j])
+                r[i, j], p[i, j] = tau, p_value
+            if symmetric:
+                r[j, i], p[j, i], n[j, i] = r[i, j], p[i, j], n[i, j]
+    return r, p, n
+
+
+def _tile(values: np.ndarray, rows: Tuple[int, int], cols: Tuple[int, int], method: str):
+    a = values[:, rows[0]:rows[1]]
+    b = values[:, cols[0]:cols[1]]
+    if method == 'kendall':
+        return _kendall_tile(a, b, symmetric=rows == cols)
+    r, n = _pearson_tile(a, b)
+    return r, None, n
+
+
+def _init_worker(values: np.ndarray):
+    global _worker_values
+    _worker_values = values
+
+
+def _worker_tile(rows: Tuple[int, int], cols: Tuple[int, int], method: str):
+    return rows, cols, _tile(_worker_values, rows, cols, method)
+
+
+def correlation_pvalues(r: np.ndarray, n: np.ndarray) -> np.ndarray:
+    """Two-sided p-values for correlation coefficients using the t distribution"""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        dof = n - 2
+        t_stat = r * np.sqrt(dof / np.maximum(1.0 - r * r, 0.0))
+        p = 2.0 * stats.t.sf(np.abs(t_stat), dof)
+    return np.where(dof > 0, p, np.nan)
+
+
+def correlation_matrix(values: np.ndarray, method: str = 'pearson', dtype=np.float64,
+                       block_size: int = DEFAULT_BLOCK_SIZE,
+                       max_workers: int = 1) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Return (r, p_values, n) matrices for the columns of a 2-D array.
+
+    Missing values are handled pairwise. Spearman ranks each column once over
+    its observed values, so with missing values the ranks are not recomputed
+    for each pair's complete cases as pandas does.
+    """
+    if method not in SUPPORTED_METHODS:
+        raise ValueError(f"Unsupported correlation method: {method}")
+    values = _prepare(values, method, dtype)
+    n_columns = values.shape[1]
+    block_size = max(1, int(block_size))
+    bounds = [(start, min(start + block_size, n_columns)) for start in range(0, n_columns, block_size)]
+    tiles = [(bounds[i], bounds[j]) for i in range(len(bounds)) for j in range(i, len(bounds))]
+
+    r = np.full((n_columns, n_columns), np.nan)
+    p = np.full_like(r, np.nan) if method == 'kendall' else None
+    n = np.zeros_like(r)
+
+    def place(rows, cols, result):
+        tile_r, tile_p, tile_n = result
+        r[rows[0]:rows[1], cols[0]:cols[1]] = tile_r
+        r[cols[0]:cols[1], rows[0]:rows[1]] = tile_r.T
+        n[rows[0]:rows[1], cols[0]:cols[1]] = tile_n
+        n[cols[0]:cols[1], rows[0]:rows[1]] = tile_n.T
+        if tile_p is not None:
+            p[rows[0]:rows[1], cols[0]:cols[1]] = tile_p
+            p[cols[0]:cols[1], rows[0]:rows[1]] = tile_p.T
+
+    if max_workers > 1 and len(tiles) > 1:
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker, initargs=(values,)) as pool:
+            for rows, cols, result in pool.map(_worker_tile, *zip(*tiles), [method] * len(tiles)):
+                place(rows, cols, result)
+    else:
+        for rows, cols in tiles:
+            place(rows, cols, _tile(values, rows, cols, method))
+
+    if p is None:
+        p = correlation_pvalues(r, n)
+    diagonal = np.arange(n_columns)
+    observed = n[diagonal, diagonal] > 1
+    r[diagonal, diagonal] = np.where(observed, 1.0, np.nan)
+    p[diagonal, diagonal] = np.where(observed, 0.0, np.nan)
+    return r, p, n
+
+
+def strongest_pairs(columns: List[Any], r: np.ndarray, p: np.ndarray, n: np.ndarray,
+                    top_k: Optional[int] = None, threshold: Optional[float] = None) -> List[Dict[str, Any]]:
+    """List distinct column pairs by decreasing |r|, limited by top_k and/or |r| >= threshold"""
+    rows, cols = np.triu_indices(len(columns), k=1)
+    strength = np.abs(r[rows, cols])
+    keep = ~np.isnan(strength)
+    if threshold is not None:
+        keep &= strength >= threshold
+    rows, cols, strength = rows[keep], cols[keep], strength[keep]
+
+    if top_k is not None and top_k < strength.size:
+        selected = np.argpartition(-strength, top_k)[:top_k]
+        rows, cols, strength = rows[selected], cols[selected], strength[selected]
+    order = np.argsort(-strength, kind='stable')
+
+    return [
+        {
+            "column_1": columns[i],
+            "column_2": columns[j],
+            "correlation": float(r[i, j]),
+            "p_value": float(p[i, j]),
+            "n": int(n[i, j])
+        }
+        for i, j in zip(rows[order], cols[order])
+    ]
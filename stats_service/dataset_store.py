@@ -0,0 +1,282 @@
+"""
+In-memory dataset registry for the Advanced Statistical Analysis Service.
+
+Loaded DataFrames are kept under an opaque dataset ID so analysis endpoints
+can reference a dataset instead of re-posting its rows on every call. The
+store is bounded by a memory budget and evicts least recently used datasets
+when the budget is exceeded.
+
+Rows appended to a dataset are kept as separate chunks until the whole
+dataset is next read, so appending takes time proportional to the new rows.
+The incremental statistics of a dataset (see incremental.py) live with it and
+fold in appended rows when they are next queried.
+"""
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_right
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from incremental import Chunk, DatasetTrackers
+
+DEFAULT_MEMORY_BUDGET_MB = int(os.environ.get("STATS_DATASET_MEMORY_MB", "1024"))
+
+
+class DatasetNotFoundError(KeyError):
+    """Raised when a dataset ID is unknown or has been evicted"""
+
+
+class DatasetTooLargeError(ValueError):
+    """Raised when a single dataset does not fit in the memory budget"""
+
+
+class DatasetAppendError(ValueError):
+    """Raised when appended rows do not match the dataset's columns"""
+
+
+def _lossless_cast(values: pd.Series, dtype) -> Optional[pd.Series]:
+    """values as dtype, or None when that would change or drop values"""
+    try:
+        cast = pd.to_datetime(values) if pd.api.types.is_datetime64_any_dtype(dtype) else values
+        cast = cast.astype(dtype)
+    except (TypeError, ValueError):
+        return None
+    if cast.isna().sum() > values.isna().sum():
+        return None
+    if pd.api.types.is_integer_dtype(dtype) or pd.api.types.is_bool_dtype(dtype):
+        if not (cast == values).all():
+            return None
+    return cast
+
+
+def conform_rows(rows: pd.DataFrame, template: pd.DataFrame, first_row: int) -> pd.DataFrame:
+    """rows with template's columns, in its order and with its dtypes where the values allow.
+
+    Numeric columns receiving values their dtype cannot hold, such as missing
+    values in an integer column, are appended as floats; other columns keep
+    the appended values' dtype. Either way the dataset's column takes the
+    wider type when the chunks are joined. Appended rows continue a default
+    index from first_row.
+    """
+    missing = [column for column in template.columns if column not in rows.columns]
+    unexpected = [column for column in rows.columns if column not in template.columns]
+    if missing or unexpected:
+        raise DatasetAppendError(
+            f"Appended rows must have the dataset's columns; missing: {missing}, unexpected: {unexpected}"
+        )
+    columns = {}
+    for column, dtype in template.dtypes.items():
+        values = rows[column]
+        if values.dtype != dtype:
+            cast = _lossless_cast(values, dtype)
+            if cast is not None:
+                values = cast
+            elif pd.api.types.is_numeric_dtype(dtype):
+                cast = _lossless_cast(values, np.float64)
+                if cast is None:
+                    raise DatasetAppendError(f"Cannot append {values.dtype} values to numeric column {column}")
+                values = cast
+        columns[column] = values.array
+    default_index = isinstance(template.index, pd.RangeIndex) and template.index.start == 0 \
+        and template.index.step == 1
+    return pd.DataFrame(columns, index=pd.RangeIndex(first_row, first_row + len(rows)) if default_index else rows.index)
+
+
+def joined_dtypes(dtypes: pd.Series, rows: pd.DataFrame) -> pd.Series:
+    """Column types of a dataset with dtypes once rows are joined to it, resolved as pd.concat does"""
+    empty = pd.DataFrame({column: pd.Series(dtype=dtype) for column, dtype in dtypes.items()})
+    return pd.concat([empty, rows.iloc[:0]]).dtypes
+
+
+class _Entry:
+    __slots__ = ("df", "name", "source", "nbytes", "created_at", "last_accessed", "rows", "dtypes", "chunks",
+                 "arrival_rows", "arrival_times", "trackers", "lock")
+
+    def __init__(self, df: pd.DataFrame, name: Optional[str], source: Optional[str], nbytes: int):
+        self.df = df
+        self.name = name
+        self.source = source
+        self.nbytes = nbytes
+        self.created_at = datetime.now()
+        self.last_accessed = self.created_at
+        self.rows = len(df)
+        # Column types including the appended rows, which df takes when they are joined
+        self.dtypes = df.dtypes
+        # Appended rows not yet joined to df
+        self.chunks: List[pd.DataFrame] = []
+        # First row and arrival time of the loaded rows and of each append
+        self.arrival_rows = [0]
+        self.arrival_times = [self.created_at.timestamp()]
+        self.trackers: Optional[DatasetTrackers] = None
+        # Serializes appends, joins and incremental statistics of the dataset
+        self.lock = threading.RLock()
+
+    def frame(self) -> pd.DataFrame:
+        """The dataset with its appended rows joined"""
+        with self.lock:
+            if self.chunks:
+                self.df = pd.concat([self.df, *self.chunks])
+                self.chunks = []
+            return self.df
+
+    def chunks_since(self, row: int) -> List[Chunk]:
+        """The dataset's rows from row on, one chunk per append; callers hold the lock"""
+        joined = len(self.arrival_rows) - len(self.chunks)
+        result = []
+        for index in range(max(bisect_right(self.arrival_rows, row) - 1, 0), len(self.arrival_rows)):
+            start = max(self.arrival_rows[index], row)
+            end = self.arrival_rows[index + 1] if index + 1 < len(self.arrival_rows) else self.rows
+            if start >= end:
+                continue
+            if index < joined:
+                rows = self.df.iloc[start:end]
+            else:
+                chunk = self.chunks[index - joined]
+                rows = chunk.iloc[start - self.arrival_rows[index]:]
+            result.append((start, self.arrival_times[index], rows))
+        return result
+
+
+class DatasetStore:
+    """Thread-safe LRU store of DataFrames bounded by a memory budget.
+
+    Stored frames are shared between requests and must be treated as
+    read-only; operations that transform a dataset return a new frame.
+    """
+
+    def __init__(self, memory_budget_bytes: Optional[int] = None):
+        if memory_budget_bytes is None:
+            memory_budget_bytes = DEFAULT_MEMORY_BUDGET_MB * 1024 * 1024
+        self.memory_budget_bytes = memory_budget_bytes
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._total_bytes = 0
+        self._evictions = 0
+        self._lock = threading.RLock()
+
+    def put(self, df: pd.DataFrame, name: Optional[str] = None, source: Optional[str] = None) -> str:
+        """Register a DataFrame and return its dataset ID"""
+        nbytes = int(df.memory_usage(deep=True).sum())
+        if nbytes > self.memory_budget_bytes:
+            raise DatasetTooLargeError(
+                f"Dataset needs {nbytes} bytes but the memory budget is {self.memory_budget_bytes} bytes"
+            )
+
+        dataset_id = uuid.uuid4().hex
+        with self._lock:
+            self._entries[dataset_id] = _Entry(df, name, source, nbytes)
+            self._total_bytes += nbytes
+            self._evict()
+        return dataset_id
+
+    def get(self, dataset_id: str) -> pd.DataFrame:
+        """Return the DataFrame for a dataset ID and mark it as recently used"""
+        with self._lock:
+            entry = self._entries.get(dataset_id)
+            if entry is None:
+                raise DatasetNotFoundError(dataset_id)
+            self._entries.move_to_end(dataset_id)
+            entry.last_accessed = datetime.now()
+        return entry.frame()
+
+    def append(self, dataset_id: str, rows: pd.DataFrame) -> Dict[str, Any]:
+        """Append rows to a dataset in time proportional to their number and return its metadata"""
+        with self._lock:
+            entry = self._entries.get(dataset_id)
+            if entry is None:
+                raise DatasetNotFoundError(dataset_id)
+        with entry.lock:
+            rows = conform_rows(rows, entry.df, entry.rows)
+            nbytes = int(rows.memory_usage(deep=True).sum())
+            if entry.nbytes + nbytes > self.memory_budget_bytes:
+                raise DatasetTooLargeError(
+                    f"Dataset would need {entry.nbytes + nbytes} bytes but the memory budget is "
+                    f"{self.memory_budget_bytes} bytes"
+                )
+            if len(rows):
+                entry.chunks.append(rows)
+                entry.arrival_rows.append(entry.rows)
+                entry.arrival_times.append(time.time())
+                entry.rows += len(rows)
+                entry.dtypes = joined_dtypes(entry.dtypes, rows)
+        with self._lock:
+            if self._entries.get(dataset_id) is entry:
+                entry.nbytes += nbytes
+                self._total_bytes += nbytes
+                self._entries.move_to_end(dataset_id)
+                entry.last_accessed = datetime.now()
+                self._evict()
+            return self._describe(dataset_id, entry)
+
+    @contextmanager
+    def incremental(self, dataset_id: str) -> Iterator[DatasetTrackers]:
+        """Hold a dataset's incremental statistics for a query, blocking appends to it meanwhile"""
+        with self._lock:
+            entry = self._entries.get(dataset_id)
+            if entry is None:
+                raise DatasetNotFoundError(dataset_id)
+            self._entries.move_to_end(dataset_id)
+            entry.last_accessed = datetime.now()
+        with entry.lock:
+            if entry.trackers is None:
+                entry.trackers = DatasetTrackers(entry.chunks_since, entry.dtypes)
+            entry.trackers.dtypes = entry.dtypes
+            yield entry.trackers
+
+    def info(self, dataset_id: str) -> Dict[str, Any]:
+        """Return metadata for a dataset without touching its LRU position"""
+        with self._lock:
+            entry = self._entries.get(dataset_id)
+            if entry is None:
+                raise DatasetNotFoundError(dataset_id)
+            return self._describe(dataset_id, entry)
+
+    def delete(self, dataset_id: str) -> bool:
+        """Remove a dataset, returning False if it was not registered"""
+        with self._lock:
+            entry = self._entries.pop(dataset_id, None)
+            if entry is None:
+                return False
+            self._total_bytes -= entry.nbytes
+            return True
+
+    def list(self) -> List[Dict[str, Any]]:
+        """Return metadata for every registered dataset, most recently used last"""
+        with self._lock:
+            return [self._describe(dataset_id, entry) for dataset_id, entry in self._entries.items()]
+
+    def usage(self) -> Dict[str, Any]:
+        """Return memory accounting for the store"""
+        with self._lock:
+            return {
+                "datasets": len(self._entries),
+                "memory_bytes": self._total_bytes,
+                "memory_budget_bytes": self.memory_budget_bytes,
+                "evictions": self._evictions,
+            }
+
+    def _evict(self):
+        while self._total_bytes > self.memory_budget_bytes and len(self._entries) > 1:
+            _, entry = self._entries.popitem(last=False)
+            self._total_bytes -= entry.nbytes
+            self._evictions += 1
+
+    @staticmethod
+    def _describe(dataset_id: str, entry: _Entry) -> Dict[str, Any]:
+        return {
+            "dataset_id": dataset_id,
+            "name": entry.name,
+            "source": entry.source,
+            "shape": (entry.rows, entry.df.shape[1]),
+            "columns": entry.df.columns.tolist(),
+            "dtypes": entry.dtypes.astype(str).to_dict(),
+            "memory_bytes": entry.nbytes,
+            "created_at": entry.created_at.isoformat(),
+            "last_accessed": entry.last_accessed.isoformat(),
+        }
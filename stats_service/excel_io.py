@@ -0,0 +1,203 @@
+"""
+Streaming Excel reading and writing.
+
+pandas' default Excel reader and writer build the whole workbook as cell
+objects, which takes gigabytes for sheets of a few hundred thousand rows.
+Here .xlsx/.xlsm sheets are read with openpyxl in read-only mode, which
+parses the sheet XML as it iterates, and converted to DataFrames a chunk of
+rows at a time; exports are written with a write-only workbook that streams
+rows to disk. Several sheets can be parsed in parallel processes, and the
+Rust-based calamine reader can be selected when python-calamine is installed.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Union
+
+import pandas as pd
+
+DEFAULT_CHUNK_SIZE = 50000
+EXCEL_ENGINES = ('auto', 'openpyxl', 'calamine')
+# Formats openpyxl can stream; other workbooks go through pandas' default reader
+STREAMING_EXTENSIONS = ('.xlsx', '.xlsm')
+
+
+def _streams(file_path: str, engine: str) -> bool:
+    """Whether file_path is read with openpyxl's streaming reader"""
+    if engine not in EXCEL_ENGINES:
+        raise ValueError(f"Unsupported Excel engine: {engine}")
+    if engine == 'auto':
+        return str(file_path).lower().endswith(STREAMING_EXTENSIONS)
+    return engine == 'openpyxl'
+
+
+def _pandas_engine(engine: str) -> Optional[str]:
+    if engine != 'calamine':
+        return None
+    try:
+        import python_calamine  # noqa: F401
+    except ImportError:
+        raise ValueError("The calamine engine requires python-calamine to be installed")
+    return 'calamine'
+
+
+def sheet_names(file_path: str, engine: str = 'auto') -> List[str]:
+    if _streams(file_path, engine):
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(file_path, read_only=True)
+        try:
+            return list(workbook.sheetnames)
+        finally:
+            workbook.close()
+    with pd.ExcelFile(file_path, engine=_pandas_engine(engine)) as workbook:
+        return [str(name) for name in workbook.sheet_names]
+
+
+def resolve_sheets(file_path: str, sheet_name: Union[int, str, List[Union[int, str]], None] = 0,
+                   engine: str = 'auto') -> List[str]:
+    """Names of the requested sheets: a position, a name, a list of either, or None for all"""
+    names = sheet_names(file_path, engine)
+    if sheet_name is None:
+        return names
+    requested = sheet_name if isinstance(sheet_name, list) else [sheet_name]
+    resolved = []
+    for sheet in requested:
+        if isinstance(sheet, int):
+            if not -len(names) <= sheet < len(names):
+                raise ValueError(f"Sheet index {sheet} out of range; the workbook has {len(names)} sheets")
+            sheet = names[sheet]
+        elif sheet not in names:
+            raise ValueError(f"Worksheet not found: {sheet}")
+        resolved.append(sheet)
+    return resolved
+
+
+def _range_bounds(cell_range: Optional[str]) -> Dict[str, Optional[int]]:
+    """iter_rows bounds of an A1-style range such as "B2:F1000", "B:F" or "3:200" """
+    if not cell_range:
+        return {}
+    from openpyxl.utils import range_boundaries
+
+    try:
+        min_col, min_row, max_col, max_row = range_boundaries(cell_range)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid cell range: {cell_range}")
+    bounds = {"min_col": min_col, "min_row": min_row, "max_col": max_col, "max_row": max_row}
+    return {name: value for name, value in bounds.items() if value is not None}
+
+
+def _header(row: Sequence[Any]) -> List[str]:
+    """Column names from a header row, named and de-duplicated as pandas does"""
+    columns, seen = [], {}
+    for position, value in enumerate(row):
+        name = f"Unnamed: {position}" if value is None else str(value)
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        columns.append(name)
+    return columns
+
+
+def _chunk_frame(rows: List[tuple], width: int, columns: Optional[List[str]]) -> pd.DataFrame:
+    rows = [row[:width] + (None,) * (width - len(row)) if len(row) != width else row for row in rows]
+    return pd.DataFrame.from_records(rows, columns=columns if columns is not None else range(width), nrows=len(rows))
+
+
+def iter_sheet_chunks(file_path: str, sheet_name: str, header: bool = True, cell_range: Optional[str] = None,
+                      chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[pd.DataFrame]:
+    """Yield a worksheet as DataFrames of at most chunk_size rows, parsing it as it goes.
+
+    The first row of the range is the header when header is true. Blank
+    rows at the end of the sheet are dropped, as pandas does.
+    """
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        rows = workbook[sheet_name].iter_rows(values_only=True, **_range_bounds(cell_range))
+        columns = None
+        if header:
+            first = next(rows, None)
+            columns = _header(first or ())
+        width = len(columns) if columns is not None else None
+
+        batch, blank, emitted = [], [], False
+        for row in rows:
+            if all(value is None for value in row):
+                blank.append(row)
+                continue
+            if width is None:
+                width = len(row)
+            if blank:
+                batch.extend(blank)
+                blank = []
+            batch.append(row)
+            if len(batch) >= chunk_size:
+                yield _chunk_frame(batch, width, columns)
+                batch, emitted = [], True
+        if batch or not emitted:
+            yield _chunk_frame(batch, width or 0, columns)
+    finally:
+        workbook.close()
+
+
+def read_excel_sheet(file_path: str, sheet_name: str, header: bool = True, cell_range: Optional[str] = None,
+                     engine: str = 'auto', chunk_size: int = DEFAULT_CHUNK_SIZE) -> pd.DataFrame:
+    """Read one worksheet, streaming it with openpyxl or in one go with pandas"""
+    if _streams(file_path, engine):
+        chunks = list(iter_sheet_chunks(file_path, sheet_name, header, cell_range, chunk_size))
+        df = chunks[0] if len(chunks) == 1 else pd.concat(chunks, ignore_index=True)
+        # Chunks that only held blanks in a column leave it as object
+        return df.infer_objects()
+
+    kwargs = {}
+    bounds = _range_bounds(cell_range)
+    if bounds:
+        from openpyxl.utils import get_column_letter
+
+        if "min_col" in bounds:
+            kwargs["usecols"] = f"{get_column_letter(bounds['min_col'])}:{get_column_letter(bounds['max_col'])}"
+        if "min_row" in bounds:
+            kwargs["skiprows"] = bounds["min_row"] - 1
+            kwargs["nrows"] = bounds["max_row"] - bounds["min_row"] + (0 if header else 1)
+    return pd.read_excel(file_path, sheet_name=sheet_name, header=0 if header else None,
+                         engine=_pandas_engine(engine), **kwargs)
+
+
+def _read_excel_sheet_args(args: tuple) -> pd.DataFrame:
+    file_path, sheet_name, kwargs = args
+    return read_excel_sheet(file_path, sheet_name, **kwargs)
+
+
+def read_sheets(file_path: str, sheets: List[str], max_workers: int = 1, **kwargs) -> Dict[str, pd.DataFrame]:
+    """Read several worksheets, in up to max_workers processes at once"""
+    if max_workers > 1 and len(sheets) > 1:
+        with ProcessPoolExecutor(max_workers=min(max_workers, len(sheets))) as pool:
+            frames = list(pool.map(_read_excel_sheet_args, [(file_path, sheet, kwargs) for sheet in sheets]))
+    else:
+        frames = [read_excel_sheet(file_path, sheet, **kwargs) for sheet in sheets]
+    return dict(zip(sheets, frames))
+
+
+def _cell_values(chunk: pd.DataFrame) -> Iterator[tuple]:
+    """Rows of a chunk with missing values as empty cells"""
+    values = chunk.astype(object).where(chunk.notna(), None)
+    return values.itertuples(index=False, name=None)
+
+
+def write_excel(df: pd.DataFrame, file_path: str, sheet_name: str = 'Sheet1', index: bool = False,
+                header: bool = True, chunk_size: int = DEFAULT_CHUNK_SIZE):
+    """Write df to a single-sheet workbook, streaming rows through a write-only workbook"""
+    from openpyxl import Workbook
+
+    if index:
+        df = df.reset_index()
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title=sheet_name)
+    if header:
+        sheet.append([str(column) for column in df.columns])
+    for start in range(0, len(df), chunk_size):
+        for row in _cell_values(df.iloc[start:start + chunk_size]):
+            sheet.append(row)
+    workbook.save(file_path)
@@ -0,0 +1,331 @@
+"""
+Execution layer for CPU-bound analysis work.
+
+Endpoints stay `async def` and hand their computation to a process pool (for
+pandas/scikit-learn/matplotlib work that holds the GIL) or to a thread pool
+(for light operations that mostly release it), so the event loop keeps
+serving other requests, including `/health`, while analyses run.
+
+Each pool has a concurrency limit, tasks have a timeout, and a task whose
+client disconnects is abandoned: it is cancelled if it has not started, and a
+running task finishes in the background with its result discarded. A
+concurrency slot is only freed when the underlying task has really finished.
+Progress events reported by a task reach the listener that was active when it
+was submitted (see progress.py), also across the process boundary.
+"""
+import asyncio
+import contextvars
+import functools
+import importlib
+import multiprocessing
+import os
+import threading
+import uuid
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor, wait as wait_for_futures
+from concurrent.futures.process import BrokenProcessPool
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional
+
+from fastapi import HTTPException, Request
+
+import metrics
+import profiling
+import progress
+
+PROCESS_POOL = "process"
+PLOT_POOL = "plot"
+THREAD_POOL = "thread"
+
+DISCONNECT_POLL_INTERVAL = 0.5
+
+_current_request: ContextVar[Optional[Request]] = ContextVar("current_request", default=None)
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+def _init_worker(progress_queue, warm_up: Optional[Callable[[], None]], preload: List[str]):
+    progress.init_worker(progress_queue)
+    # Under forkserver, preload modules are already imported by the server
+    for module in preload:
+        importlib.import_module(module)
+    if warm_up is not None:
+        warm_up()
+
+
+class WorkerPools:
+    """Process and thread pools with per-pool concurrency limits and timeouts.
+
+    Analyses run on the process pool and plots on a separate process pool
+    whose workers are warmed up by `warm_up[PLOT_POOL]`, so slow renders do
+    not queue behind long analyses. Settings default to the
+    `STATS_PROCESS_WORKERS`, `STATS_PLOT_WORKERS`, `STATS_THREAD_WORKERS`,
+    `STATS_PROCESS_CONCURRENCY`, `STATS_PLOT_CONCURRENCY`,
+    `STATS_THREAD_CONCURRENCY`, `STATS_TASK_TIMEOUT` (seconds, 0 for none)
+    and `STATS_MP_START_METHOD` environment variables. A process pool with
+    zero workers runs its tasks on the thread pool instead.
+
+    Pools are created on first use; `start()` creates them ahead of time so
+    the `preload` modules and warm-ups do not delay the first request.
+    """
+
+    def __init__(self, process_workers: Optional[int] = None, thread_workers: Optional[int] = None,
+                 process_concurrency: Optional[int] = None, thread_concurrency: Optional[int] = None,
+                 timeout: Optional[float] = None, start_method: Optional[str] = None,
+                 preload: Optional[list] = None, plot_workers: Optional[int] = None,
+                 plot_concurrency: Optional[int] = None,
+                 warm_up: Optional[Dict[str, Callable[[], None]]] = None):
+        cpus = os.cpu_count() or 1
+        self.process_workers = process_workers if process_workers is not None else _env_int("STATS_PROCESS_WORKERS", cpus)
+        self.plot_workers = plot_workers if plot_workers is not None else _env_int("STATS_PLOT_WORKERS", min(2, cpus))
+        self.thread_workers = thread_workers if thread_workers is not None else _env_int("STATS_THREAD_WORKERS", min(32, cpus + 4))
+        self.limits = {
+            PROCESS_POOL: process_concurrency or _env_int("STATS_PROCESS_CONCURRENCY", max(1, self.process_workers) * 2),
+            PLOT_POOL: plot_concurrency or _env_int("STATS_PLOT_CONCURRENCY", max(1, self.plot_workers) * 2),
+            THREAD_POOL: thread_concurrency or _env_int("STATS_THREAD_CONCURRENCY", self.thread_workers * 2),
+        }
+        self.timeout = timeout if timeout is not None else float(os.environ.get("STATS_TASK_TIMEOUT", "300"))
+        self.start_method = start_method or os.environ.get("STATS_MP_START_METHOD") or self._default_start_method()
+        self.preload = preload or []
+        self.warm_up = warm_up or {}
+
+        self._process_pools: Dict[str, ProcessPoolExecutor] = {}
+        self._thread_pool: Optional[ThreadPoolExecutor] = None
+        self._pools_lock = threading.Lock()
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._in_flight = {PROCESS_POOL: 0, PLOT_POOL: 0, THREAD_POOL: 0}
+        self._completed = {PROCESS_POOL: 0, PLOT_POOL: 0, THREAD_POOL: 0}
+        self._timeouts = 0
+        self._abandoned = 0
+        self._progress_queue = None
+        self._progress_listeners: Dict[str, progress.ProgressListener] = {}
+
+    @staticmethod
+    def _default_start_method() -> str:
+        # Forking a process that already runs threads can deadlock children
+        return "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+    def _uses_processes(self, pool: str) -> bool:
+        workers = {PROCESS_POOL: self.process_workers, PLOT_POOL: self.plot_workers}.get(pool, 0)
+        return workers > 0
+
+    def _executor(self, pool: str) -> Executor:
+        with self._pools_lock:
+            return self._create_executor(pool)
+
+    def _create_executor(self, pool: str) -> Executor:
+        if self._uses_processes(pool):
+            if pool not in self._process_pools:
+                context = multiprocessing.get_context(self.start_method)
+                if self.start_method == "forkserver" and self.preload:
+                    context.set_forkserver_preload(self.preload)
+                if self._progress_queue is None:
+                    self._progress_queue = context.SimpleQueue()
+                    threading.Thread(target=self._forward_progress, args=(self._progress_queue,),
+                                     name="stats-progress", daemon=True).start()
+                self._process_pools[pool] = ProcessPoolExecutor(
+                    max_workers=self.process_workers if pool == PROCESS_POOL else self.plot_workers,
+                    mp_context=context,
+                    initializer=_init_worker,
+                    initargs=(
+                        self._progress_queue,
+                        self.warm_up.get(pool),
+                        [] if self.start_method == "forkserver" else self.preload
+                    )
+                )
+            return self._process_pools[pool]
+        if self._thread_pool is None:
+            self._thread_pool = ThreadPoolExecutor(max_workers=self.thread_workers, thread_name_prefix="stats-worker")
+        return self._thread_pool
+
+    def _semaphore(self, pool: str) -> asyncio.Semaphore:
+        semaphore = self._semaphores.get(pool)
+        if semaphore is None:
+            semaphore = self._semaphores[pool] = asyncio.Semaphore(self.limits[pool])
+        return semaphore
+
+    async def run(self, fn: Callable, *args, pool: str = PROCESS_POOL, timeout: Optional[float] = None, **kwargs) -> Any:
+        """Run fn(*args, **kwargs) on the given pool and return its result.
+
+        Raises HTTPException 504 on timeout and 499 when the client of the
+        current request disconnects first.
+        """
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphore(pool)
+        await semaphore.acquire()
+
+        call = functools.partial(fn, *args, **kwargs)
+        progress_key = None
+        # Workers report how much the task raised their peak memory
+        measured = self._uses_processes(pool) and metrics.current() is not None
+        if measured:
+            call = functools.partial(metrics.measure_task, call)
+        profile = profiling.current()
+        if profile is not None:
+            call = functools.partial(profiling.profile_task, profile.mode, call)
+        sampled = profiling.sampler() is not None
+        if sampled:
+            call = functools.partial(
+                profiling.sampled_task if self._uses_processes(pool) else profiling.run_sampled, call
+            )
+        if not self._uses_processes(pool):
+            # Threads see the request's context variables, e.g. the negotiated format
+            call = functools.partial(contextvars.copy_context().run, call)
+        elif progress.current_listener() is not None:
+            progress_key = uuid.uuid4().hex
+            self._progress_listeners[progress_key] = progress.current_listener()
+            call = functools.partial(progress.run_in_worker, progress_key, call)
+        try:
+            if self._uses_processes(pool):
+                # Starting the pool or a worker process blocks; keep it off the event loop
+                future = await asyncio.to_thread(lambda: self._executor(pool).submit(call))
+            else:
+                future = self._executor(pool).submit(call)
+        except BaseException:
+            self._progress_listeners.pop(progress_key, None)
+            semaphore.release()
+            raise
+        self._in_flight[pool] += 1
+
+        def task_finished(_):
+            self._progress_listeners.pop(progress_key, None)
+            loop.call_soon_threadsafe(self._release, pool, semaphore)
+
+        future.add_done_callback(task_finished)
+
+        timeout = self.timeout if timeout is None else timeout
+        result = asyncio.wrap_future(future)
+        watcher = asyncio.ensure_future(self._watch_disconnect(_current_request.get()))
+        try:
+            done, _ = await asyncio.wait({result, watcher}, timeout=timeout or None,
+                                         return_when=asyncio.FIRST_COMPLETED)
+        except asyncio.CancelledError:
+            result.cancel()
+            raise
+        finally:
+            watcher.cancel()
+
+        if result in done:
+            try:
+                value = result.result()
+            except BrokenProcessPool:
+                self._reset_process_pool(pool)
+                raise
+            if sampled and self._uses_processes(pool):
+                value, stacks = value
+                profiling.sampler().add(stacks)
+            if profile is not None:
+                value, task_profile = value
+                profile.add_task(task_profile)
+            if measured:
+                value, peak_delta = value
+                metrics.record_worker_peak(peak_delta)
+            return value
+
+        result.cancel()
+        self._abandoned += 1
+        if watcher in done:
+            raise HTTPException(status_code=499, detail="Client disconnected before the analysis finished")
+        self._timeouts += 1
+        raise HTTPException(status_code=504, detail=f"Analysis timed out after {timeout:g} seconds")
+
+    def _release(self, pool: str, semaphore: asyncio.Semaphore):
+        self._in_flight[pool] -= 1
+        self._completed[pool] += 1
+        semaphore.release()
+
+    @staticmethod
+    async def _watch_disconnect(request: Optional[Request]):
+        if request is None:
+            await asyncio.Event().wait()
+        while not await request.is_disconnected():
+            await asyncio.sleep(DISCONNECT_POLL_INTERVAL)
+
+    def _forward_progress(self, queue):
+        """Deliver progress events from worker processes to their listeners"""
+        while True:
+            message = queue.get()
+            if message is None:
+                return
+            task_key, event = message
+            listener = self._progress_listeners.get(task_key)
+            if listener is not None:
+                try:
+                    listener(event)
+                except Exception:
+                    # A failing listener must not stop delivery for other tasks
+                    pass
+
+    def _reset_process_pool(self, pool: str):
+        with self._pools_lock:
+            executor = self._process_pools.pop(pool, None)
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def start(self):
+        """Create the pools and start their workers, blocking until they are ready.
+
+        Process workers import the preload modules and run their pool's
+        warm-up. When a pool runs on threads, both happen in this process.
+        """
+        for pool in (PROCESS_POOL, PLOT_POOL):
+            if self._uses_processes(pool):
+                executor = self._executor(pool)
+                workers = self.process_workers if pool == PROCESS_POOL else self.plot_workers
+                # Each submission without an idle worker starts a new one
+                wait_for_futures([executor.submit(os.getpid) for _ in range(workers)])
+            else:
+                for module in self.preload:
+                    importlib.import_module(module)
+                if self.warm_up.get(pool) is not None:
+                    self.warm_up[pool]()
+        self._executor(THREAD_POOL)
+
+    def status(self) -> Dict[str, Any]:
+        """Return pool sizes, limits and task counters"""
+        return {
+            "process_workers": self.process_workers,
+            "plot_workers": self.plot_workers,
+            "thread_workers": self.thread_workers,
+            "start_method": self.start_method,
+            "concurrency_limits": dict(self.limits),
+            "in_flight": dict(self._in_flight),
+            "completed": dict(self._completed),
+            "timeouts": self._timeouts,
+            "abandoned": self._abandoned,
+            "task_timeout_seconds": self.timeout,
+        }
+
+    def shutdown(self, wait: bool = True):
+        """Stop both pools, cancelling queued tasks"""
+        for executor in [*self._process_pools.values(), self._thread_pool]:
+            if executor is not None:
+                executor.shutdown(wait=wait, cancel_futures=True)
+        self._process_pools = {}
+        self._thread_pool = None
+        if self._progress_queue is not None:
+            self._progress_queue.put(None)
+            self._progress_queue = None
+
+
+class RequestContextMiddleware:
+    """ASGI middleware exposing the current HTTP request to the worker pools.
+
+    The pools use it to notice when a client disconnects while its task is
+    queued or running.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        token = _current_request.set(Request(scope, receive))
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _current_request.reset(token)
@@ -0,0 +1,283 @@
+"""
+Incremental statistics of datasets that grow by appended rows.
+
+A tracker summarizes a set of numeric columns of a dataset with mergeable
+sufficient statistics:
+
+- per-column moments and quantile sketches (`sketches.DatasetSummary`)
+- the count, means and co-moment matrix of the rows complete in all of those
+  columns (`regression.CrossProducts`), which carry X'X, X'y and y'y for any
+  split of the columns into features and targets
+
+Trackers fold in only the rows appended since they were last used, so
+refreshing descriptive statistics, correlations or a regression costs time
+proportional to the new rows rather than to the history.
+
+A tracker covers the whole history or a window: the last N rows, or the last
+T minutes by a timestamp column or by the time rows were appended. A window
+is split into WINDOW_PANES panes of equal width, each with its own summary
+and its rows. Appends update the newest panes and drop panes that have left
+the window. A query merges the pane summaries and re-summarizes only the rows
+of the pane that the window boundary cuts through.
+"""
+import math
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from sketches import DEFAULT_SKETCH_K, DatasetSummary
+
+WINDOW_PANES = 32
+# Trackers kept per dataset, least recently used dropped first
+MAX_TRACKERS = 16
+
+# Rows of a dataset from a given row on: (first row, arrival time in seconds since the epoch, rows)
+Chunk = Tuple[int, float, pd.DataFrame]
+
+
+class Window:
+    """Rows a tracker covers: all of them, the last `rows` rows or the last `minutes` minutes.
+
+    Minute windows end at the latest value of `time_column`, or at the
+    current time when they follow the arrival of appended rows.
+    """
+
+    def __init__(self, rows: Optional[int] = None, minutes: Optional[float] = None,
+                 time_column: Optional[str] = None):
+        self.rows = rows
+        self.minutes = minutes
+        self.time_column = time_column
+
+    @classmethod
+    def from_spec(cls, spec: Any) -> "Window":
+        """Parse a window option: null for the whole history, or {"rows": N} or {"minutes": T[, "time_column"]}"""
+        if spec is None:
+            return cls()
+        if not isinstance(spec, dict):
+            raise ValueError("window must be an object with rows or minutes")
+        unknown = sorted(set(spec) - {"rows", "minutes", "time_column"})
+        if unknown:
+            raise ValueError(f"Unsupported window fields: {unknown}")
+        rows, minutes, time_column = spec.get("rows"), spec.get("minutes"), spec.get("time_column")
+        if (rows is None) == (minutes is None):
+            raise ValueError("window needs exactly one of rows or minutes")
+        if rows is not None:
+            if time_column is not None:
+                raise ValueError("time_column applies to minute windows only")
+            if int(rows) < 1:
+                raise ValueError("window rows must be at least 1")
+            return cls(rows=int(rows))
+        if float(minutes) <= 0:
+            raise ValueError("window minutes must be positive")
+        return cls(minutes=float(minutes), time_column=time_column)
+
+    @property
+    def key(self) -> Tuple:
+        return self.rows, self.minutes, self.time_column
+
+    @property
+    def cumulative(self) -> bool:
+        return self.rows is None and self.minutes is None
+
+    @property
+    def width(self) -> float:
+        """Width of a pane, in rows or seconds"""
+        if self.rows is not None:
+            return max(1, math.ceil(self.rows / WINDOW_PANES))
+        return self.minutes * 60 / WINDOW_PANES
+
+    def first_row(self, total_rows: int) -> int:
+        """First row a new tracker over a dataset of total_rows rows needs to read"""
+        return max(0, total_rows - self.rows) if self.rows is not None else 0
+
+    def coordinates(self, chunk: pd.DataFrame, first_row: int, arrived_at: float) -> np.ndarray:
+        """Position of each row along the window's axis: row number or seconds since the epoch, NaN if unknown"""
+        if self.rows is not None:
+            return np.arange(first_row, first_row + len(chunk), dtype=float)
+        if self.time_column is None:
+            return np.full(len(chunk), arrived_at)
+        times = chunk[self.time_column]
+        if isinstance(times.dtype, pd.DatetimeTZDtype):
+            times = times.dt.tz_convert("UTC").dt.tz_localize(None)
+        elif not pd.api.types.is_datetime64_dtype(times.dtype):
+            raise ValueError(f"Time column {self.time_column} must hold datetimes, not {times.dtype}")
+        nanoseconds = times.to_numpy(dtype="datetime64[ns]").astype(np.int64)
+        return np.where(times.isna().to_numpy(), np.nan, nanoseconds / 1e9)
+
+    def describe(self) -> Dict[str, Any]:
+        if self.rows is not None:
+            return {"rows": self.rows}
+        if self.minutes is not None:
+            return {"minutes": self.minutes, "time_column": self.time_column}
+        return {"all": True}
+
+
+class RunningSummary:
+    """Moments and quantile sketches per column, and cross products of the rows complete in every column"""
+
+    def __init__(self, columns: Sequence[Any], k: int = DEFAULT_SKETCH_K):
+        from regression import CrossProducts
+
+        self.columns = list(columns)
+        self.values = DatasetSummary(self.columns, k=k)
+        self.cross_products = CrossProducts(len(self.columns))
+
+    @property
+    def rows(self) -> int:
+        return self.values.rows
+
+    def update(self, values: np.ndarray):
+        """Add a 2-D float array of rows; NaNs are missing values"""
+        self.values.update_values(values)
+        self.cross_products.update(values[~np.isnan(values).any(axis=1)])
+
+    def merge(self, other: "RunningSummary"):
+        self.values.merge(other.values)
+        self.cross_products.merge(other.cross_products)
+
+
+class _Pane:
+    __slots__ = ("summary", "values", "coordinates")
+
+    def __init__(self, columns: List[Any]):
+        self.summary = RunningSummary(columns)
+        self.values: List[np.ndarray] = []
+        self.coordinates: List[np.ndarray] = []
+
+    def add(self, values: np.ndarray, coordinates: np.ndarray):
+        self.summary.update(values)
+        self.values.append(values)
+        self.coordinates.append(coordinates)
+
+    def since(self, cutoff: float) -> np.ndarray:
+        """Rows at or after cutoff"""
+        values = np.concatenate(self.values)
+        return values[np.concatenate(self.coordinates) >= cutoff]
+
+
+class Tracker:
+    """Summary of some numeric columns of a dataset over a window, updated with appended rows"""
+
+    def __init__(self, columns: List[Any], window: Window):
+        self.columns = list(columns)
+        self.window = window
+        self.rows_seen = 0
+        # Latest coordinate seen, which ends a window on a time column
+        self.latest = -np.inf
+        self._total = RunningSummary(self.columns) if window.cumulative else None
+        self._panes: Dict[int, _Pane] = {}
+
+    def update(self, first_row: int, arrived_at: float, chunk: pd.DataFrame):
+        """Fold in rows appended at arrived_at, the first of which is row first_row of the dataset"""
+        values = chunk[self.columns].to_numpy(dtype=float, na_value=np.nan)
+        self.rows_seen = first_row + len(chunk)
+        if self._total is not None:
+            self._total.update(values)
+            return
+
+        coordinates = self.window.coordinates(chunk, first_row, arrived_at)
+        known = ~np.isnan(coordinates)
+        values, coordinates = values[known], coordinates[known]
+        panes = np.floor(coordinates / self.window.width).astype(np.int64)
+        for index in np.unique(panes).tolist():
+            pane = self._panes.get(index)
+            if pane is None:
+                pane = self._panes[index] = _Pane(self.columns)
+            selected = panes == index
+            pane.add(values[selected], coordinates[selected])
+        if coordinates.size:
+            self.latest = max(self.latest, float(coordinates.max()))
+        self._expire(self._cutoff())
+
+    def summary(self) -> RunningSummary:
+        """A new summary of the rows currently in the window"""
+        result = RunningSummary(self.columns)
+        if self._total is not None:
+            result.merge(self._total)
+            return result
+        cutoff = self._cutoff()
+        self._expire(cutoff)
+        width = self.window.width
+        for index in sorted(self._panes):
+            pane = self._panes[index]
+            if index * width >= cutoff:
+                result.merge(pane.summary)
+            else:
+                result.update(pane.since(cutoff))
+        return result
+
+    def describe(self, summary: RunningSummary) -> Dict[str, Any]:
+        """The window, how many rows it holds and how many rows of the dataset have been seen"""
+        return {"window": self.window.describe(), "rows": summary.rows, "rows_seen": self.rows_seen}
+
+    def _cutoff(self) -> float:
+        if self.window.rows is not None:
+            return self.rows_seen - self.window.rows
+        end = self.latest if self.window.time_column is not None else time.time()
+        return end - self.window.minutes * 60
+
+    def _expire(self, cutoff: float):
+        width = self.window.width
+        for index in [index for index in self._panes if (index + 1) * width <= cutoff]:
+            del self._panes[index]
+
+
+class DatasetTrackers:
+    """Trackers of one dataset by column set and window, kept up to date with its appended rows.
+
+    `chunks_since(row)` returns the dataset's rows from row on as Chunks,
+    and `dtypes` are the dataset's column types.
+    A tracker is built from the rows it covers when it is first asked for;
+    after that, every call folds in only the rows appended since the last
+    one. Callers serialize access, e.g. with the dataset's lock.
+    """
+
+    def __init__(self, chunks_since: Callable[[int], List[Chunk]], dtypes: pd.Series):
+        self._chunks_since = chunks_since
+        self.dtypes = dtypes
+        self._trackers: "OrderedDict[Tuple, Tracker]" = OrderedDict()
+        self.rows = 0
+
+    def numeric_columns(self, columns: Optional[List[Any]] = None) -> List[Any]:
+        """The numeric columns of the dataset, optionally restricted to columns, in dataset order"""
+        if columns:
+            missing = [column for column in columns if column not in self.dtypes.index]
+            if missing:
+                raise ValueError(f"Columns not found: {missing}")
+        numeric = [
+            column for column, dtype in self.dtypes.items()
+            if pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype)
+            and (not columns or column in columns)
+        ]
+        if not numeric:
+            raise ValueError("No numeric columns found")
+        return numeric
+
+    def tracker(self, columns: List[Any], window: Window) -> Tracker:
+        """The tracker of columns over window, caught up with every appended row"""
+        self._catch_up()
+        key = (tuple(columns), window.key)
+        tracker = self._trackers.get(key)
+        if tracker is not None:
+            self._trackers.move_to_end(key)
+            return tracker
+
+        if window.time_column is not None and window.time_column not in self.dtypes.index:
+            raise ValueError(f"Time column not found: {window.time_column}")
+        tracker = Tracker(columns, window)
+        for first_row, arrived_at, chunk in self._chunks_since(window.first_row(self.rows)):
+            tracker.update(first_row, arrived_at, chunk)
+        tracker.rows_seen = self.rows
+        self._trackers[key] = tracker
+        while len(self._trackers) > MAX_TRACKERS:
+            self._trackers.popitem(last=False)
+        return tracker
+
+    def _catch_up(self):
+        for first_row, arrived_at, chunk in self._chunks_since(self.rows):
+            for tracker in self._trackers.values():
+                tracker.update(first_row, arrived_at, chunk)
+            self.rows = first_row + len(chunk)
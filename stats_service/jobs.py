@@ -0,0 +1,436 @@
+"""
+Asynchronous jobs for long-running analyses.
+
+A job wraps one call to an existing endpoint: the request is queued on a
+broker, a runner executes it in the background and clients poll for its
+status, progress and result. Finished jobs are kept for a retention period
+and then dropped, so request latency is decoupled from computation time and
+bursts are queued instead of failing.
+
+When several server processes share a registry directory, job states and
+results are also written there (SharedJobRecords), so a job can be polled,
+fetched or cancelled through any of the processes.
+"""
+import asyncio
+import importlib
+import json
+import os
+import pickle
+import re
+import tempfile
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import deque
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+
+import progress
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+
+FINISHED_STATES = (JOB_SUCCEEDED, JOB_FAILED, JOB_CANCELLED)
+
+# Number of recent progress events kept per job
+PROGRESS_HISTORY = 20
+# Seconds between writes of a running job's progress to the shared records
+PROGRESS_SAVE_INTERVAL = 0.5
+# Seconds between checks of a running job for cancellation from another process
+CANCEL_POLL_INTERVAL = 0.5
+
+_JOB_ID = re.compile(r"[0-9a-f]{32}")
+
+
+class JobNotFoundError(KeyError):
+    """Raised when a job ID is unknown or its result has expired"""
+
+
+class JobQueueFullError(RuntimeError):
+    """Raised when the queue already holds the maximum number of pending jobs"""
+
+
+class JobBroker(ABC):
+    """Queue between job submission and the runners that execute jobs.
+
+    Messages are plain JSON-compatible dicts, so a broker backed by an
+    external or stand-in queue service can replace the in-process default.
+    """
+
+    @abstractmethod
+    async def publish(self, message: Dict[str, Any]):
+        """Queue a job message"""
+
+    @abstractmethod
+    async def consume(self) -> Dict[str, Any]:
+        """Wait for and return the next job message"""
+
+    async def close(self):
+        pass
+
+
+class InProcessBroker(JobBroker):
+    """Broker keeping messages in an asyncio queue of the serving process"""
+
+    def __init__(self):
+        self._queue: asyncio.Queue = asyncio.Queue()
+
+    async def publish(self, message: Dict[str, Any]):
+        self._queue.put_nowait(message)
+
+    async def consume(self) -> Dict[str, Any]:
+        return await self._queue.get()
+
+
+def load_broker(spec: Optional[str]) -> JobBroker:
+    """Instantiate the broker class named by a "module:Class" spec, or the in-process default"""
+    if not spec:
+        return InProcessBroker()
+    module_name, _, class_name = spec.partition(":")
+    return getattr(importlib.import_module(module_name), class_name)()
+
+
+class Job:
+    __slots__ = ("id", "endpoint", "request", "status", "created_at", "started_at", "finished_at",
+                 "expires_at", "events", "result", "error", "task")
+
+    def __init__(self, endpoint: str, request: Dict[str, Any]):
+        self.id = uuid.uuid4().hex
+        self.endpoint = endpoint
+        self.request = request
+        self.status = JOB_QUEUED
+        self.created_at = datetime.now()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self.expires_at: Optional[float] = None
+        self.events: deque = deque(maxlen=PROGRESS_HISTORY)
+        self.result: Any = None
+        self.error: Optional[Dict[str, Any]] = None
+        self.task: Optional[asyncio.Task] = None
+
+    def record_progress(self, event: Dict[str, Any]):
+        if self.status == JOB_RUNNING:
+            self.events.append({**event, "timestamp": datetime.now().isoformat()})
+
+    def finish(self, status: str, ttl: float):
+        self.status = status
+        self.finished_at = datetime.now()
+        self.expires_at = time.monotonic() + ttl
+        self.task = None
+
+    @classmethod
+    def from_record(cls, record: Dict[str, Any]) -> "Job":
+        """Snapshot of a job from its shared record, without its result"""
+        job = cls(record["endpoint"], {})
+        job.id = record["job_id"]
+        job.status = record["status"]
+        job.created_at = datetime.fromisoformat(record["created_at"])
+        job.started_at = datetime.fromisoformat(record["started_at"]) if record["started_at"] else None
+        job.finished_at = datetime.fromisoformat(record["finished_at"]) if record["finished_at"] else None
+        job.events.extend(record["events"])
+        job.error = record["error"]
+        return job
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "endpoint": self.endpoint,
+            "status": self.status,
+            "created_at": self.created_at.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "progress": self.events[-1] if self.events else None,
+            "events": list(self.events),
+            "error": self.error
+        }
+
+
+class SharedJobRecords:
+    """Job states and results kept as files in a directory shared by the server processes.
+
+    The process that accepted a job runs it and writes its record whenever it
+    changes. Other processes read the records to report on the job, and ask
+    for its cancellation by leaving a marker file that the running process
+    picks up.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def save(self, job: Job):
+        expires_at = time.time() + job.expires_at - time.monotonic() if job.expires_at is not None else None
+        record = {**job.to_dict(), "owner": os.getpid(), "expires_at": expires_at}
+        self._write(self._path(job.id, ".json"), json.dumps(record, default=str).encode())
+
+    def save_result(self, job: Job):
+        """Write a succeeded job's result; call before saving its record"""
+        self._write(self._path(job.id, ".result"), pickle.dumps(job.result, protocol=pickle.HIGHEST_PROTOCOL))
+
+    def load(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """The job's record, or None if it is unknown or has expired"""
+        if not _JOB_ID.fullmatch(job_id):
+            return None
+        try:
+            with open(self._path(job_id, ".json")) as f:
+                record = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        if record["expires_at"] is not None and record["expires_at"] <= time.time():
+            self.remove(job_id)
+            return None
+        if record["status"] not in FINISHED_STATES and not _process_alive(record["owner"]):
+            record.update(status=JOB_FAILED, finished_at=datetime.now().isoformat(),
+                          error={"status_code": 500, "detail": "The server process running the job exited"})
+        return record
+
+    def load_result(self, job_id: str) -> Any:
+        try:
+            with open(self._path(job_id, ".result"), "rb") as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            raise JobNotFoundError(job_id)
+
+    def records(self) -> List[Dict[str, Any]]:
+        """Records of all unexpired jobs, oldest first"""
+        records = []
+        for file_name in os.listdir(self.directory):
+            if file_name.endswith(".json"):
+                record = self.load(file_name[:-len(".json")])
+                if record is not None:
+                    records.append(record)
+        return sorted(records, key=lambda record: record["created_at"])
+
+    def remove(self, job_id: str):
+        for suffix in (".json", ".result", ".cancel"):
+            try:
+                os.unlink(self._path(job_id, suffix))
+            except FileNotFoundError:
+                pass
+
+    def request_cancel(self, job_id: str):
+        with open(self._path(job_id, ".cancel"), "w"):
+            pass
+
+    def cancel_requested(self, job_id: str) -> bool:
+        return os.path.exists(self._path(job_id, ".cancel"))
+
+    def _path(self, job_id: str, suffix: str) -> str:
+        return os.path.join(self.directory, job_id + suffix)
+
+    def _write(self, path: str, data: bytes):
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class JobManager:
+    """Queue, run and retain jobs that call an endpoint through `handler`.
+
+    `handler(endpoint, request)` performs the call and returns its result.
+    Settings default to the `STATS_JOB_RUNNERS` (jobs executed at once),
+    `STATS_JOB_MAX_PENDING` (queued jobs accepted), `STATS_JOB_RESULT_TTL`
+    (seconds a finished job is kept) and `STATS_JOB_BROKER` ("module:Class")
+    environment variables.
+
+    With `shared_dir`, jobs are recorded there for the other server processes
+    (see SharedJobRecords). Each process still queues and runs the jobs it
+    accepted, and keeps only those that have not finished in memory.
+    """
+
+    def __init__(self, handler: Callable[[str, Dict[str, Any]], Awaitable[Any]],
+                 broker: Optional[JobBroker] = None, runners: Optional[int] = None,
+                 max_pending: Optional[int] = None, result_ttl: Optional[float] = None,
+                 shared_dir: Optional[str] = None):
+        self.handler = handler
+        self.broker = broker or load_broker(os.environ.get("STATS_JOB_BROKER"))
+        self.runners = runners or int(os.environ.get("STATS_JOB_RUNNERS", "2"))
+        self.max_pending = max_pending or int(os.environ.get("STATS_JOB_MAX_PENDING", "1000"))
+        self.result_ttl = result_ttl if result_ttl is not None else float(os.environ.get("STATS_JOB_RESULT_TTL", "3600"))
+        self._records = SharedJobRecords(shared_dir) if shared_dir else None
+        self._jobs: Dict[str, Job] = {}
+        self._runner_tasks: List[asyncio.Task] = []
+
+    async def start(self):
+        """Start the runner tasks; calling it again is a no-op"""
+        if not self._runner_tasks:
+            self._runner_tasks = [asyncio.ensure_future(self._runner()) for _ in range(self.runners)]
+
+    async def stop(self):
+        for job in self._jobs.values():
+            if job.task is not None:
+                job.task.cancel()
+        for task in self._runner_tasks:
+            task.cancel()
+        await asyncio.gather(*self._runner_tasks, return_exceptions=True)
+        self._runner_tasks = []
+        await self.broker.close()
+
+    async def submit(self, endpoint: str, request: Dict[str, Any]) -> Job:
+        """Queue a call to endpoint and return its job"""
+        self._purge_expired()
+        if self._count(JOB_QUEUED) >= self.max_pending:
+            raise JobQueueFullError(f"Job queue is full ({self.max_pending} pending jobs)")
+        await self.start()
+        job = Job(endpoint, request)
+        self._jobs[job.id] = job
+        self._save(job)
+        await self.broker.publish({"job_id": job.id, "endpoint": endpoint, "request": request})
+        return job
+
+    def get(self, job_id: str) -> Job:
+        self._purge_expired()
+        job = self._jobs.get(job_id)
+        if job is not None:
+            return job
+        record = self._records.load(job_id) if self._records is not None else None
+        if record is None:
+            raise JobNotFoundError(job_id)
+        return Job.from_record(record)
+
+    def result(self, job: Job) -> Any:
+        """The result of a succeeded job, which another process may have produced"""
+        if self._records is None or job.id in self._jobs:
+            return job.result
+        return self._records.load_result(job.id)
+
+    def list(self) -> List[Dict[str, Any]]:
+        self._purge_expired()
+        if self._records is not None:
+            return [Job.from_record(record).to_dict() for record in self._records.records()]
+        return [job.to_dict() for job in self._jobs.values()]
+
+    def cancel(self, job_id: str) -> Job:
+        """Cancel a queued or running job, or discard a finished one.
+
+        A job running in another server process is cancelled by that process
+        within CANCEL_POLL_INTERVAL seconds, so it is returned still pending.
+        """
+        job = self.get(job_id)
+        if job.id not in self._jobs:
+            if job.status in FINISHED_STATES:
+                self._records.remove(job.id)
+            else:
+                self._records.request_cancel(job.id)
+        elif job.status == JOB_QUEUED:
+            self._finish(job, JOB_CANCELLED)
+        elif job.status == JOB_RUNNING:
+            job.task.cancel()
+        else:
+            del self._jobs[job_id]
+        return job
+
+    def status(self) -> Dict[str, Any]:
+        self._purge_expired()
+        states = (JOB_QUEUED, JOB_RUNNING) + FINISHED_STATES
+        if self._records is not None:
+            records = self._records.records()
+            counts = {state: sum(1 for record in records if record["status"] == state) for state in states}
+        else:
+            counts = {state: self._count(state) for state in states}
+        return {
+            "runners": self.runners,
+            "max_pending": self.max_pending,
+            "result_ttl_seconds": self.result_ttl,
+            "broker": type(self.broker).__name__,
+            "shared": self._records is not None,
+            "jobs": counts
+        }
+
+    def _count(self, state: str) -> int:
+        return sum(1 for job in self._jobs.values() if job.status == state)
+
+    def _save(self, job: Job):
+        if self._records is not None:
+            self._records.save(job)
+
+    def _finish(self, job: Job, status: str):
+        job.finish(status, self.result_ttl)
+        if self._records is not None:
+            if status == JOB_SUCCEEDED:
+                try:
+                    self._records.save_result(job)
+                except (pickle.PicklingError, TypeError, AttributeError) as e:
+                    job.status, job.result = JOB_FAILED, None
+                    job.error = {"status_code": 500, "detail": f"Job result cannot be shared: {e}"}
+            self._records.save(job)
+            # The shared record now answers for the job
+            self._jobs.pop(job.id, None)
+
+    def _record_progress(self, job: Job, saved: List[float], event: Dict[str, Any]):
+        job.record_progress(event)
+        if self._records is not None and job.status == JOB_RUNNING:
+            now = time.monotonic()
+            if now - saved[0] >= PROGRESS_SAVE_INTERVAL:
+                saved[0] = now
+                self._records.save(job)
+
+    def _purge_expired(self):
+        now = time.monotonic()
+        expired = [job_id for job_id, job in self._jobs.items() if job.expires_at is not None and job.expires_at <= now]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    async def _runner(self):
+        while True:
+            message = await self.broker.consume()
+            job = self._jobs.get(message["job_id"])
+            if job is not None and job.status == JOB_QUEUED and self._records is not None \
+                    and self._records.cancel_requested(job.id):
+                self._finish(job, JOB_CANCELLED)
+            # Jobs cancelled while queued are skipped
+            if job is not None and job.status == JOB_QUEUED:
+                await self._run(job)
+            self._purge_expired()
+
+    async def _run(self, job: Job):
+        loop = asyncio.get_running_loop()
+        job.status = JOB_RUNNING
+        job.started_at = datetime.now()
+        self._save(job)
+        saved = [time.monotonic()]
+
+        # Worker threads and the progress forwarder call the listener off the loop
+        def listener(event: Dict[str, Any]):
+            loop.call_soon_threadsafe(self._record_progress, job, saved, event)
+
+        with progress.listen(listener):
+            job.task = asyncio.ensure_future(self.handler(job.endpoint, job.request))
+        task = job.task
+        while not task.done():
+            await asyncio.wait({task}, timeout=CANCEL_POLL_INTERVAL if self._records is not None else None)
+            if not task.done() and self._records is not None and self._records.cancel_requested(job.id):
+                task.cancel()
+
+        if task.cancelled():
+            self._finish(job, JOB_CANCELLED)
+            return
+        error = task.exception()
+        if error is None and isinstance(task.result(), StreamingResponse):
+            error = HTTPException(status_code=400, detail="Streaming responses cannot be run as jobs")
+        if error is None:
+            job.result = task.result()
+            self._finish(job, JOB_SUCCEEDED)
+        elif isinstance(error, HTTPException):
+            job.error = {"status_code": error.status_code, "detail": error.detail}
+            self._finish(job, JOB_FAILED)
+        else:
+            job.error = {"status_code": 500, "detail": str(error)}
+            self._finish(job, JOB_FAILED)
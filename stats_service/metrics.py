@@ -0,0 +1,282 @@
+"""
+Per-request latency, size and memory metrics in Prometheus text format.
+
+`MetricsMiddleware` times every request and counts its request and response
+bytes. Within a request, the time spent in each phase is accumulated with
+`phase()`:
+
+- parse: reading, decompressing and parsing the body and validating it
+- frame: building the DataFrame from the body or fetching it by handle
+- compute: analyses on the worker pools
+- render: plots on the plot pool
+- serialize: encoding the response
+
+Histograms are labelled by route template (e.g. `/datasets/{dataset_id}`),
+so the number of series stays bounded. The phases can also be returned in a
+`Server-Timing` header, enabled by `STATS_SERVER_TIMING=1`.
+"""
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+SERVER_TIMING_ENABLED = os.environ.get("STATS_SERVER_TIMING", "0") not in ("0", "false", "no", "")
+
+PHASES = ("parse", "frame", "compute", "render", "serialize")
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+BYTE_BUCKETS = tuple(float(4 ** power) for power in range(5, 16))  # 1 KiB to 1 GiB
+COUNT_BUCKETS = (1.0, 10.0, 100.0, 1e3, 1e4, 1e5, 1e6, 1e7, 1e8)
+
+# Label value of requests that matched no route
+UNMATCHED_ENDPOINT = "unmatched"
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _format_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, labels: Labels, amount: float = 1.0):
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(labels)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, buckets: Sequence[float]):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self._values: Dict[Labels, List[float]] = {}
+
+    def observe(self, labels: Labels, value: float):
+        # Per-bucket counts followed by the sum and the total count
+        state = self._values.get(labels)
+        if state is None:
+            state = self._values[labels] = [0.0] * (len(self.buckets) + 2)
+        index = bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            state[index] += 1
+        state[-2] += value
+        state[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labels, state in sorted(self._values.items()):
+            cumulative = 0.0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(labels, ('le', _format_value(bound)))} "
+                             f"{_format_value(cumulative)}")
+            lines.append(f"{self.name}_bucket{_format_labels(labels, ('le', '+Inf'))} {_format_value(state[-1])}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {repr(float(state[-2]))}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {_format_value(state[-1])}")
+        return lines
+
+
+def format_gauge(name: str, documentation: str, samples: Dict[Labels, float]) -> List[str]:
+    """Render gauge samples taken at scrape time"""
+    lines = [f"# HELP {name} {documentation}", f"# TYPE {name} gauge"]
+    for labels, value in sorted(samples.items()):
+        lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+    return lines
+
+
+def peak_rss_bytes() -> Optional[int]:
+    """Peak resident set size of this process"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak if os.uname().sysname == "Darwin" else peak * 1024
+
+
+def rss_bytes() -> Optional[int]:
+    """Current resident set size of this process, where /proc is available"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class RequestMetrics:
+    """Phase timings and dataset size of one request"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+        self.rows: Optional[int] = None
+        self.columns: Optional[int] = None
+        self.worker_peak_rss_delta = 0
+
+    def add(self, name: str, seconds: float):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def server_timing(self) -> str:
+        entries = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in self.phases.items()]
+        entries.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.2f}")
+        return ", ".join(entries)
+
+
+_current: ContextVar[Optional[RequestMetrics]] = ContextVar("request_metrics", default=None)
+
+
+def current() -> Optional[RequestMetrics]:
+    return _current.get()
+
+
+@contextmanager
+def phase(name: str) -> Iterator[None]:
+    """Add the time spent in this block to the current request's phase"""
+    request = _current.get()
+    if request is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        request.add(name, time.perf_counter() - started)
+
+
+def endpoint_started():
+    """Record everything since the request started, other than building the frame, as parsing"""
+    request = _current.get()
+    if request is not None and "parse" not in request.phases:
+        elapsed = time.perf_counter() - request.started
+        request.add("parse", max(elapsed - request.phases.get("frame", 0.0), 0.0))
+
+
+def record_frame(df) -> None:
+    """Record the shape of the dataset the current request operates on"""
+    request = _current.get()
+    if request is not None:
+        request.rows, request.columns = df.shape
+
+
+def record_worker_peak(delta: int):
+    request = _current.get()
+    if request is not None:
+        request.worker_peak_rss_delta = max(request.worker_peak_rss_delta, delta)
+
+
+def measure_task(call: Callable[[], Any]) -> Tuple[Any, int]:
+    """Run call in a worker process and return (result, growth of the worker's peak RSS)"""
+    before = peak_rss_bytes() or 0
+    result = call()
+    return result, (peak_rss_bytes() or 0) - before
+
+
+class MetricsRegistry:
+    """Request metrics aggregated over the life of the process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = Counter("stats_requests_total", "Requests by endpoint, method and status")
+        self.duration = Histogram("stats_request_duration_seconds", "Request latency", LATENCY_BUCKETS)
+        self.phases = Histogram("stats_request_phase_seconds", "Time per request phase", LATENCY_BUCKETS)
+        self.request_bytes = Histogram("stats_request_bytes", "Request body size as received", BYTE_BUCKETS)
+        self.response_bytes = Histogram("stats_response_bytes", "Response body size as sent", BYTE_BUCKETS)
+        self.rows = Histogram("stats_request_rows", "Rows in the request's dataset", COUNT_BUCKETS)
+        self.columns = Histogram("stats_request_columns", "Columns in the request's dataset", COUNT_BUCKETS)
+        self.peak_rss = Histogram("stats_request_peak_rss_delta_bytes",
+                                  "Growth of peak resident memory during the request", BYTE_BUCKETS)
+
+    def observe(self, endpoint: str, method: str, status: int, request: RequestMetrics,
+                received: int, sent: int, server_peak_delta: int):
+        labels = (("endpoint", endpoint),)
+        with self._lock:
+            self.requests.inc(labels + (("method", method), ("status", str(status))))
+            self.duration.observe(labels, time.perf_counter() - request.started)
+            for name, seconds in request.phases.items():
+                self.phases.observe(labels + (("phase", name),), seconds)
+            self.request_bytes.observe(labels, received)
+            self.response_bytes.observe(labels, sent)
+            if request.rows is not None:
+                self.rows.observe(labels, request.rows)
+                self.columns.observe(labels, request.columns)
+            self.peak_rss.observe(labels + (("process", "server"),), server_peak_delta)
+            if request.worker_peak_rss_delta:
+                self.peak_rss.observe(labels + (("process", "worker"),), request.worker_peak_rss_delta)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            lines = []
+            for metric in (self.requests, self.duration, self.phases, self.request_bytes, self.response_bytes,
+                           self.rows, self.columns, self.peak_rss):
+                lines.extend(metric.render())
+        return lines
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording every HTTP request into a MetricsRegistry"""
+
+    def __init__(self, app, registry: MetricsRegistry, server_timing: Optional[bool] = None):
+        self.app = app
+        self.registry = registry
+        self.server_timing = SERVER_TIMING_ENABLED if server_timing is None else server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request = RequestMetrics()
+        token = _current.set(request)
+        peak_before = peak_rss_bytes() or 0
+        counts = {"received": 0, "sent": 0, "status": 500}
+
+        async def counting_receive():
+            message = await receive()
+            if message["type"] == "http.request":
+                counts["received"] += len(message.get("body", b""))
+            return message
+
+        async def timed_send(message):
+            if message["type"] == "http.response.start":
+                counts["status"] = message["status"]
+                if self.server_timing:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", request.server_timing().encode("latin-1")))
+                    message = {**message, "headers": headers}
+            elif message["type"] == "http.response.body":
+                counts["sent"] += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, counting_receive, timed_send)
+        finally:
+            _current.reset(token)
+            route = scope.get("route")
+            endpoint = getattr(route, "path", None) or UNMATCHED_ENDPOINT
+            self.registry.observe(
+                endpoint, scope.get("method", ""), counts["status"], request,
+                counts["received"], counts["sent"], (peak_rss_bytes() or 0) - peak_before
+            )
@@ -0,0 +1,100 @@
+"""
+Workflow DAGs executed within a single request.
+
+A pipeline is a list of steps, each applying one of the service's operations
+to the output of another step or to the request's dataset. Intermediate
+DataFrames are handed from step to step in memory instead of being
+serialized between calls. Each step starts as soon as its input is ready, so
+independent branches run concurrently, and only the steps that the
+requested outputs depend on are run.
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+# Name by which steps refer to the request's dataset
+PIPELINE_INPUT = "input"
+
+
+class PipelineError(ValueError):
+    """Raised for a malformed pipeline graph (reported as 400)"""
+
+
+class StepFailedError(Exception):
+    """Wraps the exception raised by a step, recording which step failed"""
+
+    def __init__(self, step_id: str, error: BaseException):
+        super().__init__(f"Step '{step_id}' failed: {error}")
+        self.step_id = step_id
+        self.error = error
+
+
+def plan(steps: Sequence[Tuple[str, Optional[str]]],
+         outputs: Optional[List[str]] = None) -> Tuple[Dict[str, str], List[str], List[str]]:
+    """Resolve each step's input and the steps needed for the outputs.
+
+    steps are (step_id, input) pairs in order. A missing input means the
+    previous step, or the request's dataset for the first step. Inputs must
+    name an earlier step, which rules out cycles. Without outputs, every
+    step that no other step reads from is an output.
+
+    Returns (inputs by step, steps to run in order, outputs).
+    """
+    inputs: Dict[str, str] = {}
+    previous = PIPELINE_INPUT
+    for step_id, source in steps:
+        if step_id == PIPELINE_INPUT or step_id in inputs:
+            raise PipelineError(f"Duplicate or reserved step id: {step_id}")
+        source = source or previous
+        if source != PIPELINE_INPUT and source not in inputs:
+            raise PipelineError(f"Step '{step_id}' reads from unknown or later step: {source}")
+        inputs[step_id] = source
+        previous = step_id
+
+    if not inputs:
+        raise PipelineError("Pipeline has no steps")
+    if outputs is None:
+        consumed = set(inputs.values())
+        outputs = [step_id for step_id in inputs if step_id not in consumed]
+    unknown = [step_id for step_id in outputs if step_id not in inputs]
+    if unknown:
+        raise PipelineError(f"Unknown output steps: {unknown}")
+
+    needed = set()
+    for step_id in outputs:
+        while step_id != PIPELINE_INPUT and step_id not in needed:
+            needed.add(step_id)
+            step_id = inputs[step_id]
+    return inputs, [step_id for step_id in inputs if step_id in needed], list(outputs)
+
+
+async def execute(inputs: Dict[str, str], order: List[str], source: Any,
+                  run_step: Callable[[str, Any], Awaitable[Any]]) -> Dict[str, Any]:
+    """Run the steps in order as concurrent tasks and return every step's result.
+
+    run_step(step_id, input_value) receives the result of the step's input
+    (source for the request's dataset). The first failure cancels the
+    remaining steps and is raised as StepFailedError.
+    """
+    tasks: Dict[str, asyncio.Task] = {}
+
+    async def run(step_id: str) -> Any:
+        upstream = inputs[step_id]
+        value = source if upstream == PIPELINE_INPUT else await tasks[upstream]
+        try:
+            return await run_step(step_id, value)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            raise StepFailedError(step_id, e) from e
+
+    for step_id in order:
+        tasks[step_id] = asyncio.ensure_future(run(step_id))
+    try:
+        # Steps reading from a failed step re-raise its error, so the first error is the root cause
+        await asyncio.gather(*tasks.values())
+    except BaseException:
+        for task in tasks.values():
+            task.cancel()
+        await asyncio.gather(*tasks.values(), return_exceptions=True)
+        raise
+    return {step_id: task.result() for step_id, task in tasks.items()}
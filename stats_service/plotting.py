@@ -0,0 +1,494 @@
+"""
+Plot rendering for the visualization endpoints.
+
+Plots are drawn with matplotlib's object-oriented API on the Agg backend
+instead of pyplot's global state, and each thread keeps one Figure that is
+cleared and reused between plots. Besides the base64 PNG the endpoints have
+always returned, a plot can be rendered as raw PNG, WebP or SVG bytes, or
+described as a Vega-Lite spec for client-side rendering without drawing
+anything. Large scatter plots and line charts are reduced first (see
+reduction.py) so rendering cost follows the picture size, not the row count.
+matplotlib and seaborn are imported when the first figure is created, so
+importing this module does not load them.
+"""
+from typing import TYPE_CHECKING, Any, Dict, List, Tuple
+import base64
+import io
+import threading
+
+import numpy as np
+import pandas as pd
+
+from analyses import AnalysisInputError
+from reduction import density_grid, linear_trend, lttb_indices, minmax_indices
+
+if TYPE_CHECKING:
+    from matplotlib.figure import Figure
+
+DEFAULT_FORMAT = "png_base64"
+IMAGE_MEDIA_TYPES = {
+    "png": "image/png",
+    "webp": "image/webp",
+    "svg": "image/svg+xml",
+}
+PLOT_FORMATS = (DEFAULT_FORMAT, "spec") + tuple(IMAGE_MEDIA_TYPES)
+DEFAULT_DPI = 150
+VEGA_LITE_SCHEMA = "https://vega.github.io/schema/vega-lite/v5.json"
+
+# Above these row counts scatter plots become density grids and line charts
+# are downsampled, unless options.reduction is "none"
+SCATTER_MAX_POINTS = 50000
+LINE_MAX_POINTS = 5000
+DEFAULT_GRIDSIZE = 80
+
+_local = threading.local()
+_setup_lock = threading.Lock()
+_Figure = None
+
+
+def _setup():
+    """Import matplotlib and apply the global style, once per process"""
+    global _Figure
+    with _setup_lock:
+        if _Figure is None:
+            import matplotlib
+            matplotlib.use("Agg")
+            import seaborn as sns
+            from matplotlib.figure import Figure
+
+            matplotlib.style.use('seaborn-v0_8')
+            sns.set_palette("husl")
+            _Figure = Figure
+
+
+def warm_up():
+    """Render a throwaway figure so fonts and the Agg canvas are loaded before the first request"""
+    fig = _figure((4, 3))
+    fig.add_subplot().plot([0, 1], [0, 1])
+    fig.savefig(io.BytesIO(), format="png")
+    fig.clear()
+
+
+def _figure(figsize: Tuple[float, float]) -> "Figure":
+    """Return this thread's reusable Figure, cleared and resized"""
+    fig = getattr(_local, "figure", None)
+    if fig is None:
+        if _Figure is None:
+            _setup()
+        fig = _local.figure = _Figure()
+    fig.clear()
+    fig.set_size_inches(figsize)
+    return fig
+
+
+def plot_format(options: Dict[str, Any]) -> str:
+    fmt = options.get('format', DEFAULT_FORMAT)
+    if fmt not in PLOT_FORMATS:
+        raise AnalysisInputError(f"Unsupported plot format: {fmt}")
+    return fmt
+
+
+def _figsize(options: Dict[str, Any], default: Tuple[float, float]) -> Tuple[float, float]:
+    return float(options.get('width', default[0])), float(options.get('height', default[1]))
+
+
+def render_figure(fig: "Figure", options: Dict[str, Any]) -> Dict[str, Any]:
+    """Render fig in the requested format as payload fields, then clear it for reuse"""
+    fmt = plot_format(options)
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png' if fmt == DEFAULT_FORMAT else fmt,
+                dpi=float(options.get('dpi', DEFAULT_DPI)), bbox_inches='tight')
+    fig.clear()
+    if fmt == DEFAULT_FORMAT:
+        return {"image_data": base64.b64encode(buffer.getvalue()).decode()}
+    return {"image": buffer.getvalue(), "media_type": IMAGE_MEDIA_TYPES[fmt]}
+
+
+def _vega_lite(options: Dict[str, Any], default_size: Tuple[float, float], title: str,
+               values: List[Dict[str, Any]], **spec: Any) -> Dict[str, Any]:
+    width, height = _figsize(options, default_size)
+    return {
+        "spec": {
+            "$schema": VEGA_LITE_SCHEMA,
+            "title": title,
+            # Figure inches at 72 points per inch
+            "width": int(width * 72),
+            "height": int(height * 72),
+            "data": {"values": values},
+            **spec
+        }
+    }
+
+
+def _field_type(series: pd.Series) -> str:
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return "temporal"
+    if pd.api.types.is_numeric_dtype(series):
+        return "quantitative"
+    return "ordinal"
+
+
+def _records(df: pd.DataFrame) -> List[Dict[str, Any]]:
+    return df.replace({np.nan: None}).to_dict('records')
+
+
+def _reduction(options: Dict[str, Any], methods: Tuple[str, ...], n_points: int, default_max: int,
+               applicable: bool) -> str:
+    """Resolve options.reduction ("auto", "none" or a method) for n_points rows"""
+    method = options.get('reduction', 'auto')
+    if method not in ('auto', 'none') + methods:
+        raise AnalysisInputError(f"Unsupported reduction: {method}")
+    if method == 'auto':
+        return methods[0] if applicable and n_points > int(options.get('max_points', default_max)) else 'none'
+    if method != 'none' and not applicable:
+        raise AnalysisInputError(f"Reduction {method} requires numeric columns")
+    return method
+
+
+def _include_reduced_data(options: Dict[str, Any]) -> bool:
+    # Specs already embed the reduced data, and raw image formats carry the
+    # payload in a header that is too small for bins
+    return plot_format(options) == DEFAULT_FORMAT
+
+
+def scatter_plot(df: pd.DataFrame, options: Dict[str, Any]) -> Dict[str, Any]:
+    x_col = options.get('x_column')
+    y_col = options.get('y_column')
+
+    if not x_col or not y_col:
+        raise AnalysisInputError("x_column and y_column required")
+
+    x_label = options.get('x_label', x_col)
+    y_label = options.get('y_label', y_col)
+    title = options.get('title', f'{y_col} vs {x_col}')
+    fmt = plot_format(options)
+
+    numeric = pd.api.types.is_numeric_dtype(df[x_col]) and pd.api.types.is_numeric_dtype(df[y_col])
+    method = _reduction(options, ('hexbin', 'hist2d'), len(df), SCATTER_MAX_POINTS, numeric)
+    if method == 'hexbin' and fmt == "spec":
+        # Vega-Lite has no hexagonal marks
+        method = 'hist2d'
+
+    if method != 'none':
+        pairs = df[[x_col, y_col]].dropna()
+        x = pairs[x_col].to_numpy(dtype=float)
+        y = pairs[y_col].to_numpy(dtype=float)
+        gridsize = int(options.get('gridsize', DEFAULT_GRIDSIZE))
+        reduction = {"method": method, "original_points": len(df), "gridsize": gridsize}
+
+        if method == 'hist2d':
+            counts, x_edges, y_edges = density_grid(x, y, gridsize)
+            cells = np.argwhere(counts > 0)
+            if _include_reduced_data(options):
+                reduction["data"] = {
+                    "x_edges": x_edges.tolist(),
+                    "y_edges": y_edges.tolist(),
+                    "cells": [[int(i), int(j), int(counts[i, j])] for i, j in cells]
+                }
+            if fmt == "spec":
+                values = [
+                    {"x_start": x_edges[i], "x_end": x_edges[i + 1], "y_start": y_edges[j],
+                     "y_end": y_edges[j + 1], "count": int(counts[i, j])}
+                    for i, j in cells
+                ]
+                return {"success": True, **_vega_lite(
+                    options, (10, 6), title, values,
+                    mark="rect",
+                    encoding={
+                        "x": {"field": "x_start", "type": "quantitative", "title": x_label},
+                        "x2": {"field": "x_end"},
+                        "y": {"field": "y_start", "type": "quantitative", "title": y_label},
+                        "y2": {"field": "y_end"},
+                        "color": {"field": "count", "type": "quantitative", "scale": {"scheme": "viridis"}}
+                    }
+                ), "reduction": reduction}
+
+        fig = _figure(_figsize(options, (10, 6)))
+        ax = fig.add_subplot()
+
+        # Density instead of individual points, so the cost follows the grid size
+        if method == 'hexbin':
+            collection = ax.hexbin(x, y, gridsize=gridsize, mincnt=1, cmap='viridis')
+            if _include_reduced_data(options):
+                centers = collection.get_offsets()
+                reduction["data"] = {
+                    "x": centers[:, 0].tolist(),
+                    "y": centers[:, 1].tolist(),
+                    "counts": collection.get_array().astype(int).tolist()
+                }
+        else:
+            collection = ax.pcolormesh(x_edges, y_edges, np.ma.masked_equal(counts, 0).T, cmap='viridis')
+        fig.colorbar(collection, ax=ax, label='Points')
+
+        # Add trend line
+        slope, intercept = linear_trend(x, y)
+        x_range = np.array([x.min(), x.max()])
+        ax.plot(x_range, slope * x_range + intercept, "r--", alpha=0.8)
+
+        ax.set_xlabel(x_label)
+        ax.set_ylabel(y_label)
+        ax.set_title(title)
+        ax.grid(True, alpha=0.3)
+
+        return {
+            "success": True,
+            **render_figure(fig, options),
+            "reduction": reduction
+        }
+
+    if fmt == "spec":
+        encoding = {
+            "x": {"field": x_col, "type": _field_type(df[x_col]), "title": x_label},
+            "y": {"field": y_col, "type": _field_type(df[y_col]), "title": y_label}
+        }
+        return {"success": True, **_vega_lite(options, (10, 6), title, _records(df[[x_col, y_col]]), layer=[
+            {"mark": {"type": "point", "filled": True, "opacity": 0.6}, "encoding": encoding},
+            {
+                "mark": {"type": "line", "color": "red", "strokeDash": [4, 4], "opacity": 0.8},
+                "transform": [{"regression": y_col, "on": x_col}],
+                "encoding": encoding
+            }
+        ])}
+
+    fig = _figure(_figsize(options, (10, 6)))
+    ax = fig.add_subplot()
+
+    # Create scatter plot
+    ax.scatter(df[x_col], df[y_col], alpha=0.6)
+
+    # Add trend line
+    z = np.polyfit(df[x_col], df[y_col], 1)
+    p = np.poly1d(z)
+    ax.plot(df[x_col], p(df[x_col]), "r--", alpha=0.8)
+
+    ax.set_xlabel(x_label)
+    ax.set_ylabel(y_label)
+    ax.set_title(title)
+    ax.grid(True, alpha=0.3)
+
+    return {
+        "success": True,
+        **render_figure(fig, options)
+    }
+
+
+def histogram(df: pd.DataFrame, options: Dict[str, Any]) -> Dict[str, Any]:
+    column = options.get('column')
+    if not column:
+        raise AnalysisInputError("column required")
+
+    x_label = options.get('x_label', column)
+    title = options.get('title', f'Distribution of {column}')
+
+    if plot_format(options) == "spec":
+        n, bins = np.histogram(df[column].dropna(), bins=options.get('bins', 30))
+        values = [
+            {"bin_start": float(start), "bin_end": float(end), "frequency": int(count)}
+            for start, end, count in zip(bins[:-1], bins[1:], n)
+        ]
+        return {
+            "success": True,
+            **_vega_lite(
+                options, (10, 6), title, values,
+                mark={"type": "bar", "opacity": 0.7, "stroke": "black"},
+                encoding={
+                    "x": {"field": "bin_start", "type": "quantitative", "bin": {"binned": True}, "title": x_label},
+                    "x2": {"field": "bin_end"},
+                    "y": {"field": "frequency", "type": "quantitative", "title": "Frequency"}
+                }
+            ),
+            "bins": bins.tolist(),
+            "frequencies": n.astype(float).tolist()
+        }
+
+    fig = _figure(_figsize(options, (10, 6)))
+    ax = fig.add_subplot()
+
+    # Create histogram
+    n, bins, patches = ax.hist(df[column].dropna(), bins=options.get('bins', 30),
+                              alpha=0.7, edgecolor='black')
+
+    ax.set_xlabel(x_label)
+    ax.set_ylabel('Frequency')
+    ax.set_title(title)
+    ax.grid(True, alpha=0.3)
+
+    return {
+        "success": True,
+        **render_figure(fig, options),
+        "bins": bins.tolist(),
+        "frequencies": n.tolist()
+    }
+
+
+def box_plot(df: pd.DataFrame, options: Dict[str, Any]) -> Dict[str, Any]:
+    columns = options.get('columns', df.select_dtypes(include=[np.number]).columns.tolist())
+    title = options.get('title', 'Box Plot')
+
+    # Calculate statistics
+    statistics = {}
+    for col in columns:
+        data_col = df[col].dropna()
+        statistics[col] = {
+            'mean': data_col.mean(),
+            'median': data_col.median(),
+            'q1': data_col.quantile(0.25),
+            'q3': data_col.quantile(0.75),
+            'min': data_col.min(),
+            'max': data_col.max()
+        }
+
+    if plot_format(options) == "spec":
+        values = [{"column": col, **{k: float(v) for k, v in s.items()}} for col, s in statistics.items()]
+        x = {"field": "column", "type": "nominal", "title": None, "sort": None}
+        return {
+            "success": True,
+            **_vega_lite(options, (10, 6), title, values, layer=[
+                {"mark": "rule", "encoding": {
+                    "x": x, "y": {"field": "min", "type": "quantitative", "title": "Value"}, "y2": {"field": "max"}
+                }},
+                {"mark": {"type": "bar", "size": 30}, "encoding": {
+                    "x": x, "y": {"field": "q1", "type": "quantitative"}, "y2": {"field": "q3"},
+                    "color": {"field": "column", "type": "nominal", "legend": None}
+                }},
+                {"mark": {"type": "tick", "color": "black", "size": 30}, "encoding": {
+                    "x": x, "y": {"field": "median", "type": "quantitative"}
+                }}
+            ]),
+            "statistics": statistics
+        }
+
+    fig = _figure(_figsize(options, (10, 6)))
+    ax = fig.add_subplot()
+
+    # Create box plot
+    data_for_box = [df[col].dropna() for col in columns]
+    ax.boxplot(data_for_box, tick_labels=columns, patch_artist=True)
+
+    ax.set_ylabel('Value')
+    ax.set_title(title)
+    ax.grid(True, alpha=0.3)
+
+    return {
+        "success": True,
+        **render_figure(fig, options),
+        "statistics": statistics
+    }
+
+
+def heatmap(df: pd.DataFrame, options: Dict[str, Any]) -> Dict[str, Any]:
+    columns = options.get('columns', df.select_dtypes(include=[np.number]).columns.tolist())
+    corr_matrix = df[columns].corr()
+    title = options.get('title', 'Correlation Heatmap')
+
+    if plot_format(options) == "spec":
+        values = [
+            {"row": str(row), "column": str(col), "correlation": None if pd.isna(value) else float(value)}
+            for row, series in corr_matrix.iterrows() for col, value in series.items()
+        ]
+        axis = {"type": "nominal", "sort": None, "title": None}
+        return {
+            "success": True,
+            **_vega_lite(options, (12, 10), title, values,
+                         encoding={"x": {"field": "column", **axis}, "y": {"field": "row", **axis}},
+                         layer=[
+                             {"mark": "rect", "encoding": {"color": {
+                                 "field": "correlation", "type": "quantitative",
+                                 "scale": {"scheme": "redblue", "domain": [-1, 1], "reverse": True}
+                             }}},
+                             {"mark": "text", "encoding": {"text": {
+                                 "field": "correlation", "type": "quantitative", "format": ".2f"
+                             }}}
+                         ]),
+            "correlation_matrix": corr_matrix.to_dict()
+        }
+
+    fig = _figure(_figsize(options, (12, 10)))
+    ax = fig.add_subplot()
+
+    # Create heatmap
+    import seaborn as sns
+    sns.heatmap(corr_matrix, annot=True, cmap='coolwarm', center=0,
+               square=True, ax=ax, cbar_kws={'shrink': 0.8})
+
+    ax.set_title(title)
+
+    return {
+        "success": True,
+        **render_figure(fig, options),
+        "correlation_matrix": corr_matrix.to_dict()
+    }
+
+
+def _position_values(series: pd.Series) -> np.ndarray:
+    """Numeric x positions for downsampling: values, seconds for dates, row order otherwise"""
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return (series - series.min()).dt.total_seconds().to_numpy(dtype=float, na_value=np.nan)
+    if pd.api.types.is_numeric_dtype(series):
+        return series.to_numpy(dtype=float, na_value=np.nan)
+    return np.arange(len(series), dtype=float)
+
+
+def line_chart(df: pd.DataFrame, options: Dict[str, Any]) -> Dict[str, Any]:
+    x_col = options.get('x_column')
+    y_col = options.get('y_column')
+
+    if not x_col or not y_col:
+        raise AnalysisInputError("x_column and y_column required")
+
+    x_label = options.get('x_label', x_col)
+    y_label = options.get('y_label', y_col)
+    title = options.get('title', f'{y_col} over {x_col}')
+
+    # Sort by x column for proper line plotting
+    df_sorted = df.sort_values(x_col)
+
+    method = _reduction(options, ('lttb', 'minmax'), len(df_sorted), LINE_MAX_POINTS,
+                        pd.api.types.is_numeric_dtype(df[y_col]))
+    reduction = None
+    if method != 'none':
+        x = _position_values(df_sorted[x_col])
+        y = df_sorted[y_col].to_numpy(dtype=float, na_value=np.nan)
+        valid = np.flatnonzero(~(np.isnan(x) | np.isnan(y)))
+        max_points = int(options.get('max_points', LINE_MAX_POINTS))
+        if method == 'lttb':
+            kept = lttb_indices(x[valid], y[valid], max_points)
+        else:
+            kept = minmax_indices(y[valid], max_points)
+        df_sorted = df_sorted.iloc[valid[kept]]
+        reduction = {"method": method, "original_points": len(df), "points": len(df_sorted)}
+        if _include_reduced_data(options):
+            reduction["data"] = {
+                "x": df_sorted[x_col].tolist(),
+                "y": df_sorted[y_col].tolist()
+            }
+
+    if plot_format(options) == "spec":
+        payload = {"success": True, **_vega_lite(
+            options, (10, 6), title, _records(df_sorted[[x_col, y_col]]),
+            mark={"type": "line", "point": True, "strokeWidth": 2},
+            encoding={
+                "x": {"field": x_col, "type": _field_type(df[x_col]), "title": x_label},
+                "y": {"field": y_col, "type": _field_type(df[y_col]), "title": y_label}
+            }
+        )}
+    else:
+        fig = _figure(_figsize(options, (10, 6)))
+        ax = fig.add_subplot()
+
+        # Create line plot
+        ax.plot(df_sorted[x_col], df_sorted[y_col], marker='o', linewidth=2, markersize=4)
+
+        ax.set_xlabel(x_label)
+        ax.set_ylabel(y_label)
+        ax.set_title(title)
+        ax.grid(True, alpha=0.3)
+
+        payload = {
+            "success": True,
+            **render_figure(fig, options)
+        }
+
+    if reduction is not None:
+        payload["reduction"] = reduction
+    return payload
@@ -0,0 +1,484 @@
+"""
+Opt-in CPU and allocation profiling of individual requests.
+
+A request sent with `X-Stats-Profile: cpu` or `alloc` (or the `profile`
+query parameter) and a valid `X-Stats-Profile-Token` runs under cProfile or
+tracemalloc, both in the server and in the worker processes that execute its
+tasks. The merged profile is stored for retrieval under the ID returned in
+the `X-Stats-Profile-Id` response header. Profiling is privileged: it is
+refused unless `STATS_PROFILE_TOKEN` is set, and one request per process is
+profiled at a time.
+
+Separately, `STATS_PROFILE_SAMPLE_HZ` enables a service-wide sampling
+profiler that records the stacks of busy request handlers and worker tasks
+that many times per second, aggregated as collapsed stacks.
+
+Without either, the only cost per request is a header lookup.
+"""
+import cProfile
+import hmac
+import marshal
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+PROFILE_MODES = ('cpu', 'alloc')
+PROFILE_HEADER = "X-Stats-Profile"
+PROFILE_TOKEN_HEADER = "X-Stats-Profile-Token"
+PROFILE_ID_HEADER = "X-Stats-Profile-Id"
+
+PROFILE_TOKEN = os.environ.get("STATS_PROFILE_TOKEN") or None
+MAX_PROFILES = int(os.environ.get("STATS_PROFILE_MAX", "50"))
+SAMPLE_HZ = float(os.environ.get("STATS_PROFILE_SAMPLE_HZ", "0"))
+
+DEFAULT_TOP = 30
+# Distinct stacks kept by the sampler; rarer stacks beyond this are counted together
+MAX_SAMPLED_STACKS = 20000
+OVERFLOW_STACK = "[other]"
+# Allocation sites returned per worker task
+TASK_ALLOCATION_SITES = 200
+
+_current: ContextVar[Optional["RequestProfile"]] = ContextVar("request_profile", default=None)
+# cProfile and tracemalloc hooks are per process, so requests are profiled one at a time
+_profiling_lock = threading.Lock()
+
+
+class ProfilingUnavailableError(RuntimeError):
+    """Raised when a profiler cannot start because another one is active"""
+
+
+def authorized(token: Optional[str]) -> bool:
+    return PROFILE_TOKEN is not None and token is not None and hmac.compare_digest(token, PROFILE_TOKEN)
+
+
+def current() -> Optional["RequestProfile"]:
+    return _current.get()
+
+
+def _merge_stats(target: Dict[tuple, tuple], source: Dict[tuple, tuple]):
+    for func, stat in source.items():
+        target[func] = pstats.add_func_stats(target[func], stat) if func in target else stat
+
+
+def _allocation_sites(snapshot: tracemalloc.Snapshot, limit: int) -> List[Tuple[str, int, int, int]]:
+    """(file, line, bytes, blocks) of the largest live allocation sites"""
+    statistics = snapshot.filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)]).statistics('lineno')
+    return [(stat.traceback[0].filename, stat.traceback[0].lineno, stat.size, stat.count)
+            for stat in statistics[:limit]]
+
+
+def _waiting_functions(stats: Dict[tuple, tuple]) -> set:
+    """The selector's select and the system calls it makes"""
+    selects = {func for func in stats if func[2] == "select" and func[0].endswith("selectors.py")}
+    return selects | {func for func, stat in stats.items() if func[0] == "~" and set(stat[4]) & selects}
+
+
+def profile_task(mode: str, call: Callable[[], Any]) -> Tuple[Any, Optional[Dict[str, Any]]]:
+    """Run call under the profiler for mode and return (result, its profile).
+
+    The profile is None when the calling process or thread is already
+    covered by the request's own profiler.
+    """
+    if mode == 'alloc':
+        if tracemalloc.is_tracing():
+            return call(), None
+        tracemalloc.start()
+        try:
+            result = call()
+            profile = {
+                "peak_bytes": tracemalloc.get_traced_memory()[1],
+                "sites": _allocation_sites(tracemalloc.take_snapshot(), TASK_ALLOCATION_SITES)
+            }
+        finally:
+            tracemalloc.stop()
+        return result, profile
+
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Another profiler already traces every thread of this process
+        return call(), None
+    try:
+        result = call()
+    finally:
+        profiler.disable()
+    profiler.create_stats()
+    return result, {"stats": profiler.stats}
+
+
+class RequestProfile:
+    """CPU or allocation profile of one request, merged over the server and its worker tasks"""
+
+    def __init__(self, mode: str, method: str, path: str):
+        self.id = uuid.uuid4().hex
+        self.mode = mode
+        self.method = method
+        self.path = path
+        self.endpoint: Optional[str] = None
+        self.status: Optional[int] = None
+        self.created_at = datetime.now().isoformat()
+        self.duration: Optional[float] = None
+        self.tasks = 0
+        self.stats: Dict[tuple, tuple] = {}
+        self.sites: Dict[Tuple[str, int], List[int]] = {}
+        self.peak_bytes = {"server": 0, "worker": 0}
+        self._started = 0.0
+        self._profiler: Optional[cProfile.Profile] = None
+        self._stop_tracing = False
+        self._snapshot_taken = False
+
+    def start(self):
+        if self.mode == 'cpu':
+            self._profiler = cProfile.Profile()
+            try:
+                self._profiler.enable()
+            except ValueError:
+                raise ProfilingUnavailableError("Another profiler is active in this process")
+        else:
+            self._stop_tracing = not tracemalloc.is_tracing()
+            if self._stop_tracing:
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+        self._started = time.perf_counter()
+
+    def snapshot(self):
+        """Record the server's live allocations, while the response's data is still referenced"""
+        if self.mode == 'alloc' and tracemalloc.is_tracing() and not self._snapshot_taken:
+            self._snapshot_taken = True
+            self.peak_bytes["server"] = tracemalloc.get_traced_memory()[1]
+            sites = _allocation_sites(tracemalloc.take_snapshot(), TASK_ALLOCATION_SITES)
+            for filename, lineno, size, count in sites:
+                self._add_site(filename, lineno, size, count)
+
+    def stop(self):
+        self.duration = time.perf_counter() - self._started
+        if self._profiler is not None:
+            self._profiler.disable()
+            self._profiler.create_stats()
+            _merge_stats(self.stats, self._profiler.stats)
+            self._profiler = None
+        elif self.mode == 'alloc':
+            self.snapshot()
+            if self._stop_tracing:
+                tracemalloc.stop()
+
+    def add_task(self, profile: Optional[Dict[str, Any]]):
+        """Merge the profile of a worker task run by profile_task"""
+        if profile is None:
+            return
+        self.tasks += 1
+        if "stats" in profile:
+            _merge_stats(self.stats, profile["stats"])
+        else:
+            self.peak_bytes["worker"] = max(self.peak_bytes["worker"], profile["peak_bytes"])
+            for filename, lineno, size, count in profile["sites"]:
+                self._add_site(filename, lineno, size, count)
+
+    def _add_site(self, filename: str, lineno: int, size: int, count: int):
+        site = self.sites.setdefault((filename, lineno), [0, 0])
+        site[0] += size
+        site[1] += count
+
+    def pstats_bytes(self) -> bytes:
+        """The CPU profile in the file format read by pstats.Stats and snakeviz"""
+        return marshal.dumps(self.stats)
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "profile_id": self.id,
+            "mode": self.mode,
+            "method": self.method,
+            "path": self.path,
+            "endpoint": self.endpoint,
+            "status_code": self.status,
+            "created_at": self.created_at,
+            "duration_seconds": self.duration,
+            "worker_tasks": self.tasks,
+        }
+
+    def summary(self, top: int = DEFAULT_TOP) -> Dict[str, Any]:
+        """Info plus the top functions by cumulative time, or the top allocation sites by size"""
+        summary = self.info()
+        if self.mode == 'cpu':
+            # The event loop waiting for I/O or worker results would otherwise top the list
+            waiting = _waiting_functions(self.stats)
+            busy = {func: stat for func, stat in self.stats.items() if func not in waiting}
+            ranked = sorted(busy.items(), key=lambda item: item[1][3], reverse=True)
+            summary["total_calls"] = sum(stat[1] for stat in self.stats.values())
+            summary["functions"] = [
+                {
+                    "function": pstats.func_std_string(func),
+                    "calls": calls,
+                    "primitive_calls": primitive_calls,
+                    "total_time": total_time,
+                    "cumulative_time": cumulative_time
+                }
+                for func, (primitive_calls, calls, total_time, cumulative_time, _) in ranked[:top]
+            ]
+        else:
+            ranked = sorted(self.sites.items(), key=lambda item: item[1][0], reverse=True)
+            summary["peak_bytes"] = dict(self.peak_bytes)
+            summary["sites"] = [
+                {"file": filename, "line": lineno, "size_bytes": size, "blocks": count}
+                for (filename, lineno), (size, count) in ranked[:top]
+            ]
+        return summary
+
+
+class ProfileStore:
+    """The most recent request profiles, oldest dropped first"""
+
+    def __init__(self, max_profiles: int = MAX_PROFILES):
+        self.max_profiles = max_profiles
+        self._profiles: "OrderedDict[str, RequestProfile]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, profile: RequestProfile):
+        with self._lock:
+            self._profiles[profile.id] = profile
+            while len(self._profiles) > self.max_profiles:
+                self._profiles.popitem(last=False)
+
+    def get(self, profile_id: str) -> Optional[RequestProfile]:
+        with self._lock:
+            return self._profiles.get(profile_id)
+
+    def list(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [profile.info() for profile in reversed(self._profiles.values())]
+
+    def clear(self) -> int:
+        with self._lock:
+            count = len(self._profiles)
+            self._profiles.clear()
+        return count
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+def _waiting_in_selector(frame) -> bool:
+    return frame.f_code.co_name == "select" and frame.f_code.co_filename.endswith("selectors.py")
+
+
+class StackSampler:
+    """Samples the stacks of threads marked active at a fixed rate into collapsed-stack counts.
+
+    A thread is active inside `active()`: request handlers on the event
+    loop and tasks on the worker pools. Samples of an event loop waiting in
+    its selector are dropped, so idle time between awaits is not counted.
+    """
+
+    def __init__(self, hz: float):
+        self.interval = 1.0 / hz
+        self.hz = hz
+        self.samples = 0
+        self._counts: Counter = Counter()
+        self._active: Dict[int, int] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._started_at = datetime.now().isoformat()
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="stats-sampler", daemon=True)
+                    self._thread.start()
+
+    @contextmanager
+    def active(self) -> Iterator[None]:
+        self._ensure_started()
+        ident = threading.get_ident()
+        with self._lock:
+            self._active[ident] = self._active.get(ident, 0) + 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                if self._active[ident] == 1:
+                    del self._active[ident]
+                else:
+                    self._active[ident] -= 1
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                idents = list(self._active)
+            if not idents:
+                continue
+            frames = sys._current_frames()
+            stacks = []
+            for ident in idents:
+                frame = frames.get(ident)
+                if frame is None or _waiting_in_selector(frame):
+                    continue
+                names = []
+                while frame is not None:
+                    names.append(_frame_name(frame))
+                    frame = frame.f_back
+                stacks.append(";".join(reversed(names)))
+            del frames
+            self.add(Counter(stacks))
+
+    def add(self, counts: Dict[str, int]):
+        """Merge counts, e.g. those drained from a worker process"""
+        with self._lock:
+            for stack, count in counts.items():
+                if stack not in self._counts and len(self._counts) >= MAX_SAMPLED_STACKS:
+                    stack = OVERFLOW_STACK
+                self._counts[stack] += count
+                self.samples += count
+
+    def drain(self) -> Dict[str, int]:
+        with self._lock:
+            counts = dict(self._counts)
+            self._counts.clear()
+        return counts
+
+    def collapsed(self) -> str:
+        """Counts in the collapsed-stack format read by flamegraph.pl and speedscope"""
+        with self._lock:
+            return "".join(f"{stack} {count}\n" for stack, count in self._counts.most_common())
+
+    def top(self, limit: int = DEFAULT_TOP) -> List[Dict[str, Any]]:
+        """Functions by the share of samples they were on top of the stack"""
+        leaves: Counter = Counter()
+        with self._lock:
+            for stack, count in self._counts.items():
+                leaves[stack.rsplit(";", 1)[-1]] += count
+            total = sum(self._counts.values())
+        return [{"function": name, "samples": count, "fraction": count / total}
+                for name, count in leaves.most_common(limit)]
+
+    def reset(self) -> int:
+        with self._lock:
+            count = sum(self._counts.values())
+            self._counts.clear()
+            self._started_at = datetime.now().isoformat()
+        return count
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "sample_hz": self.hz,
+                "since": self._started_at,
+                "samples": sum(self._counts.values()),
+                "stacks": len(self._counts)
+            }
+
+
+_sampler: Optional[StackSampler] = None
+
+
+def sampler() -> Optional[StackSampler]:
+    """This process's sampler, or None when sampling is disabled"""
+    global _sampler
+    if _sampler is None and SAMPLE_HZ > 0:
+        _sampler = StackSampler(SAMPLE_HZ)
+    return _sampler
+
+
+def run_sampled(call: Callable[[], Any]) -> Any:
+    """Run call on a thread of the server with the sampler watching it"""
+    with sampler().active():
+        return call()
+
+
+def sampled_task(call: Callable[[], Any]) -> Tuple[Any, Dict[str, int]]:
+    """Run call in a worker process under its sampler and return (result, stacks sampled since the last task)"""
+    worker_sampler = sampler()
+    with worker_sampler.active():
+        result = call()
+    return result, worker_sampler.drain()
+
+
+class ProfilingMiddleware:
+    """ASGI middleware running requests that ask for it under a RequestProfile.
+
+    Profiles are kept in `store`; the sampler, when enabled, watches every
+    request's handler.
+    """
+
+    def __init__(self, app, store: ProfileStore):
+        self.app = app
+        self.store = store
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope.get("headers", []))
+        mode = headers.get(PROFILE_HEADER.lower().encode())
+        if mode is None and b"profile=" in scope.get("query_string", b""):
+            mode = parse_qs(scope["query_string"].decode("latin-1")).get("profile", [""])[-1].encode()
+        if mode is None:
+            request_sampler = sampler()
+            if request_sampler is None:
+                await self.app(scope, receive, send)
+            else:
+                with request_sampler.active():
+                    await self.app(scope, receive, send)
+            return
+
+        mode = mode.decode("latin-1")
+        token = headers.get(PROFILE_TOKEN_HEADER.lower().encode())
+        if not authorized(token.decode("latin-1") if token is not None else None):
+            await _error(scope, receive, send, 403, "Profiling requires a valid profile token")
+            return
+        if mode not in PROFILE_MODES:
+            await _error(scope, receive, send, 400,
+                         f"Unsupported profile mode: {mode}. Use one of: {', '.join(PROFILE_MODES)}")
+            return
+        if not _profiling_lock.acquire(blocking=False):
+            await _error(scope, receive, send, 409, "Another request is being profiled")
+            return
+
+        profile = RequestProfile(mode, scope.get("method", ""), scope.get("path", ""))
+
+        async def profiled_send(message):
+            if message["type"] == "http.response.start":
+                profile.status = message["status"]
+                profile.snapshot()
+                headers = list(message.get("headers", []))
+                headers.append((PROFILE_ID_HEADER.lower().encode(), profile.id.encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            try:
+                profile.start()
+            except ProfilingUnavailableError as e:
+                await _error(scope, receive, send, 409, str(e))
+                return
+            context_token = _current.set(profile)
+            try:
+                await self.app(scope, receive, profiled_send)
+            finally:
+                _current.reset(context_token)
+                profile.stop()
+                route = scope.get("route")
+                profile.endpoint = getattr(route, "path", None)
+                self.store.put(profile)
+        finally:
+            _profiling_lock.release()
+
+
+async def _error(scope, receive, send, status_code: int, detail: str):
+    from starlette.responses import JSONResponse
+
+    await JSONResponse({"detail": detail}, status_code=status_code)(scope, receive, send)
@@ -0,0 +1,56 @@
+"""
+Progress reporting from long-running computations.
+
+Analyses call report_progress() at natural checkpoints such as KMeans
+iterations or file chunks. A listener installed with listen() receives the
+events; when the computation runs in a worker process, the worker pools
+forward them to the listener of the submitting request. Without a listener
+report_progress() does nothing.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, Optional
+
+ProgressListener = Callable[[Dict[str, Any]], None]
+
+_listener: ContextVar[Optional[ProgressListener]] = ContextVar("progress_listener", default=None)
+
+# Queue to the parent process, set by the worker pool initializer
+_worker_queue = None
+
+
+def report_progress(stage: str, current: int, total: Optional[int] = None, **details):
+    """Report that `current` of `total` units of `stage` are done"""
+    listener = _listener.get()
+    if listener is not None:
+        listener({"stage": stage, "current": current, "total": total, **details})
+
+
+def current_listener() -> Optional[ProgressListener]:
+    return _listener.get()
+
+
+@contextmanager
+def listen(listener: ProgressListener) -> Iterator[None]:
+    """Deliver progress events reported in this context to listener.
+
+    The listener may be called from worker threads and must be thread-safe.
+    """
+    token = _listener.set(listener)
+    try:
+        yield
+    finally:
+        _listener.reset(token)
+
+
+def init_worker(queue):
+    """Process pool initializer connecting a worker to the parent's queue"""
+    global _worker_queue
+    _worker_queue = queue
+
+
+def run_in_worker(task_key: str, fn: Callable[[], Any]) -> Any:
+    """Run fn in a worker process, forwarding its progress events under task_key"""
+    queue = _worker_queue
+    with listen(lambda event: queue.put((task_key, event))):
+        return fn()
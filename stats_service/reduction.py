@@ -0,0 +1,73 @@
+"""
+Data reduction for plotting large datasets.
+
+Rendering cost should depend on the size of the picture rather than on the
+number of rows: scatter plots with many points are drawn as density grids and
+line charts are downsampled to a bounded number of points before plotting.
+The downsamplers return row positions, so callers keep the original x values
+(dates, categories) of the points they select.
+"""
+from typing import Tuple
+
+import numpy as np
+import pandas as pd
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """Positions of the points kept by Largest-Triangle-Three-Buckets downsampling.
+
+    x must be sorted. The first and last points are always kept; each
+    bucket in between contributes the point forming the largest triangle
+    with the previously kept point and the average of the next bucket.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    previous = 0
+    for bucket in range(n_out - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        next_end = edges[bucket + 2] if bucket + 2 < len(edges) else n
+        next_x = x[end:next_end].mean()
+        next_y = y[end:next_end].mean()
+        area = np.abs(
+            (x[previous] - next_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (next_y - y[previous])
+        )
+        previous = start + int(np.argmax(area))
+        selected[bucket + 1] = previous
+    return selected
+
+
+def minmax_indices(y: np.ndarray, n_out: int) -> np.ndarray:
+    """Positions of the minimum and maximum of y in each of n_out / 2 equal buckets.
+
+    Keeps every peak and trough, so spikes survive downsampling. The
+    positions are returned in increasing order, together with the first
+    and last point.
+    """
+    n = len(y)
+    buckets = max(1, n_out // 2)
+    if n_out >= n:
+        return np.arange(n)
+    grouped = pd.Series(y).groupby(np.arange(n) * buckets // n)
+    return np.union1d(
+        np.concatenate([grouped.idxmin().to_numpy(), grouped.idxmax().to_numpy()]),
+        [0, n - 1]
+    )
+
+
+def density_grid(x: np.ndarray, y: np.ndarray, bins: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Return (counts, x_edges, y_edges) of a bins x bins 2-D histogram"""
+    return np.histogram2d(x, y, bins=bins)
+
+
+def linear_trend(x: np.ndarray, y: np.ndarray) -> Tuple[float, float]:
+    """Least-squares slope and intercept of y on x, equivalent to np.polyfit(x, y, 1)"""
+    x_mean, y_mean = x.mean(), y.mean()
+    dx = x - x_mean
+    slope = float(np.dot(dx, y - y_mean) / np.dot(dx, dx))
+    return slope, float(y_mean - slope * x_mean)
@@ -0,0 +1,259 @@
+"""
+Least squares from mergeable sufficient statistics.
+
+`CrossProducts` accumulates the row count, means and centered co-moment
+matrix of [X, Y] chunk by chunk. These carry the same information as X'X,
+X'y and y'y but do not lose precision to cancellation when the columns have
+large means. Coefficients, standard errors, p-values, confidence intervals
+and R^2 follow from one factorization of the feature block, shared by every
+target column, so the design matrix is never materialized. Predictions and
+residuals can be returned in full, as a seeded sample of rows, or as a
+sketch-based summary computed in a second pass.
+"""
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+from scipy import linalg
+from scipy import stats
+
+from progress import report_progress
+from sketches import KLLSketch, MomentSketch
+
+OUTPUT_MODES = ('full', 'sample', 'summary', 'none')
+DEFAULT_SAMPLE_SIZE = 1000
+DEFAULT_HISTOGRAM_BINS = 20
+DEFAULT_RANDOM_STATE = 42
+SUMMARY_QUANTILES = (0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99)
+
+
+class CrossProducts:
+    """Mergeable count, means and centered co-moment matrix of a set of columns"""
+
+    def __init__(self, n_columns: int):
+        self.count = 0
+        self.mean = np.zeros(n_columns)
+        self.comoment = np.zeros((n_columns, n_columns))
+
+    def update(self, values: np.ndarray):
+        """Add the rows of a 2-D array without missing values"""
+        if len(values) == 0:
+            return
+        chunk = CrossProducts(values.shape[1])
+        chunk.count = len(values)
+        chunk.mean = values.mean(axis=0)
+        centered = values - chunk.mean
+        chunk.comoment = centered.T @ centered
+        self.merge(chunk)
+
+    def merge(self, other: "CrossProducts"):
+        """Combine with another accumulator (Chan et al. pairwise update)"""
+        if other.count == 0:
+            return
+        if self.count == 0:
+            self.count, self.mean, self.comoment = other.count, other.mean.copy(), other.comoment.copy()
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.comoment = self.comoment + other.comoment + np.outer(delta, delta) * (self.count * other.count / count)
+        self.mean = self.mean + delta * (other.count / count)
+        self.count = count
+
+    def select(self, positions: List[int]) -> "CrossProducts":
+        """Accumulator of the columns at positions, in that order, over the same rows"""
+        selected = CrossProducts(len(positions))
+        selected.count = self.count
+        selected.mean = self.mean[positions]
+        selected.comoment = self.comoment[np.ix_(positions, positions)]
+        return selected
+
+
+class LeastSquaresFit:
+    """OLS with an intercept for several targets, solved from a CrossProducts over [X, Y]"""
+
+    def __init__(self, cross_products: CrossProducts, n_features: int):
+        p = n_features
+        n = cross_products.count
+        sxx = cross_products.comoment[:p, :p]
+        sxy = cross_products.comoment[:p, p:]
+        syy = np.diag(cross_products.comoment[p:, p:])
+        x_mean, y_mean = cross_products.mean[:p], cross_products.mean[p:]
+
+        try:
+            factor = linalg.cho_factor(sxx)
+            self.beta = linalg.cho_solve(factor, sxy)
+            sxx_inverse = linalg.cho_solve(factor, np.eye(p))
+            self.rank = p
+        except linalg.LinAlgError:
+            # Collinear features: minimum-norm solution, as statsmodels' pinv
+            sxx_inverse = np.linalg.pinv(sxx)
+            self.beta = sxx_inverse @ sxy
+            self.rank = int(np.linalg.matrix_rank(sxx))
+
+        self.count = n
+        self.intercept = y_mean - x_mean @ self.beta
+        self.df_resid = n - self.rank - 1
+        sse = np.maximum(syy - np.sum(sxy * self.beta, axis=0), 0.0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            sigma2 = sse / self.df_resid if self.df_resid > 0 else np.full_like(sse, np.nan)
+            self.r_squared = 1 - sse / syy
+            self.adjusted_r_squared = 1 - (1 - self.r_squared) * (n - 1) / self.df_resid
+        self.beta_se = np.sqrt(np.outer(np.diag(sxx_inverse), sigma2))
+        self.intercept_se = np.sqrt(sigma2 * (1 / n + x_mean @ sxx_inverse @ x_mean))
+
+    def predict(self, features: np.ndarray) -> np.ndarray:
+        """Fitted values for every target, one column per target"""
+        return features @ self.beta + self.intercept
+
+    def target_result(self, index: int, feature_names: List[str]) -> Dict[str, Any]:
+        """Result for one target in the layout of the statsmodels-based regression"""
+        names = ['const'] + list(feature_names)
+        params = np.concatenate([[self.intercept[index]], self.beta[:, index]])
+        se = np.concatenate([[self.intercept_se[index]], self.beta_se[:, index]])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t_values = params / se
+        p_values = 2 * stats.t.sf(np.abs(t_values), self.df_resid)
+        margin = stats.t.ppf(0.975, self.df_resid) * se
+        coefficients = dict(zip(names, params.tolist()))
+        return {
+            "coefficients": coefficients,
+            "intercept": coefficients['const'],
+            "r_squared": float(self.r_squared[index]),
+            "adjusted_r_squared": float(self.adjusted_r_squared[index]),
+            "p_values": dict(zip(names, p_values.tolist())),
+            "standard_errors": dict(zip(names, se.tolist())),
+            "confidence_intervals": {
+                0: dict(zip(names, (params - margin).tolist())),
+                1: dict(zip(names, (params + margin).tolist()))
+            }
+        }
+
+
+class PredictionOutputs:
+    """Collect predictions and residuals per target as full lists, a row sample or a summary.
+
+    The sample keeps the rows with the smallest seeded random keys, so it is
+    a uniform sample of bounded size however the rows are chunked.
+    """
+
+    def __init__(self, mode: str, n_targets: int, options: Dict[str, Any]):
+        if mode not in OUTPUT_MODES:
+            raise ValueError(f"Unsupported outputs mode: {mode}")
+        self.mode = mode
+        self.n_targets = n_targets
+        self.sample_size = int(options.get('sample_size', DEFAULT_SAMPLE_SIZE))
+        self.bins = int(options.get('histogram_bins', DEFAULT_HISTOGRAM_BINS))
+        self._rng = np.random.default_rng(int(options.get('random_state', DEFAULT_RANDOM_STATE)))
+        self._rows: List[np.ndarray] = []
+        self._predictions: List[np.ndarray] = []
+        self._keys = np.empty(0)
+        self._moments = MomentSketch(n_targets)
+        self._quantiles = [KLLSketch(int(options.get('sketch_k', 200)), seed=index) for index in range(n_targets)]
+
+    def update(self, rows: np.ndarray, predictions: np.ndarray, residuals: np.ndarray):
+        """Add a chunk; rows are the positions of the chunk's rows in the dataset"""
+        if self.mode == 'full':
+            self._rows.append(rows)
+            self._predictions.append(np.hstack([predictions, residuals]))
+        elif self.mode == 'sample':
+            self._rows.append(rows)
+            self._predictions.append(np.hstack([predictions, residuals]))
+            self._keys = np.concatenate([self._keys, self._rng.random(len(rows))])
+            if len(self._keys) > 2 * self.sample_size:
+                self._keep(np.argpartition(self._keys, self.sample_size)[:self.sample_size])
+        elif self.mode == 'summary':
+            self._moments.update(residuals)
+            for index, sketch in enumerate(self._quantiles):
+                sketch.update(residuals[:, index])
+
+    def _keep(self, positions: np.ndarray):
+        self._rows = [np.concatenate(self._rows)[positions]]
+        self._predictions = [np.vstack(self._predictions)[positions]]
+        self._keys = self._keys[positions]
+
+    def target_outputs(self, index: int) -> Dict[str, Any]:
+        if self.mode in ('full', 'sample'):
+            if self.mode == 'sample' and len(self._keys) > self.sample_size:
+                self._keep(np.argpartition(self._keys, self.sample_size)[:self.sample_size])
+            rows = np.concatenate(self._rows) if self._rows else np.empty(0, dtype=np.int64)
+            values = np.vstack(self._predictions) if self._predictions else np.empty((0, 2 * self.n_targets))
+            order = np.argsort(rows, kind='stable')
+            predictions = values[order, index].tolist()
+            residuals = values[order, self.n_targets + index].tolist()
+            if self.mode == 'full':
+                return {"predictions": predictions, "residuals": residuals}
+            return {"sample": {"rows": rows[order].tolist(), "predictions": predictions, "residuals": residuals}}
+        if self.mode == 'summary':
+            return {"residual_summary": self._summary(index)}
+        return {}
+
+    def _summary(self, index: int) -> Dict[str, Any]:
+        moments, sketch = self._moments, self._quantiles[index]
+        if moments.count[index] == 0:
+            return {"count": 0}
+        low, high = float(moments.min[index]), float(moments.max[index])
+        edges = np.linspace(low, high, self.bins + 1) if high > low else np.array([low, high])
+        cumulative = np.array(sketch.ranks(edges[1:])) * moments.count[index]
+        counts = np.diff(np.concatenate([[0.0], cumulative]))
+        return {
+            "count": int(moments.count[index]),
+            "mean": float(moments.mean[index]),
+            "std": float(moments.std()[index]),
+            "min": low,
+            "max": high,
+            "quantiles": dict(zip(map(str, SUMMARY_QUANTILES), sketch.quantiles(SUMMARY_QUANTILES))),
+            "histogram": {"edges": edges.tolist(), "counts": np.round(counts).astype(np.int64).tolist()},
+            "rank_error": sketch.rank_error()
+        }
+
+
+def _complete_rows(chunk: pd.DataFrame, columns: List[str], offset: int):
+    values = chunk[columns].to_numpy(dtype=float, na_value=np.nan)
+    complete = ~np.isnan(values).any(axis=1)
+    return values[complete], np.flatnonzero(complete) + offset
+
+
+def streaming_least_squares(chunks: Callable[[], Iterable[pd.DataFrame]], feature_columns: List[str],
+                            target_columns: List[str], outputs: str = 'summary',
+                            options: Optional[Dict[str, Any]] = None,
+                            total_rows: Optional[int] = None) -> Dict[str, Any]:
+    """Fit every target on the shared features from chunks of rows.
+
+    chunks() is called once to accumulate the cross products and once more
+    if predictions or residuals were requested. Rows with a missing value in
+    any feature or target are skipped.
+    """
+    options = options or {}
+    columns = list(feature_columns) + list(target_columns)
+    p = len(feature_columns)
+
+    cross_products = CrossProducts(len(columns))
+    rows_read = 0
+    for chunk in chunks():
+        values, _ = _complete_rows(chunk, columns, rows_read)
+        cross_products.update(values)
+        rows_read += len(chunk)
+        report_progress("accumulate", rows_read, total_rows)
+    if cross_products.count <= p:
+        raise ValueError(f"Not enough complete rows ({cross_products.count}) for {p} features")
+    fit = LeastSquaresFit(cross_products, p)
+    total_rows = rows_read
+
+    collector = PredictionOutputs(outputs, len(target_columns), options)
+    if outputs != 'none':
+        rows_read = 0
+        for chunk in chunks():
+            values, rows = _complete_rows(chunk, columns, rows_read)
+            predictions = fit.predict(values[:, :p])
+            collector.update(rows, predictions, values[:, p:] - predictions)
+            rows_read += len(chunk)
+            report_progress("residuals", rows_read, total_rows)
+
+    return {
+        "n_observations": int(fit.count),
+        "rows_skipped": int(total_rows - fit.count),
+        "targets": {
+            target: {**fit.target_result(index, feature_columns), **collector.target_outputs(index)}
+            for index, target in enumerate(target_columns)
+        }
+    }
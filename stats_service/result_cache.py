@@ -0,0 +1,251 @@
+"""
+Content-addressed cache of analysis and plot results.
+
+Results are keyed by a hash of the input dataset's contents and the call's
+parameters, so repeated calls on identical data are served without
+recomputation whether the rows arrive inline, as a binary body or by dataset
+handle. Entries are pickled into a size-bounded in-memory LRU, optionally
+backed by an on-disk tier, and concurrent identical calls share a single
+computation.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import pandas as pd
+
+DEFAULT_MEMORY_BUDGET_MB = int(os.environ.get("STATS_CACHE_MEMORY_MB", "256"))
+DEFAULT_DISK_BUDGET_MB = int(os.environ.get("STATS_CACHE_DISK_MB", "1024"))
+
+# Bump when analysis results change so stale disk entries are not served
+CACHE_FORMAT_VERSION = 1
+
+_frame_fingerprints: Dict[int, str] = {}
+
+
+def frame_fingerprint(df: pd.DataFrame) -> str:
+    """Hash a DataFrame's column names, dtypes and values (not its index).
+
+    Fingerprints are remembered for the lifetime of the frame, so datasets
+    from the registry, which are never modified, are only hashed once.
+    """
+    fingerprint = _frame_fingerprints.get(id(df))
+    if fingerprint is None:
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(json.dumps([[str(c), str(t)] for c, t in df.dtypes.items()]).encode())
+        digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+        fingerprint = digest.hexdigest()
+        _frame_fingerprints[id(df)] = fingerprint
+        weakref.finalize(df, _frame_fingerprints.pop, id(df), None)
+    return fingerprint
+
+
+def file_fingerprint(file_path: str) -> str:
+    """Identify a file's contents by path, size and modification time"""
+    stat = os.stat(file_path)
+    return f"{os.path.abspath(file_path)}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def cache_key(name: str, *parts: Any) -> str:
+    """Build a cache key from a function name and JSON-compatible parameters"""
+    canonical = json.dumps([CACHE_FORMAT_VERSION, name, parts], sort_keys=True, default=str)
+    return hashlib.blake2b(canonical.encode(), digest_size=20).hexdigest()
+
+
+class ResultCache:
+    """Two-tier LRU cache of pickled results with in-flight de-duplication.
+
+    The memory tier is bounded by `STATS_CACHE_MEMORY_MB` (0 disables it).
+    Setting `STATS_CACHE_DIR` adds a write-through disk tier bounded by
+    `STATS_CACHE_DISK_MB`, which also survives restarts.
+    """
+
+    def __init__(self, memory_budget_bytes: Optional[int] = None, disk_dir: Optional[str] = None,
+                 disk_budget_bytes: Optional[int] = None):
+        if memory_budget_bytes is None:
+            memory_budget_bytes = DEFAULT_MEMORY_BUDGET_MB * 1024 * 1024
+        if disk_budget_bytes is None:
+            disk_budget_bytes = DEFAULT_DISK_BUDGET_MB * 1024 * 1024
+        self.memory_budget_bytes = memory_budget_bytes
+        self.disk_dir = disk_dir if disk_dir is not None else os.environ.get("STATS_CACHE_DIR")
+        self.disk_budget_bytes = disk_budget_bytes
+
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._memory_bytes = 0
+        self._disk: "OrderedDict[str, int]" = OrderedDict()
+        self._disk_bytes = 0
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._lock = threading.RLock()
+        self._counters = {"hits": 0, "disk_hits": 0, "misses": 0, "shared": 0, "evictions": 0, "stores": 0}
+        if self.disk_dir:
+            self._load_disk_index()
+
+    @property
+    def enabled(self) -> bool:
+        return self.memory_budget_bytes > 0 or bool(self.disk_dir)
+
+    async def get_or_compute(self, key: str, compute: Callable[[], Awaitable[Any]]) -> Any:
+        """Return the cached result for key, or await compute() and cache its result.
+
+        Callers arriving while the same key is being computed wait for that
+        computation. If it fails they compute for themselves, so errors are
+        never cached or shared.
+        """
+        if not self.enabled:
+            return await compute()
+        while True:
+            data = await self._lookup(key)
+            if data is not None:
+                return pickle.loads(data)
+            pending = self._pending.get(key)
+            if pending is None:
+                break
+            self._counters["shared"] += 1
+            await asyncio.wait({pending})
+            if not pending.cancelled():
+                return pickle.loads(pending.result())
+
+        self._counters["misses"] += 1
+        future = asyncio.get_running_loop().create_future()
+        self._pending[key] = future
+        try:
+            value = await compute()
+            try:
+                data = await asyncio.to_thread(pickle.dumps, value, pickle.HIGHEST_PROTOCOL)
+            except Exception:
+                # Not cacheable; waiting callers compute for themselves
+                return value
+            await asyncio.to_thread(self._store, key, data)
+            future.set_result(data)
+            return value
+        finally:
+            if not future.done():
+                future.cancel()
+            del self._pending[key]
+
+    async def _lookup(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self._counters["hits"] += 1
+                return data
+            on_disk = key in self._disk
+        if not on_disk:
+            return None
+        data = await asyncio.to_thread(self._read_disk, key)
+        if data is not None:
+            self._counters["disk_hits"] += 1
+            with self._lock:
+                self._remember(key, data)
+        return data
+
+    def _store(self, key: str, data: bytes):
+        with self._lock:
+            self._remember(key, data)
+            self._counters["stores"] += 1
+        if self.disk_dir and len(data) <= self.disk_budget_bytes:
+            try:
+                self._write_disk(key, data)
+            except OSError:
+                # The memory tier still holds the result
+                pass
+
+    def _remember(self, key: str, data: bytes):
+        if len(data) > self.memory_budget_bytes:
+            return
+        previous = self._memory.pop(key, None)
+        if previous is not None:
+            self._memory_bytes -= len(previous)
+        self._memory[key] = data
+        self._memory_bytes += len(data)
+        while self._memory_bytes > self.memory_budget_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+            self._counters["evictions"] += 1
+
+    # Disk tier
+    def _path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.pkl")
+
+    def _load_disk_index(self):
+        os.makedirs(self.disk_dir, exist_ok=True)
+        entries = []
+        for name in os.listdir(self.disk_dir):
+            if name.endswith(".pkl"):
+                stat = os.stat(os.path.join(self.disk_dir, name))
+                entries.append((stat.st_mtime, name[:-4], stat.st_size))
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_bytes += size
+
+    def _read_disk(self, key: str) -> Optional[bytes]:
+        try:
+            with open(self._path(key), "rb") as f:
+                data = f.read()
+            os.utime(self._path(key))
+        except OSError:
+            with self._lock:
+                self._disk_bytes -= self._disk.pop(key, 0)
+            return None
+        with self._lock:
+            if key in self._disk:
+                self._disk.move_to_end(key)
+        return data
+
+    def _write_disk(self, key: str, data: bytes):
+        fd, temp_path = tempfile.mkstemp(dir=self.disk_dir, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, self._path(key))
+        with self._lock:
+            self._disk_bytes += len(data) - self._disk.pop(key, 0)
+            self._disk[key] = len(data)
+            evicted = []
+            while self._disk_bytes > self.disk_budget_bytes:
+                old_key, size = self._disk.popitem(last=False)
+                self._disk_bytes -= size
+                evicted.append(old_key)
+                self._counters["evictions"] += 1
+        for old_key in evicted:
+            try:
+                os.remove(self._path(old_key))
+            except OSError:
+                pass
+
+    def clear(self) -> int:
+        """Drop every entry from both tiers and return how many were removed"""
+        with self._lock:
+            keys = set(self._memory) | set(self._disk)
+            disk_keys = list(self._disk)
+            self._memory.clear()
+            self._disk.clear()
+            self._memory_bytes = self._disk_bytes = 0
+        for key in disk_keys:
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+        return len(keys)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "memory_budget_bytes": self.memory_budget_bytes,
+                "disk_dir": self.disk_dir,
+                "disk_entries": len(self._disk),
+                "disk_bytes": self._disk_bytes,
+                "disk_budget_bytes": self.disk_budget_bytes if self.disk_dir else None,
+                "in_flight": len(self._pending),
+                **self._counters
+            }
@@ -1,20 +1,75 @@
 #!/usr/bin/env python3
 """
-Script to run the Statistical Analysis Service
+Script to run the Advanced Statistical Analysis Service
+
+    python run_stats_service.py                 # one server process
+    python run_stats_service.py --workers 8     # eight server processes sharing loaded datasets
+    python run_stats_service.py --reload        # development: restart on code changes
+
+With several workers, the server processes share datasets through a registry
+in shared memory (see shared_datasets.py) that is removed when the service
+stops, and each process's worker pools get an even share of the cores unless
+`STATS_PROCESS_WORKERS` / `STATS_PLOT_WORKERS` are set.
 """
-import uvicorn
-import sys
+import argparse
 import os
+import shutil
+import sys
+import tempfile
+
+import uvicorn
+
+SERVICE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Run the Advanced Statistical Analysis Service")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("STATS_SERVER_WORKERS", "1")),
+                        help="Server processes (default: STATS_SERVER_WORKERS or 1)")
+    parser.add_argument("--reload", action="store_true",
+                        help="Restart on code changes; development only, runs a single process")
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if args.reload and args.workers > 1:
+        parser.error("--reload runs a single process; drop --workers")
+    return args
+
+
+def main():
+    args = parse_args()
+    sys.path.insert(0, SERVICE_DIR)
+
+    registry_dir = None
+    if args.workers > 1:
+        cpus = os.cpu_count() or 1
+        os.environ.setdefault("STATS_PROCESS_WORKERS", str(max(1, cpus // args.workers)))
+        os.environ.setdefault("STATS_PLOT_WORKERS", "1")
+        if not os.environ.get("STATS_SHARED_DATASETS_DIR"):
+            from shared_datasets import default_registry_parent
+
+            registry_dir = tempfile.mkdtemp(prefix="stats-datasets-", dir=default_registry_parent())
+            os.environ["STATS_SHARED_DATASETS_DIR"] = registry_dir
+
+    try:
+        uvicorn.run(
+            "advanced_main:app",
+            host=args.host,
+            port=args.port,
+            workers=args.workers,
+            reload=args.reload,
+            reload_dirs=[SERVICE_DIR] if args.reload else None,
+            app_dir=SERVICE_DIR,
+            log_level=args.log_level
+        )
+    finally:
+        # Workers have exited, so this frees every dataset segment
+        if registry_dir is not None:
+            shutil.rmtree(registry_dir, ignore_errors=True)
+
 
 if __name__ == "__main__":
-    # Add current directory to Python path
-    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
-    
-    # Run the FastAPI application
-    uvicorn.run(
-        "main:app",
-        host="0.0.0.0",
-        port=8001,
-        reload=True,
-        log_level="info"
-    )
+    main()
@@ -0,0 +1,468 @@
+"""
+Dataset registry shared by the server processes of a multi-worker service.
+
+When the service runs several server processes (`run_stats_service.py
+--workers N`), each has its own memory, so a dataset loaded through one of
+them would be unknown to the others. `SharedDatasetStore` keeps datasets in
+a registry directory on shared memory (`/dev/shm` where available) instead.
+Each dataset is a segment file and a small JSON entry. The segment holds the
+dataset's numeric columns as raw arrays, followed by a pickle of everything
+else: text and categorical columns, the index and the column labels.
+
+Every process maps a segment read-only and builds the frame on top of the
+mapping, so numeric columns are neither copied nor parsed again, whichever
+process loaded them. Frames from the store are passed to the worker pools
+by reference (see `SharedFrame`), so analysis workers map the same pages
+rather than unpickling a copy.
+
+Cleanup is reference counted by the kernel: deleting or evicting a dataset
+unlinks its segment, and its pages are freed once every process that maps it
+has dropped its frame. Each process drops the frames of removed datasets on
+its next store access, and a crashed worker's mappings go with it. The
+memory budget and the LRU order (segment modification times) are shared by
+all processes; changes to the registry are serialized with a lock file.
+"""
+import json
+import mmap
+import os
+import pickle
+import re
+import tempfile
+import threading
+import time
+import uuid
+from bisect import bisect_right
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from dataset_store import (
+    DEFAULT_MEMORY_BUDGET_MB, DatasetNotFoundError, DatasetTooLargeError, conform_rows, joined_dtypes
+)
+from incremental import Chunk, DatasetTrackers
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Set by run_stats_service.py for the server processes it starts
+SHARED_DATASETS_DIR = os.environ.get("STATS_SHARED_DATASETS_DIR")
+
+# Column dtype kinds stored as raw arrays: bool, integers, floats, complex, datetimes and timedeltas
+SHARED_KINDS = "biufcmM"
+ALIGNMENT = 64
+# Seconds between LRU updates of a dataset that is read repeatedly, and between checks for removed datasets
+ACCESS_RESOLUTION = 1.0
+
+SEGMENT_SUFFIX = ".segment"
+ENTRY_SUFFIX = ".json"
+LOCK_FILE = ".lock"
+EVICTIONS_FILE = ".evictions"
+
+_DATASET_ID = re.compile(r"[0-9a-f]{32}")
+
+
+def default_registry_parent() -> str:
+    """Directory for registries: shared memory where the system exposes it as a file system"""
+    return "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+
+
+class SharedFrame(pd.DataFrame):
+    """DataFrame whose columns live in a dataset segment, pickled as a reference to that segment.
+
+    Frames derived from it (selections, copies, results) are plain DataFrames,
+    so only the stored frame itself is passed by reference.
+    """
+
+    _metadata = ["_segment"]
+
+    @property
+    def _constructor(self):
+        return pd.DataFrame
+
+    def __reduce__(self):
+        return map_segment, self._segment
+
+
+def map_segment(path: str, layout_offset: int, layout_size: int) -> SharedFrame:
+    """Build the frame stored in a segment on top of a read-only mapping of it"""
+    with open(path, "rb") as f:
+        mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    layout = pickle.loads(mapping[layout_offset:layout_offset + layout_size])
+    columns = {}
+    for position, (shared, value) in enumerate(layout["arrays"]):
+        if shared:
+            dtype, offset = value
+            # The arrays keep the mapping open, and are read-only like the mapping
+            columns[position] = np.frombuffer(mapping, dtype=np.dtype(dtype), count=layout["rows"], offset=offset)
+        else:
+            columns[position] = value
+    frame = SharedFrame(columns, index=layout["index"], copy=False)
+    frame.columns = layout["columns"]
+    object.__setattr__(frame, "_segment", (path, layout_offset, layout_size))
+    return frame
+
+
+def _aligned(offset: int) -> int:
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def write_segment(path: str, df: pd.DataFrame) -> Tuple[int, int]:
+    """Write df to a new segment file at path and return the offset and size of its layout pickle"""
+    arrays = []
+    shared = []
+    offset = 0
+    for position in range(df.shape[1]):
+        column = df.iloc[:, position]
+        if isinstance(column.dtype, np.dtype) and column.dtype.kind in SHARED_KINDS:
+            values = np.ascontiguousarray(column.to_numpy())
+            arrays.append((True, (values.dtype.str, offset)))
+            shared.append((offset, values))
+            offset = _aligned(offset + values.nbytes)
+        else:
+            arrays.append((False, column.array))
+    layout = pickle.dumps({"rows": len(df), "columns": df.columns, "index": df.index, "arrays": arrays},
+                          protocol=pickle.HIGHEST_PROTOCOL)
+
+    directory = os.path.dirname(path)
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            for array_offset, values in shared:
+                f.seek(array_offset)
+                # Byte view, as the buffer protocol does not cover datetime dtypes
+                f.write(values.view(np.uint8).data)
+            f.seek(offset)
+            f.write(layout)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return offset, len(layout)
+
+
+class _Mapping:
+    """This process's view of a dataset: its mapped segments, their join and its incremental statistics"""
+
+    def __init__(self):
+        self.chunks: List[Chunk] = []
+        self.first_rows: List[int] = []
+        self.rows = 0
+        # Column types of the joined segments
+        self.dtypes: Optional[pd.Series] = None
+        self.frame: Optional[pd.DataFrame] = None
+        self.trackers: Optional[DatasetTrackers] = None
+        self.lock = threading.RLock()
+
+    def update(self, registry_dir: str, segments: List[Dict[str, Any]]):
+        """Map the segments appended since the last update"""
+        with self.lock:
+            for segment in segments[len(self.chunks):]:
+                frame = map_segment(os.path.join(registry_dir, segment["file"]),
+                                    segment["layout_offset"], segment["layout_size"])
+                self.chunks.append((self.rows, segment["arrived_at"], frame))
+                self.first_rows.append(self.rows)
+                self.rows += len(frame)
+                self.dtypes = frame.dtypes if self.dtypes is None else joined_dtypes(self.dtypes, frame)
+
+    def joined(self) -> pd.DataFrame:
+        """The dataset: the mapped frame itself, or a private join of the segments of an appended dataset"""
+        with self.lock:
+            if self.frame is None or len(self.frame) != self.rows:
+                frames = [frame for _, _, frame in self.chunks]
+                self.frame = frames[0] if len(frames) == 1 else pd.concat(frames)
+            return self.frame
+
+    def chunks_since(self, row: int) -> List[Chunk]:
+        index = max(bisect_right(self.first_rows, row) - 1, 0)
+        return [
+            (max(first_row, row), arrived_at, frame.iloc[max(row - first_row, 0):])
+            for first_row, arrived_at, frame in self.chunks[index:]
+            if first_row + len(frame) > row
+        ]
+
+
+class SharedDatasetStore:
+    """DatasetStore whose datasets are shared by every process using the same registry directory.
+
+    The memory budget (`STATS_DATASET_MEMORY_MB`) bounds the segments of all
+    processes together. Stored frames are read-only: their numeric columns
+    are mapped read-only, and operations that transform a dataset return a
+    new frame as with DatasetStore. Appended rows are written as further
+    segments of the dataset; a process reading the whole of an appended
+    dataset joins its segments into a private frame.
+    """
+
+    def __init__(self, registry_dir: str, memory_budget_bytes: Optional[int] = None):
+        if fcntl is None:
+            raise RuntimeError("Shared datasets need file locks, which this platform does not provide")
+        if memory_budget_bytes is None:
+            memory_budget_bytes = DEFAULT_MEMORY_BUDGET_MB * 1024 * 1024
+        self.registry_dir = registry_dir
+        self.memory_budget_bytes = memory_budget_bytes
+        os.makedirs(registry_dir, exist_ok=True)
+
+        # Datasets this process has mapped, by ID
+        self._mappings: Dict[str, _Mapping] = {}
+        self._lock = threading.RLock()
+        self._last_pruned = time.monotonic()
+
+    def put(self, df: pd.DataFrame, name: Optional[str] = None, source: Optional[str] = None) -> str:
+        """Write a DataFrame to shared memory and return its dataset ID"""
+        nbytes = int(df.memory_usage(deep=True).sum())
+        if nbytes > self.memory_budget_bytes:
+            raise DatasetTooLargeError(
+                f"Dataset needs {nbytes} bytes but the memory budget is {self.memory_budget_bytes} bytes"
+            )
+
+        dataset_id = uuid.uuid4().hex
+        segment = self._write_segment(dataset_id + SEGMENT_SUFFIX, df)
+        if segment["bytes"] > self.memory_budget_bytes:
+            os.remove(self._path(segment["file"]))
+            raise DatasetTooLargeError(
+                f"Dataset needs {segment['bytes']} bytes but the memory budget is {self.memory_budget_bytes} bytes"
+            )
+        entry = {
+            "dataset_id": dataset_id,
+            "name": name,
+            "source": source,
+            "shape": list(df.shape),
+            "columns": df.columns.tolist(),
+            "dtypes": {str(column): dtype for column, dtype in df.dtypes.astype(str).items()},
+            "memory_bytes": segment["bytes"],
+            "created_at": datetime.now().isoformat(),
+            "segments": [segment],
+        }
+        with self._registry_lock():
+            self._write_entry(entry)
+            self._evict(keep=dataset_id)
+        self._prune()
+        return dataset_id
+
+    def get(self, dataset_id: str) -> pd.DataFrame:
+        """Return the DataFrame for a dataset ID, mapping it if this process has not yet, and mark it as used"""
+        return self._mapping(dataset_id, self._entry(dataset_id)).joined()
+
+    def append(self, dataset_id: str, rows: pd.DataFrame) -> Dict[str, Any]:
+        """Append rows to a dataset as a new segment and return its metadata"""
+        with self._registry_lock():
+            entry = self._entry(dataset_id)
+            mapping = self._mapping(dataset_id, entry)
+            rows = conform_rows(rows, mapping.chunks[0][2], entry["shape"][0])
+            nbytes = int(rows.memory_usage(deep=True).sum())
+            if entry["memory_bytes"] + nbytes > self.memory_budget_bytes:
+                raise DatasetTooLargeError(
+                    f"Dataset would need {entry['memory_bytes'] + nbytes} bytes but the memory budget is "
+                    f"{self.memory_budget_bytes} bytes"
+                )
+            if len(rows):
+                segment = self._write_segment(f"{dataset_id}.{len(entry['segments'])}{SEGMENT_SUFFIX}", rows)
+                entry["segments"].append(segment)
+                entry["shape"][0] += len(rows)
+                entry["memory_bytes"] += segment["bytes"]
+                entry["dtypes"] = {
+                    str(column): dtype for column, dtype in joined_dtypes(mapping.dtypes, rows).astype(str).items()
+                }
+                self._write_entry(entry)
+                self._evict(keep=dataset_id)
+        return self._describe(entry, time.time())
+
+    @contextmanager
+    def incremental(self, dataset_id: str) -> Iterator[DatasetTrackers]:
+        """Hold this process's incremental statistics of a dataset, caught up with every segment"""
+        mapping = self._mapping(dataset_id, self._entry(dataset_id))
+        with mapping.lock:
+            if mapping.trackers is None:
+                mapping.trackers = DatasetTrackers(mapping.chunks_since, mapping.dtypes)
+            mapping.trackers.dtypes = mapping.dtypes
+            yield mapping.trackers
+
+    def info(self, dataset_id: str) -> Dict[str, Any]:
+        """Return metadata for a dataset without touching its LRU position"""
+        entry = self._entry(dataset_id)
+        try:
+            return self._describe(entry, os.stat(self._path(entry["segments"][0]["file"])).st_mtime)
+        except FileNotFoundError:
+            raise DatasetNotFoundError(dataset_id)
+
+    def delete(self, dataset_id: str) -> bool:
+        """Remove a dataset, returning False if it was not registered"""
+        if not _DATASET_ID.fullmatch(dataset_id):
+            return False
+        with self._registry_lock():
+            removed = self._remove(dataset_id)
+        self._prune()
+        return removed
+
+    def list(self) -> List[Dict[str, Any]]:
+        """Return metadata for every registered dataset, most recently used last"""
+        self._prune()
+        return [self._describe(entry, accessed) for entry, accessed in self._entries()]
+
+    def usage(self) -> Dict[str, Any]:
+        """Return memory accounting for the registry and the datasets this process has mapped"""
+        self._prune()
+        entries = self._entries()
+        with self._lock:
+            mapped = len(self._mappings)
+        return {
+            "datasets": len(entries),
+            "memory_bytes": sum(entry["memory_bytes"] for entry, _ in entries),
+            "memory_budget_bytes": self.memory_budget_bytes,
+            "evictions": self._evictions(),
+            "shared": True,
+            "registry_dir": self.registry_dir,
+            "mapped_datasets": mapped,
+        }
+
+    def _path(self, file_name: str) -> str:
+        return os.path.join(self.registry_dir, file_name)
+
+    def _entry_path(self, dataset_id: str) -> str:
+        return self._path(dataset_id + ENTRY_SUFFIX)
+
+    def _write_segment(self, file_name: str, df: pd.DataFrame) -> Dict[str, Any]:
+        layout_offset, layout_size = write_segment(self._path(file_name), df)
+        return {
+            "file": file_name,
+            "rows": len(df),
+            "bytes": os.path.getsize(self._path(file_name)),
+            "layout_offset": layout_offset,
+            "layout_size": layout_size,
+            "arrived_at": time.time(),
+        }
+
+    def _mapping(self, dataset_id: str, entry: Dict[str, Any]) -> _Mapping:
+        """This process's mapping of a dataset, extended to its current segments and marked as used"""
+        try:
+            # Modification times of first segments order the LRU; coarse updates keep repeated reads cheap
+            first_segment = self._path(entry["segments"][0]["file"])
+            if time.time() - os.stat(first_segment).st_mtime > ACCESS_RESOLUTION:
+                os.utime(first_segment)
+            with self._lock:
+                mapping = self._mappings.get(dataset_id)
+                if mapping is None:
+                    mapping = self._mappings[dataset_id] = _Mapping()
+            mapping.update(self.registry_dir, entry["segments"])
+        except FileNotFoundError:
+            self._forget(dataset_id)
+            raise DatasetNotFoundError(dataset_id)
+        if time.monotonic() - self._last_pruned > ACCESS_RESOLUTION:
+            self._prune()
+        return mapping
+
+    @contextmanager
+    def _registry_lock(self) -> Iterator[None]:
+        # Each acquisition opens the file, so threads of one process exclude each other too
+        with open(self._path(LOCK_FILE), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _entry(self, dataset_id: str) -> Dict[str, Any]:
+        # IDs are used in file names, so anything but a generated ID is unknown
+        if not _DATASET_ID.fullmatch(dataset_id):
+            raise DatasetNotFoundError(dataset_id)
+        try:
+            with open(self._entry_path(dataset_id)) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            self._forget(dataset_id)
+            raise DatasetNotFoundError(dataset_id)
+
+    def _write_entry(self, entry: Dict[str, Any]):
+        fd, temp_path = tempfile.mkstemp(dir=self.registry_dir, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(entry, f, default=str)
+        os.replace(temp_path, self._entry_path(entry["dataset_id"]))
+
+    def _entries(self) -> List[Tuple[Dict[str, Any], float]]:
+        """(entry, last access time) of every dataset, least recently used first"""
+        entries = []
+        for file_name in os.listdir(self.registry_dir):
+            if not file_name.endswith(ENTRY_SUFFIX):
+                continue
+            try:
+                with open(self._path(file_name)) as f:
+                    entry = json.load(f)
+                accessed = os.stat(self._path(entry["segments"][0]["file"])).st_mtime
+            except (FileNotFoundError, ValueError):
+                # Removed while listing
+                continue
+            entries.append((entry, accessed))
+        entries.sort(key=lambda item: item[1])
+        return entries
+
+    def _remove(self, dataset_id: str) -> bool:
+        """Unregister a dataset and unlink its segments; callers hold the registry lock"""
+        try:
+            with open(self._entry_path(dataset_id)) as f:
+                entry = json.load(f)
+            os.remove(self._entry_path(dataset_id))
+        except (FileNotFoundError, ValueError):
+            return False
+        for segment in entry["segments"]:
+            try:
+                os.remove(self._path(segment["file"]))
+            except FileNotFoundError:
+                pass
+        return True
+
+    def _evict(self, keep: str):
+        """Remove least recently used datasets other than keep until all fit the budget; hold the registry lock"""
+        entries = self._entries()
+        total = sum(entry["memory_bytes"] for entry, _ in entries)
+        evicted = 0
+        for entry, _ in entries:
+            if total <= self.memory_budget_bytes:
+                break
+            if entry["dataset_id"] != keep and self._remove(entry["dataset_id"]):
+                total -= entry["memory_bytes"]
+                evicted += 1
+        if evicted:
+            # Read the count before replacing the file, which readers never see half written
+            count = self._evictions() + evicted
+            fd, temp_path = tempfile.mkstemp(dir=self.registry_dir, suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                f.write(str(count))
+            os.replace(temp_path, self._path(EVICTIONS_FILE))
+
+    def _evictions(self) -> int:
+        try:
+            with open(self._path(EVICTIONS_FILE)) as f:
+                return int(f.read() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def _forget(self, dataset_id: str):
+        with self._lock:
+            self._mappings.pop(dataset_id, None)
+
+    def _prune(self):
+        """Drop this process's mappings of datasets another process has deleted or evicted"""
+        with self._lock:
+            self._last_pruned = time.monotonic()
+            for dataset_id in list(self._mappings):
+                if not os.path.exists(self._entry_path(dataset_id)):
+                    del self._mappings[dataset_id]
+
+    @staticmethod
+    def _describe(entry: Dict[str, Any], accessed: float) -> Dict[str, Any]:
+        return {
+            "dataset_id": entry["dataset_id"],
+            "name": entry["name"],
+            "source": entry["source"],
+            "shape": tuple(entry["shape"]),
+            "columns": entry["columns"],
+            "dtypes": entry["dtypes"],
+            "memory_bytes": entry["memory_bytes"],
+            "created_at": entry["created_at"],
+            "last_accessed": datetime.fromtimestamp(accessed).isoformat(),
+        }
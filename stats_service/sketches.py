@@ -0,0 +1,331 @@
+"""
+Mergeable summaries for out-of-core descriptive statistics.
+
+`MomentSketch` accumulates count, mean and the central moment sums M2..M4 for
+many columns in a single pass, and `KLLSketch` keeps a bounded-size quantile
+summary. Both can be updated chunk by chunk and merged, so partial summaries
+computed on different chunks or processes combine into the same result.
+"""
+import itertools
+import math
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from chunked_io import DEFAULT_CHUNK_SIZE, CsvChunkReader, file_format, iter_file_chunks
+from progress import report_progress
+
+DEFAULT_SKETCH_K = 200
+
+
+class MomentSketch:
+    """Single-pass count/mean/M2/M3/M4/min/max for a fixed set of columns.
+
+    Chunks are combined with the pairwise update formulas of Pébay (2008), so
+    merging two sketches gives the same moments as scanning both inputs.
+    """
+
+    def __init__(self, n_columns: int):
+        self.count = np.zeros(n_columns)
+        self.mean = np.zeros(n_columns)
+        self.m2 = np.zeros(n_columns)
+        self.m3 = np.zeros(n_columns)
+        self.m4 = np.zeros(n_columns)
+        self.min = np.full(n_columns, np.inf)
+        self.max = np.full(n_columns, -np.inf)
+
+    def update(self, values: np.ndarray):
+        """Add a 2-D float array of rows; NaNs are ignored per column"""
+        values = np.asarray(values, dtype=float)
+        valid = ~np.isnan(values)
+        count = valid.sum(axis=0).astype(float)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.where(count > 0, np.nansum(values, axis=0) / count, 0.0)
+        deviation = np.where(valid, values - mean, 0.0)
+        squared = deviation * deviation
+
+        chunk = MomentSketch(values.shape[1])
+        chunk.count = count
+        chunk.mean = mean
+        chunk.m2 = squared.sum(axis=0)
+        chunk.m3 = (squared * deviation).sum(axis=0)
+        chunk.m4 = (squared * squared).sum(axis=0)
+        with np.errstate(invalid='ignore'):
+            chunk.min = np.where(count > 0, np.nanmin(np.where(valid, values, np.inf), axis=0), np.inf)
+            chunk.max = np.where(count > 0, np.nanmax(np.where(valid, values, -np.inf), axis=0), -np.inf)
+        self.merge(chunk)
+
+    def merge(self, other: "MomentSketch"):
+        """Fold another sketch over the same columns into this one"""
+        n_a, n_b = self.count, other.count
+        n = n_a + n_b
+        with np.errstate(invalid='ignore', divide='ignore'):
+            delta = other.mean - self.mean
+            delta_n = np.where(n > 0, delta / n, 0.0)
+            delta_n2 = delta_n * delta_n
+            term = delta * delta_n * n_a * n_b
+
+            mean = self.mean + n_b * delta_n
+            m2 = self.m2 + other.m2 + term
+            m3 = (self.m3 + other.m3 + term * delta_n * (n_a - n_b)
+                  + 3.0 * delta_n * (n_a * other.m2 - n_b * self.m2))
+            m4 = (self.m4 + other.m4 + term * delta_n2 * (n_a * n_a - n_a * n_b + n_b * n_b)
+                  + 6.0 * delta_n2 * (n_a * n_a * other.m2 + n_b * n_b * self.m2)
+                  + 4.0 * delta_n * (n_a * other.m3 - n_b * self.m3))
+
+        self.count, self.mean, self.m2, self.m3, self.m4 = n, mean, m2, m3, m4
+        self.min = np.minimum(self.min, other.min)
+        self.max = np.maximum(self.max, other.max)
+
+    def std(self) -> np.ndarray:
+        """Sample standard deviation (ddof=1), as pandas computes it"""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(self.count > 1, np.sqrt(self.m2 / (self.count - 1)), np.nan)
+
+    def skewness(self) -> np.ndarray:
+        """Bias-corrected sample skewness, as pandas computes it"""
+        n = self.count
+        with np.errstate(invalid='ignore', divide='ignore'):
+            g1 = np.sqrt(n) * self.m3 / self.m2 ** 1.5
+            g1 = np.where(self.m2 > 0, g1, 0.0)
+            return np.where(n > 2, np.sqrt(n * (n - 1)) / (n - 2) * g1, np.nan)
+
+    def kurtosis(self) -> np.ndarray:
+        """Bias-corrected excess kurtosis, as pandas computes it"""
+        n = self.count
+        with np.errstate(invalid='ignore', divide='ignore'):
+            g2 = n * self.m4 / (self.m2 * self.m2) - 3.0
+            g2 = np.where(self.m2 > 0, g2, -3.0)
+            corrected = ((n + 1) * g2 + 6.0) * (n - 1) / ((n - 2) * (n - 3))
+            return np.where(self.m2 > 0, np.where(n > 3, corrected, np.nan), np.where(n > 3, 0.0, np.nan))
+
+
+class KLLSketch:
+    """KLL quantile sketch (Karnin, Lang and Liberty, 2016).
+
+    Items are kept in a hierarchy of compactors whose capacities shrink
+    geometrically below the top level; a full compactor sorts its items and
+    promotes every other one with doubled weight. Memory is O(k) and the
+    normalized rank error is about `rank_error()` with 99% confidence.
+    Quantiles are exact until the first compaction.
+    """
+
+    def __init__(self, k: int = DEFAULT_SKETCH_K, seed: Optional[int] = None):
+        if k < 8:
+            raise ValueError("KLL sketch k must be at least 8")
+        self.k = k
+        self.n = 0
+        self.compacted = False
+        self._levels: List[np.ndarray] = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+
+    def _capacity(self, level: int) -> int:
+        depth = len(self._levels) - level - 1
+        return max(2, int(math.ceil(self.k * (2.0 / 3.0) ** depth)))
+
+    def update(self, values: np.ndarray):
+        """Add a 1-D array of values; NaNs are ignored"""
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        if values.size == 0:
+            return
+        self.n += values.size
+        self._levels[0] = np.concatenate([self._levels[0], values])
+        self._compress()
+
+    def merge(self, other: "KLLSketch"):
+        """Fold another sketch into this one"""
+        while len(self._levels) < len(other._levels):
+            self._levels.append(np.empty(0))
+        for level, items in enumerate(other._levels):
+            self._levels[level] = np.concatenate([self._levels[level], items])
+        self.n += other.n
+        self.compacted = self.compacted or other.compacted
+        self.k = max(self.k, other.k)
+        self._compress()
+
+    def _compress(self):
+        while sum(items.size for items in self._levels) > sum(self._capacity(h) for h in range(len(self._levels))):
+            for level, items in enumerate(self._levels):
+                if items.size >= self._capacity(level):
+                    break
+            if level + 1 == len(self._levels):
+                self._levels.append(np.empty(0))
+
+            items = np.sort(items)
+            keep = items[:items.size % 2]
+            paired = items[items.size % 2:]
+            promoted = paired[int(self._rng.integers(2))::2]
+            self._levels[level] = keep
+            self._levels[level + 1] = np.concatenate([self._levels[level + 1], promoted])
+            self.compacted = True
+
+    def quantiles(self, qs: Iterable[float]) -> List[float]:
+        """Return approximate quantiles for the probabilities in qs"""
+        qs = list(qs)
+        if self.n == 0:
+            return [np.nan] * len(qs)
+        items = np.concatenate(self._levels)
+        if not self.compacted:
+            return np.quantile(items, qs).tolist()
+        weights = np.concatenate([np.full(level.size, 2.0 ** h) for h, level in enumerate(self._levels)])
+        order = np.argsort(items, kind='stable')
+        items, cumulative = items[order], np.cumsum(weights[order])
+        positions = np.searchsorted(cumulative, np.asarray(qs) * cumulative[-1], side='left')
+        return items[np.minimum(positions, items.size - 1)].tolist()
+
+    def ranks(self, values: Iterable[float]) -> List[float]:
+        """Return the approximate fraction of items less than or equal to each value"""
+        values = np.asarray(list(values), dtype=float)
+        if self.n == 0:
+            return [np.nan] * values.size
+        items = np.concatenate(self._levels)
+        weights = np.concatenate([np.full(level.size, 2.0 ** h) for h, level in enumerate(self._levels)])
+        order = np.argsort(items, kind='stable')
+        cumulative = np.concatenate([[0.0], np.cumsum(weights[order])])
+        positions = np.searchsorted(items[order], values, side='right')
+        return (cumulative[positions] / cumulative[-1]).tolist()
+
+    def rank_error(self) -> float:
+        """Approximate normalized rank error at 99% confidence, 0 while exact"""
+        if not self.compacted:
+            return 0.0
+        return 2.296 / self.k ** 0.9723
+
+
+class DatasetSummary:
+    """Moments and quantile sketches for the numeric columns of a dataset"""
+
+    def __init__(self, columns: List[Any], k: int = DEFAULT_SKETCH_K, seed: Optional[int] = None):
+        self.columns = list(columns)
+        self.rows = 0
+        self.moments = MomentSketch(len(self.columns))
+        self.quantile_sketches = [KLLSketch(k, seed=seed) for _ in self.columns]
+
+    def update(self, chunk: pd.DataFrame):
+        """Add a chunk containing at least this summary's columns"""
+        self.update_values(chunk[self.columns].to_numpy(dtype=float, na_value=np.nan))
+
+    def update_values(self, values: np.ndarray):
+        """Add a 2-D float array of rows of this summary's columns, in order"""
+        self.rows += len(values)
+        self.moments.update(values)
+        for index, sketch in enumerate(self.quantile_sketches):
+            sketch.update(values[:, index])
+
+    def merge(self, other: "DatasetSummary"):
+        """Fold a summary of the same columns computed on other rows"""
+        if other.columns != self.columns:
+            raise ValueError("Cannot merge summaries of different columns")
+        self.rows += other.rows
+        self.moments.merge(other.moments)
+        for sketch, other_sketch in zip(self.quantile_sketches, other.quantile_sketches):
+            sketch.merge(other_sketch)
+
+    def statistics(self) -> Dict[str, Any]:
+        """Return statistics in the shape of the /descriptive-stats response"""
+        def by_column(values) -> Dict[Any, float]:
+            return {column: float(value) for column, value in zip(self.columns, values)}
+
+        empty = self.moments.count == 0
+        quantiles = np.array([sketch.quantiles([0.25, 0.5, 0.75]) for sketch in self.quantile_sketches]).reshape(-1, 3)
+        return {
+            "count": {column: int(value) for column, value in zip(self.columns, self.moments.count)},
+            "mean": by_column(np.where(empty, np.nan, self.moments.mean)),
+            "std": by_column(self.moments.std()),
+            "min": by_column(np.where(empty, np.nan, self.moments.min)),
+            "max": by_column(np.where(empty, np.nan, self.moments.max)),
+            "percentiles": {
+                "25%": by_column(quantiles[:, 0]),
+                "50%": by_column(quantiles[:, 1]),
+                "75%": by_column(quantiles[:, 2])
+            },
+            "skewness": by_column(self.moments.skewness()),
+            "kurtosis": by_column(self.moments.kurtosis())
+        }
+
+    def approximation(self) -> Dict[str, Any]:
+        """Describe the quantile approximation used for the percentiles"""
+        return {
+            "quantile_method": "kll",
+            "k": self.quantile_sketches[0].k if self.quantile_sketches else DEFAULT_SKETCH_K,
+            "max_rank_error": max((sketch.rank_error() for sketch in self.quantile_sketches), default=0.0),
+            "rows_scanned": self.rows
+        }
+
+
+def _numeric_columns(sample: pd.DataFrame, columns: Optional[List[Any]]) -> List[Any]:
+    if columns:
+        sample = sample[columns]
+    return sample.select_dtypes(include=[np.number]).columns.tolist()
+
+
+def _summarize_parquet_row_groups(file_path: str, row_groups: List[int], columns: List[Any],
+                                  chunk_size: int, k: int) -> DatasetSummary:
+    import pyarrow.parquet as pq
+
+    summary = DatasetSummary(columns, k=k)
+    parquet_file = pq.ParquetFile(file_path)
+    total_rows = sum(parquet_file.metadata.row_group(i).num_rows for i in row_groups)
+    for batch in parquet_file.iter_batches(batch_size=chunk_size, row_groups=row_groups, columns=columns):
+        summary.update(batch.to_pandas())
+        report_progress("scan", summary.rows, total_rows, unit="rows")
+    return summary
+
+
+def summarize_file(file_path: str, options: Dict[str, Any], columns: Optional[List[Any]] = None) -> DatasetSummary:
+    """Scan a CSV, Parquet or Excel file in chunks and summarize its numeric columns.
+
+    Parquet row groups are split across `max_workers` processes and the
+    partial summaries merged; CSV files and worksheets are scanned
+    sequentially.
+    """
+    chunk_size = int(options.get('chunk_size', DEFAULT_CHUNK_SIZE))
+    k = int(options.get('sketch_k', DEFAULT_SKETCH_K))
+    fmt = file_format(file_path, options)
+
+    if fmt in ('parquet', 'pq'):
+        import pyarrow.parquet as pq
+
+        parquet_file = pq.ParquetFile(file_path)
+        sample = parquet_file.schema_arrow.empty_table().to_pandas()
+        numeric = _numeric_columns(sample, columns)
+        row_groups = list(range(parquet_file.num_row_groups))
+        max_workers = max(1, min(int(options.get('max_workers', 1)), len(row_groups)))
+        if max_workers == 1:
+            return _summarize_parquet_row_groups(file_path, row_groups, numeric, chunk_size, k)
+
+        summary = DatasetSummary(numeric, k=k)
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            futures = [
+                pool.submit(_summarize_parquet_row_groups, file_path, row_groups[i::max_workers], numeric, chunk_size, k)
+                for i in range(max_workers)
+            ]
+            for done, future in enumerate(futures, start=1):
+                summary.merge(future.result())
+                report_progress("scan", done, max_workers, unit="partitions")
+        return summary
+
+    if fmt in ('xlsx', 'xlsm'):
+        chunks = iter_file_chunks(file_path, options, chunk_size=chunk_size)
+        first = next(chunks)
+        summary = DatasetSummary(_numeric_columns(first, columns), k=k)
+        for chunk in itertools.chain([first], chunks):
+            summary.update(chunk)
+            report_progress("scan", summary.rows, None, unit="rows")
+        return summary
+
+    if fmt not in ('csv', 'tsv', 'txt'):
+        raise ValueError(f"Unsupported file format for file-backed statistics: {fmt}")
+    reader = CsvChunkReader(file_path, options, chunk_size=chunk_size, usecols=columns)
+    numeric = [
+        column for column, dtype in reader.dtypes.items()
+        if pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype)
+    ]
+    summary = DatasetSummary(numeric, k=k)
+    for chunk in reader:
+        summary.update(chunk)
+        report_progress("scan", summary.rows, None, unit="rows")
+    return summary
@@ -0,0 +1,180 @@
+"""
+On-disk columnar cache of parsed source files.
+
+Parsing a CSV or Excel file is much slower than reading the same table back
+from Arrow IPC (Feather v2). The first load of a file writes the parsed table
+to the cache directory, keyed by the file's path, size and modification time
+and the options it was parsed with; later loads memory-map that file, so
+numeric columns without missing values are used in place rather than copied.
+Editing the source file changes its key, and the stale entry ages out of the
+size-bounded LRU.
+"""
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import pandas as pd
+
+from result_cache import cache_key, file_fingerprint
+
+DEFAULT_CACHE_DIR = os.path.join(tempfile.gettempdir(), "stats-source-cache")
+DEFAULT_DISK_BUDGET_MB = int(os.environ.get("STATS_SOURCE_CACHE_MB", "4096"))
+
+# Bump when the stored layout changes so stale entries are not read
+SOURCE_CACHE_VERSION = 1
+
+
+class SourceCache:
+    """Size-bounded LRU of parsed tables stored as uncompressed Arrow IPC files.
+
+    Entries live in `STATS_SOURCE_CACHE_DIR`, bounded by
+    `STATS_SOURCE_CACHE_MB` (0 disables the cache). Tables that Arrow cannot
+    represent, such as columns mixing numbers and text, are not cached.
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None, disk_budget_bytes: Optional[int] = None):
+        if disk_budget_bytes is None:
+            disk_budget_bytes = DEFAULT_DISK_BUDGET_MB * 1024 * 1024
+        self.cache_dir = cache_dir or os.environ.get("STATS_SOURCE_CACHE_DIR", DEFAULT_CACHE_DIR)
+        self.disk_budget_bytes = disk_budget_bytes
+
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.RLock()
+        self._counters = {"hits": 0, "misses": 0, "stores": 0, "uncacheable": 0, "evictions": 0}
+        if self.enabled:
+            self._load_index()
+
+    @property
+    def enabled(self) -> bool:
+        return self.disk_budget_bytes > 0
+
+    def load(self, file_path: str, reader: Callable[..., pd.DataFrame], **reader_kwargs) -> Tuple[pd.DataFrame, bool]:
+        """Return (reader(file_path, **reader_kwargs), whether it came from the cache)"""
+        if not self.enabled:
+            return reader(file_path, **reader_kwargs), False
+        key = self.entry_key(file_path, reader, **reader_kwargs)
+        df = self.get(key)
+        if df is not None:
+            return df, True
+        df = reader(file_path, **reader_kwargs)
+        self.put(key, df, file_path, reader, **reader_kwargs)
+        return df, False
+
+    def entry_key(self, file_path: str, reader: Callable[..., pd.DataFrame], **reader_kwargs) -> str:
+        """Key of the table reader(file_path, **reader_kwargs) in the file's current state"""
+        return cache_key(f"source.{reader.__name__}", SOURCE_CACHE_VERSION, file_fingerprint(file_path), reader_kwargs)
+
+    def get(self, key: str) -> Optional[pd.DataFrame]:
+        """Memory-map the table stored under key, or return None"""
+        df = self._read(key) if self.enabled else None
+        if df is None:
+            self._counters["misses"] += 1
+        return df
+
+    def put(self, key: str, df: pd.DataFrame, file_path: str, reader: Callable[..., pd.DataFrame], **reader_kwargs):
+        """Store df under a key taken before parsing, unless the file has changed since"""
+        if self.enabled and self.entry_key(file_path, reader, **reader_kwargs) == key:
+            self._write(key, df)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.arrow")
+
+    def _load_index(self):
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            names = os.listdir(self.cache_dir)
+        except OSError:
+            self.disk_budget_bytes = 0
+            return
+        entries = []
+        for name in names:
+            if name.endswith(".arrow"):
+                stat = os.stat(os.path.join(self.cache_dir, name))
+                entries.append((stat.st_mtime, name[:-len(".arrow")], stat.st_size))
+        for _, key, size in sorted(entries):
+            self._entries[key] = size
+            self._bytes += size
+
+    def _read(self, key: str) -> Optional[pd.DataFrame]:
+        with self._lock:
+            if key not in self._entries:
+                return None
+        import pyarrow as pa
+        try:
+            with pa.memory_map(self._path(key), "r") as source:
+                table = pa.ipc.open_file(source).read_all()
+            os.utime(self._path(key))
+        except (OSError, pa.ArrowInvalid):
+            with self._lock:
+                self._bytes -= self._entries.pop(key, 0)
+            return None
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            self._counters["hits"] += 1
+        # The frame's buffers stay valid after eviction: the mapping outlives the unlinked file
+        return table.to_pandas(split_blocks=True)
+
+    def _write(self, key: str, df: pd.DataFrame):
+        import pyarrow as pa
+        try:
+            table = pa.Table.from_pandas(df)
+        except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+            self._counters["uncacheable"] += 1
+            return
+        if table.nbytes > self.disk_budget_bytes:
+            return
+        temp_path = None
+        try:
+            fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f, pa.ipc.new_file(f, table.schema) as writer:
+                writer.write_table(table)
+            size = os.path.getsize(temp_path)
+            os.replace(temp_path, self._path(key))
+        except OSError:
+            # Loading still succeeds without the cache entry
+            if temp_path is not None and os.path.exists(temp_path):
+                os.remove(temp_path)
+            return
+        with self._lock:
+            self._bytes += size - self._entries.pop(key, 0)
+            self._entries[key] = size
+            self._counters["stores"] += 1
+            evicted = []
+            while self._bytes > self.disk_budget_bytes:
+                old_key, old_size = self._entries.popitem(last=False)
+                self._bytes -= old_size
+                evicted.append(old_key)
+                self._counters["evictions"] += 1
+        for old_key in evicted:
+            try:
+                os.remove(self._path(old_key))
+            except OSError:
+                pass
+
+    def clear(self) -> int:
+        """Delete every entry and return how many were removed"""
+        with self._lock:
+            keys = list(self._entries)
+            self._entries.clear()
+            self._bytes = 0
+        for key in keys:
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+        return len(keys)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "cache_dir": self.cache_dir,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "budget_bytes": self.disk_budget_bytes,
+                **self._counters
+            }
@@ -0,0 +1,77 @@
+"""
+Startup timing and background warm-up.
+
+Importing the service loads FastAPI, pandas and the service's own modules;
+scipy, statsmodels, scikit-learn and matplotlib are only imported by the
+subsystems that use them. The app is ready as soon as that import is done.
+Afterwards, unless `STATS_WARM_UP` is `0`, the worker pools are started on a
+background thread so they import the subsystems before the first request
+does. `/health` reports how long each phase took.
+"""
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
+
+WARM_UP_ENABLED = os.environ.get("STATS_WARM_UP", "1") not in ("0", "false", "no")
+
+# Heavy modules of each subsystem, loaded by worker processes before their first task
+SUBSYSTEM_MODULES = {
+    "statistics": ["scipy.stats", "anova", "hypothesis", "correlation"],
+    "regression": ["statsmodels.api", "regression"],
+    "clustering": ["sklearn.preprocessing", "clustering"],
+    "visualization": ["plotting"],
+}
+
+
+class StartupMonitor:
+    """Record import time, readiness and background warm-up of the service"""
+
+    def __init__(self, started: Optional[float] = None):
+        self.started = started if started is not None else time.perf_counter()
+        self.started_at = datetime.now().isoformat()
+        self.import_seconds: Optional[float] = None
+        self.ready_seconds: Optional[float] = None
+        self._warm_up: Dict[str, Dict[str, Any]] = {}
+
+    def imported(self):
+        """Mark the end of module import"""
+        self.import_seconds = time.perf_counter() - self.started
+
+    def ready(self):
+        """Mark the app as ready to serve requests"""
+        self.ready_seconds = time.perf_counter() - self.started
+
+    def warm_up(self, tasks: Dict[str, Callable[[], Any]]) -> threading.Thread:
+        """Run the named tasks one after another on a daemon thread, timing each"""
+        for name in tasks:
+            self._warm_up[name] = {"state": "pending", "seconds": None}
+
+        def run():
+            for name, task in tasks.items():
+                entry = self._warm_up[name]
+                entry["state"] = "running"
+                started = time.perf_counter()
+                try:
+                    task()
+                    entry["state"] = "done"
+                except Exception as e:
+                    # The subsystem is loaded on first use instead
+                    entry["state"] = "failed"
+                    entry["error"] = str(e)
+                entry["seconds"] = time.perf_counter() - started
+
+        thread = threading.Thread(target=run, name="stats-warm-up", daemon=True)
+        thread.start()
+        return thread
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "started_at": self.started_at,
+            "import_seconds": self.import_seconds,
+            "ready_seconds": self.ready_seconds,
+            "uptime_seconds": time.perf_counter() - self.started,
+            "warm_up_enabled": WARM_UP_ENABLED,
+            "warm_up": {name: dict(entry) for name, entry in self._warm_up.items()}
+        }
@@ -0,0 +1,84 @@
+"""
+Deterministic synthetic datasets for benchmarks.
+
+A dataset is named by its shape, row count and layout, and generated from a
+seed derived from those, so the same name gives the same frame on every
+machine and run. Every shape has a row index `t`, feature columns `x0`,
+`x1`, ... and a target `y` that depends linearly on the first features:
+
+- numeric: only those float columns
+- categorical: plus string columns `category` (CATEGORY_LEVELS levels) and
+  `segment` (4 levels)
+- missing: features and target with MISSING_FRACTION of values missing
+- grouped: plus a `group` column of GROUP_COUNT levels that shifts `y`
+
+The narrow layout has 8 features and the wide layout 256.
+"""
+import zlib
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+SHAPES = ('numeric', 'categorical', 'missing', 'grouped')
+SIZES: Dict[str, int] = {'1k': 1_000, '100k': 100_000, '1m': 1_000_000}
+LAYOUTS: Dict[str, int] = {'narrow': 8, 'wide': 256}
+
+CATEGORY_LEVELS = 12
+GROUP_COUNT = 5
+MISSING_FRACTION = 0.1
+# Features that y depends on
+TARGET_FEATURES = 4
+
+
+def dataset_name(shape: str, size: str, layout: str) -> str:
+    return f"{shape}-{size}-{layout}"
+
+
+def _seed(shape: str, rows: int, layout: str, seed: int) -> int:
+    return zlib.crc32(f"{shape}:{rows}:{layout}:{seed}".encode())
+
+
+def feature_columns(layout: str) -> List[str]:
+    return [f"x{i}" for i in range(LAYOUTS[layout])]
+
+
+def generate(shape: str, rows: int, layout: str = 'narrow', seed: int = 0) -> pd.DataFrame:
+    """The synthetic dataset of shape with rows rows in layout"""
+    if shape not in SHAPES:
+        raise ValueError(f"Unsupported shape: {shape}. Use one of: {', '.join(SHAPES)}")
+    if layout not in LAYOUTS:
+        raise ValueError(f"Unsupported layout: {layout}. Use one of: {', '.join(LAYOUTS)}")
+    rng = np.random.default_rng(_seed(shape, rows, layout, seed))
+    features = rng.standard_normal((rows, LAYOUTS[layout]))
+    # Correlate neighbouring features so correlation and regression have structure to find
+    features[:, 1:] += 0.5 * features[:, :-1]
+    coefficients = np.arange(1, min(TARGET_FEATURES, features.shape[1]) + 1, dtype=float)
+    target = features[:, :len(coefficients)] @ coefficients + rng.standard_normal(rows)
+
+    columns: Dict[str, np.ndarray] = {"t": np.arange(rows, dtype=np.int64)}
+    if shape == 'grouped':
+        groups = rng.integers(0, GROUP_COUNT, rows)
+        target += groups * 0.25
+        columns["group"] = np.array([f"g{i}" for i in range(GROUP_COUNT)], dtype=object)[groups]
+    if shape == 'categorical':
+        columns["category"] = np.array([f"c{i:02d}" for i in range(CATEGORY_LEVELS)], dtype=object)[
+            rng.integers(0, CATEGORY_LEVELS, rows)]
+        columns["segment"] = np.array(list("abcd"), dtype=object)[rng.integers(0, 4, rows)]
+    if shape == 'missing':
+        features[rng.random(features.shape) < MISSING_FRACTION] = np.nan
+        target[rng.random(rows) < MISSING_FRACTION] = np.nan
+
+    df = pd.DataFrame(columns)
+    df = pd.concat([df, pd.DataFrame(features, columns=feature_columns(layout))], axis=1)
+    df["y"] = target
+    return df
+
+
+def columnar_json(df: pd.DataFrame) -> Dict[str, object]:
+    """df as the service's columnar JSON body, missing values as null"""
+    data = {}
+    for column in df.columns:
+        values = df[column]
+        data[str(column)] = values.astype(object).where(values.notna(), None).tolist()
+    return {"columns": [str(column) for column in df.columns], "data": data}
@@ -0,0 +1,32 @@
+"""
+Chunked reading of CSV files whose later chunks differ from the first.
+
+Run from this directory with `python -m pytest test_chunked_io.py`.
+"""
+import pandas as pd
+
+from chunked_io import CsvChunkReader, iter_file_chunks
+
+
+def write_csv(tmp_path, rows):
+    path = tmp_path / "readings.csv"
+    path.write_text("id,value\n" + "".join(f"{i},{value}\n" for i, value in enumerate(rows)))
+    return str(path)
+
+
+def test_integer_column_holds_decimal_in_later_chunk(tmp_path):
+    path = write_csv(tmp_path, [1, 2, 3, 4, 5, 6, 7, 8, 9, 2.5, 11])
+    reader = CsvChunkReader(path, {}, chunk_size=5)
+    chunks = list(reader)
+    assert [len(chunk) for chunk in chunks] == [5, 5, 1]
+    assert all(chunk["value"].dtype == "float64" for chunk in chunks)
+    pd.testing.assert_series_equal(
+        pd.concat(chunks, ignore_index=True)["value"], pd.read_csv(path)["value"]
+    )
+
+
+def test_integer_column_holds_missing_value_in_later_chunk(tmp_path):
+    path = write_csv(tmp_path, [1, 2, 3, 4, 5, 6, "", 8])
+    values = pd.concat(iter_file_chunks(path, {}, chunk_size=5), ignore_index=True)["value"]
+    assert values.isna().sum() == 1
+    assert values.sum() == 29
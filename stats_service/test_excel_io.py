@@ -0,0 +1,26 @@
+"""
+Streaming worksheets whose later chunks differ from the first.
+
+Run from this directory with `python -m pytest test_excel_io.py`.
+"""
+import json
+
+import pandas as pd
+from fastapi.testclient import TestClient
+
+import advanced_main
+from wire_format import META_HEADER
+
+
+def test_stream_integer_column_with_decimal_in_later_chunk(tmp_path):
+    path = tmp_path / "readings.xlsx"
+    expected = pd.DataFrame({"id": range(11), "value": [1, 2, 3, 4, 5, 6, 7, 8, 9, 2.5, 11]})
+    expected.astype({"value": object}).to_excel(path, index=False)
+
+    response = TestClient(advanced_main.app).post(
+        "/load-excel", json={"file_path": str(path), "options": {"stream": True, "chunk_size": 5}}
+    )
+    assert response.status_code == 200, response.text
+    assert json.loads(response.headers[META_HEADER])["dtypes"]["value"] == "float64"
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row["value"] for row in rows] == expected["value"].tolist()
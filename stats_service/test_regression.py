@@ -0,0 +1,43 @@
+"""
+Agreement of the regression methods on incomplete and file-backed data.
+
+Run from this directory with `python -m pytest test_regression.py`.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+import analyses
+
+
+@pytest.fixture
+def frame() -> pd.DataFrame:
+    rng = np.random.default_rng(1)
+    df = pd.DataFrame(rng.normal(size=(200, 2)), columns=["a", "b"])
+    df["y"] = df["a"] - 2 * df["b"] + rng.normal(scale=0.1, size=len(df))
+    df.loc[3, "a"] = np.nan
+    df.loc[7, "y"] = np.nan
+    return df
+
+
+def test_ols_and_streaming_skip_the_same_incomplete_rows(frame):
+    ols = analyses.linear_regression(frame, "y", None, {"method": "ols", "outputs": "none"})
+    streaming = analyses.linear_regression(frame, "y", None, {"method": "streaming", "outputs": "none"})
+    assert ols["n_observations"] == streaming["n_observations"] == 198
+    assert ols["rows_skipped"] == streaming["rows_skipped"] == 2
+    for name in ("coefficients", "p_values", "standard_errors"):
+        assert ols[name] == pytest.approx(streaming[name])
+
+
+def test_file_regression_with_decimal_in_later_chunk(tmp_path, frame):
+    complete = frame.dropna().round(3)
+    complete.loc[complete.index[-1], "a"] = 2.5
+    path = tmp_path / "readings.csv"
+    # An integer-looking first chunk followed by decimals
+    complete.head(5).round(0).astype(int).to_csv(path, index=False)
+    complete.iloc[5:].to_csv(path, mode="a", header=False, index=False)
+
+    result = analyses.file_linear_regression(str(path), {"chunk_size": 5, "outputs": "none"}, "y")
+    expected = analyses.linear_regression(pd.read_csv(path), "y", None, {"method": "ols", "outputs": "none"})
+    assert result["n_observations"] == expected["n_observations"]
+    assert result["coefficients"] == pytest.approx(expected["coefficients"])
@@ -0,0 +1,27 @@
+"""
+File-backed summaries of CSV files scanned in chunks.
+
+Run from this directory with `python -m pytest test_sketches.py`.
+"""
+import numpy as np
+import pandas as pd
+
+from sketches import summarize_file
+
+
+def test_csv_summary_with_decimal_in_later_chunk(tmp_path):
+    path = tmp_path / "readings.csv"
+    values = [1, 2, 3, 4, 5, 6, 7, 8, 9, 2.5, 11]
+    path.write_text("id,value,label\n" + "".join(f"{i},{value},r{i}\n" for i, value in enumerate(values)))
+
+    summary = summarize_file(str(path), {"chunk_size": 5})
+    statistics = summary.statistics()
+    expected = pd.read_csv(path)
+
+    assert summary.rows == len(values)
+    assert set(statistics["mean"]) == {"id", "value"}
+    for column in ("id", "value"):
+        assert statistics["count"][column] == len(values)
+        assert np.isclose(statistics["mean"][column], expected[column].mean())
+        assert np.isclose(statistics["std"][column], expected[column].std())
+        assert statistics["max"][column] == expected[column].max()
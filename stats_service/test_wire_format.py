@@ -0,0 +1,82 @@
+"""
+Round trips of datasets through the binary body formats of the advanced service.
+
+Run from this directory with `python -m pytest test_wire_format.py`.
+"""
+import asyncio
+import json
+
+import pandas as pd
+import pyarrow as pa
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from starlette.requests import Request
+
+import advanced_main
+from wire_format import (
+    ARROW_FILE_MEDIA_TYPE, ARROW_STREAM_MEDIA_TYPE, META_HEADER, read_frame, response_media_type, response_orient,
+    write_frame
+)
+
+ARROW_MEDIA_TYPES = [ARROW_STREAM_MEDIA_TYPE, ARROW_FILE_MEDIA_TYPE]
+
+
+@pytest.fixture
+def frame() -> pd.DataFrame:
+    return pd.DataFrame({"x": [1.5, 2.5, None], "n": [1, 2, 3], "label": ["a", "b", "c"]})
+
+
+def read_arrow(body: bytes, media_type: str) -> pd.DataFrame:
+    """Decode a body with pyarrow directly, independently of read_frame"""
+    if media_type == ARROW_FILE_MEDIA_TYPE:
+        return pa.ipc.open_file(pa.py_buffer(body)).read_all().to_pandas()
+    return pa.ipc.open_stream(pa.py_buffer(body)).read_all().to_pandas()
+
+
+@pytest.mark.parametrize("media_type", ARROW_MEDIA_TYPES)
+def test_write_frame_round_trips(frame, media_type):
+    body = write_frame(frame, media_type)
+    pd.testing.assert_frame_equal(read_arrow(body, media_type), frame, check_dtype=False)
+    pd.testing.assert_frame_equal(read_frame(body, media_type), frame, check_dtype=False)
+
+
+@pytest.mark.parametrize("media_type", ARROW_MEDIA_TYPES)
+def test_request_and_response_bodies_round_trip(frame, media_type):
+    client = TestClient(advanced_main.app)
+    response = client.post(
+        "/select-columns",
+        content=write_frame(frame, media_type),
+        headers={
+            "Content-Type": media_type,
+            "Accept": media_type,
+            "X-Stats-Params": json.dumps({"columns": ["x", "label"]}),
+        },
+    )
+    assert response.status_code == 200, response.text
+    assert response.headers["content-type"] == media_type
+    assert META_HEADER.lower() in response.headers
+    pd.testing.assert_frame_equal(read_arrow(response.content, media_type), frame[["x", "label"]], check_dtype=False)
+
+    info = client.post("/data-info", content=write_frame(frame, media_type), headers={"Content-Type": media_type})
+    assert info.status_code == 200, info.text
+
+
+
+def test_bad_orient_header_leaves_no_response_format_behind():
+    route = next(route for route in advanced_main.app.routes if getattr(route, "path", None) == "/data-info")
+    handler = route.get_route_handler()
+    headers = [(b"accept", ARROW_STREAM_MEDIA_TYPE.encode()), (b"x-stats-orient", b"sideways")]
+
+    async def receive():
+        return {"type": "http.request", "body": b"{}", "more_body": False}
+
+    async def call():
+        # The handler runs in this task, so a context variable it fails to reset stays visible here
+        scope = {"type": "http", "method": "POST", "path": "/data-info", "headers": headers, "query_string": b""}
+        with pytest.raises(HTTPException) as rejected:
+            await handler(Request(scope, receive))
+        assert rejected.value.status_code == 400
+        return response_media_type(), response_orient()
+
+    assert asyncio.run(call()) == (None, "records")
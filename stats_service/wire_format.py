@@ -0,0 +1,474 @@
+"""
+Columnar wire formats for the Advanced Statistical Analysis Service.
+
+Endpoints normally exchange datasets as JSON lists of records. Clients that
+send `Content-Type` or `Accept` set to Apache Arrow IPC stream or Parquet
+exchange the dataset as a single columnar body instead:
+
+- Request bodies in a binary format carry the dataset; the remaining request
+  parameters are sent as a JSON object in the `X-Stats-Params` header.
+- Binary responses carry the resulting dataset; the remaining response fields
+  are sent as a JSON object in the `X-Stats-Meta` header.
+
+JSON bodies of dataset endpoints take a fast path: the body is parsed with
+orjson and its `data` is built into a DataFrame directly, as records or in a
+columnar or split layout, instead of being validated row by row. Responses
+are encoded with orjson, which handles NumPy values and writes NaN as null.
+Request and response bodies can be gzip (or, with zstandard installed, zstd)
+compressed.
+"""
+import functools
+import gzip
+import inspect
+import zlib
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+import orjson
+import pandas as pd
+from fastapi import HTTPException, Request, Response
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute
+from pydantic import BaseModel
+
+import metrics
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+ARROW_STREAM_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+ARROW_FILE_MEDIA_TYPE = "application/vnd.apache.arrow.file"
+PARQUET_MEDIA_TYPE = "application/vnd.apache.parquet"
+JSON_MEDIA_TYPE = "application/json"
+
+PARAMS_HEADER = "x-stats-params"
+META_HEADER = "X-Stats-Meta"
+ORIENT_HEADER = "x-stats-orient"
+
+# Layouts of a dataset in a JSON body
+JSON_ORIENTS = ("records", "columns", "split")
+# Responses smaller than this are not worth compressing
+COMPRESSION_MIN_SIZE = 1024
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+
+_ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+_MEDIA_TYPE_ALIASES = {
+    ARROW_STREAM_MEDIA_TYPE: ARROW_STREAM_MEDIA_TYPE,
+    ARROW_FILE_MEDIA_TYPE: ARROW_FILE_MEDIA_TYPE,
+    PARQUET_MEDIA_TYPE: PARQUET_MEDIA_TYPE,
+    "application/x-parquet": PARQUET_MEDIA_TYPE,
+}
+
+_request_frame: ContextVar[Optional[pd.DataFrame]] = ContextVar("request_frame", default=None)
+_response_media_type: ContextVar[Optional[str]] = ContextVar("response_media_type", default=None)
+_response_orient: ContextVar[str] = ContextVar("response_orient", default="records")
+
+
+def import_pyarrow():
+    """Import pyarrow with its IPC and Parquet modules, as a 415 if it is missing"""
+    try:
+        import pyarrow as pa
+        import pyarrow.ipc  # noqa: F401
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        raise HTTPException(status_code=415, detail="Arrow and Parquet bodies require pyarrow to be installed")
+    return pa
+
+
+def binary_media_type(header_value: Optional[str]) -> Optional[str]:
+    """Return the canonical binary media type named in a Content-Type header"""
+    if not header_value:
+        return None
+    media_type = header_value.split(";", 1)[0].strip().lower()
+    return _MEDIA_TYPE_ALIASES.get(media_type)
+
+
+def _accept_items(header: str) -> Iterator[Tuple[str, float]]:
+    """Yield (value, quality) for each entry of an Accept-style header"""
+    for item in header.split(","):
+        value, *params = [part.strip() for part in item.split(";")]
+        quality = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        yield value.lower(), quality
+
+
+def negotiate_media_type(accept: Optional[str]) -> Optional[str]:
+    """Pick the preferred binary media type from an Accept header, or None for JSON"""
+    if not accept:
+        return None
+    best, best_quality = None, 0.0
+    for media_type, quality in _accept_items(accept):
+        if media_type in (JSON_MEDIA_TYPE, "*/*"):
+            candidate = None
+        else:
+            candidate = _MEDIA_TYPE_ALIASES.get(media_type)
+            if candidate is None:
+                continue
+        if quality > best_quality:
+            best, best_quality = candidate, quality
+    return best
+
+
+def read_frame(body: bytes, media_type: str) -> pd.DataFrame:
+    """Build a DataFrame from an Arrow IPC stream, Arrow IPC file or Parquet body.
+
+    Numeric columns without nulls are exposed without copying the buffer.
+    """
+    pa = import_pyarrow()
+    with metrics.phase("frame"):
+        buffer = pa.py_buffer(body)
+        if media_type == PARQUET_MEDIA_TYPE:
+            table = pa.parquet.read_table(pa.BufferReader(buffer))
+        elif media_type == ARROW_FILE_MEDIA_TYPE:
+            table = pa.ipc.open_file(buffer).read_all()
+        else:
+            table = pa.ipc.open_stream(buffer).read_all()
+        return table.to_pandas(split_blocks=True, self_destruct=True)
+
+
+def write_frame(df: pd.DataFrame, media_type: str) -> bytes:
+    """Serialize a DataFrame as an Arrow IPC stream, Arrow IPC file or Parquet file"""
+    pa = import_pyarrow()
+    with metrics.phase("serialize"):
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        sink = pa.BufferOutputStream()
+        if media_type == PARQUET_MEDIA_TYPE:
+            pa.parquet.write_table(table, sink)
+        elif media_type == ARROW_FILE_MEDIA_TYPE:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        else:
+            with pa.ipc.new_stream(sink, table.schema) as writer:
+                writer.write_table(table)
+        return sink.getvalue().to_pybytes()
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Pick zstd or gzip from an Accept-Encoding header, or None for an uncompressed body"""
+    if not accept_encoding:
+        return None
+    best, best_quality = None, 0.0
+    for encoding, quality in _accept_items(accept_encoding):
+        if encoding == "zstd" and zstandard is None:
+            continue
+        if encoding in ("gzip", "zstd") and (quality > best_quality or (
+                quality == best_quality and encoding == "zstd")):
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+
+def stream_compressor(encoding: str):
+    """Incremental compressor with compress(data) and flush() for a gzip or zstd stream"""
+    if encoding == "zstd":
+        if zstandard is None:
+            raise ValueError("zstd compression requires zstandard to be installed")
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+    if encoding == "gzip":
+        return zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    raise ValueError(f"Unsupported compression: {encoding}")
+
+
+def decompress(body: bytes, encoding: Optional[str]) -> bytes:
+    """Decode a request body sent with Content-Encoding, as a 415 for unsupported encodings"""
+    encoding = (encoding or "identity").strip().lower()
+    if encoding == "identity":
+        return body
+    if encoding == "zstd" and zstandard is None:
+        raise HTTPException(status_code=415, detail="zstd bodies require zstandard to be installed")
+    if encoding not in ("gzip", "zstd"):
+        raise HTTPException(status_code=415, detail=f"Unsupported Content-Encoding: {encoding}")
+    try:
+        if encoding == "zstd":
+            return zstandard.ZstdDecompressor().decompressobj().decompress(body)
+        return gzip.decompress(body)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid {encoding} body: {str(e)}")
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, pd.Timestamp):
+        return value.isoformat()
+    if value is pd.NaT or value is pd.NA:
+        return None
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    if isinstance(value, (set, frozenset, pd.Index, pd.Series)):
+        return list(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    """Encode content as JSON, with NumPy values and NaN (as null) handled natively"""
+    return orjson.dumps(content, default=_json_default, option=_ORJSON_OPTIONS)
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON response encoded with orjson"""
+
+    def render(self, content: Any) -> bytes:
+        with metrics.phase("serialize"):
+            return dumps(content)
+
+
+def metadata_header(metadata: Dict[str, Any]) -> str:
+    """Encode response fields for the metadata header of a binary response"""
+    return dumps(metadata).decode()
+
+
+def frame_from_json(data: Union[List[Dict[str, Any]], Dict[str, Any]]) -> pd.DataFrame:
+    """Build a DataFrame from a JSON dataset.
+
+    data is a list of records, or an object with "data" holding either one
+    list per column ({"columns": [...], "data": {column: [...]}}; columns is
+    optional) or one list per row ({"columns": [...], "data": [[...], ...]},
+    pandas' "split" layout).
+    """
+    with metrics.phase("frame"):
+        return _frame_from_json(data)
+
+
+def _frame_from_json(data: Union[List[Dict[str, Any]], Dict[str, Any]]) -> pd.DataFrame:
+    if isinstance(data, list):
+        if not all(isinstance(row, dict) for row in data):
+            raise ValueError("data must be a list of records")
+        return pd.DataFrame(data)
+    if not isinstance(data, dict) or "data" not in data:
+        raise ValueError("data must be a list of records or an object with columns and data")
+    columns, values = data.get("columns"), data["data"]
+    if isinstance(values, dict):
+        if columns is None:
+            columns = list(values)
+        missing = [column for column in columns if column not in values]
+        if missing:
+            raise ValueError(f"data has no values for columns: {missing}")
+        return pd.DataFrame({column: values[column] for column in columns}, columns=columns)
+    if isinstance(values, list) and columns is not None:
+        return pd.DataFrame(values, columns=columns)
+    raise ValueError("data.data must be an object of columns, or a list of rows with data.columns")
+
+
+def frame_to_json(df: pd.DataFrame, orient: str = "records") -> Union[List[Dict[str, Any]], Dict[str, Any]]:
+    """Lay out a DataFrame for a JSON response as records, columns or split rows"""
+    with metrics.phase("serialize"):
+        if orient == "columns":
+            return {
+                "columns": df.columns.tolist(),
+                "data": {column: df[column].to_numpy() for column in df.columns}
+            }
+        if orient == "split":
+            return {"columns": df.columns.tolist(), "data": df.to_numpy().tolist()}
+        return df.to_dict('records')
+
+
+def request_frame() -> Optional[pd.DataFrame]:
+    """Return the DataFrame decoded from the current request body, if any"""
+    return _request_frame.get()
+
+
+def response_media_type() -> Optional[str]:
+    """Return the binary media type negotiated for the current response, if any"""
+    return _response_media_type.get()
+
+
+def response_orient() -> str:
+    """Return the JSON layout requested for datasets in the current response"""
+    return _response_orient.get()
+
+
+@contextmanager
+def in_memory_request(df: pd.DataFrame) -> Iterator[None]:
+    """Let an endpoint called directly read df as its request body and answer in JSON"""
+    frame_token = _request_frame.set(df)
+    media_token = _response_media_type.set(None)
+    orient_token = _response_orient.set("records")
+    try:
+        yield
+    finally:
+        _response_orient.reset(orient_token)
+        _response_media_type.reset(media_token)
+        _request_frame.reset(frame_token)
+
+
+def binary_frame_response(df: pd.DataFrame, media_type: str, metadata: Dict[str, Any]) -> Response:
+    """Return df as a binary body with the remaining fields in the metadata header"""
+    return Response(
+        content=write_frame(df, media_type),
+        media_type=media_type,
+        headers={META_HEADER: metadata_header(metadata)},
+    )
+
+
+def _json_endpoint(endpoint: Callable, status_code: Optional[int]) -> Callable:
+    """Wrap an endpoint so that plain results are returned as FastJSONResponse.
+
+    FastAPI would otherwise pass them through jsonable_encoder, which walks
+    every value in Python and rejects NumPy scalars.
+    """
+    def respond(result: Any) -> Any:
+        if isinstance(result, Response):
+            return result
+        return FastJSONResponse(result, status_code=status_code or 200)
+
+    if inspect.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def json_endpoint(*args, **kwargs):
+            metrics.endpoint_started()
+            return respond(await endpoint(*args, **kwargs))
+    else:
+        @functools.wraps(endpoint)
+        def json_endpoint(*args, **kwargs):
+            metrics.endpoint_started()
+            return respond(endpoint(*args, **kwargs))
+    return json_endpoint
+
+
+def _is_json(content_type: Optional[str]) -> bool:
+    media_type = (content_type or "").split(";", 1)[0].strip().lower()
+    return media_type == JSON_MEDIA_TYPE or media_type.endswith("+json")
+
+
+class FrameRoute(APIRoute):
+    """Route that decodes dataset bodies and negotiates the response format.
+
+    A binary body is decoded into a DataFrame available through
+    `request_frame()`, and the request is handed to FastAPI as the JSON
+    parameters from the `X-Stats-Params` header so the endpoint's model
+    validates as usual. On endpoints whose body model has `data` and
+    `dataset_id` fields, the `data` of a JSON body is decoded the same way
+    and removed before validation. Compressed bodies are decompressed first,
+    and responses are compressed as the client's Accept-Encoding allows.
+    """
+
+    def __init__(self, path: str, endpoint: Callable, **kwargs):
+        super().__init__(path, _json_endpoint(endpoint, kwargs.get("status_code")), **kwargs)
+        # Endpoints looked up and called directly (jobs, pipelines) return plain results
+        self.endpoint = endpoint
+        model = self.body_field.field_info.annotation if self.body_field is not None else None
+        self.accepts_frame = inspect.isclass(model) and issubclass(model, BaseModel) \
+            and {"data", "dataset_id"} <= set(model.model_fields)
+
+    def get_route_handler(self) -> Callable:
+        original_route_handler = super().get_route_handler()
+
+        async def frame_route_handler(request: Request) -> Response:
+            frame_token = None
+            # Validated before any context variable is set, so a bad header leaves none of them behind
+            orient = _requested_orient(request.headers.get(ORIENT_HEADER))
+            media_token = _response_media_type.set(negotiate_media_type(request.headers.get("accept")))
+            orient_token = _response_orient.set(orient)
+            try:
+                content_type = request.headers.get("content-type")
+                content_encoding = request.headers.get("content-encoding")
+                media_type = binary_media_type(content_type)
+                if media_type is not None:
+                    body = decompress(await request.body(), content_encoding)
+                    try:
+                        frame = read_frame(body, media_type)
+                    except HTTPException:
+                        raise
+                    except Exception as e:
+                        raise HTTPException(status_code=400, detail=f"Invalid {media_type} body: {str(e)}")
+                    frame_token = _request_frame.set(frame)
+                    request = _json_params_request(request)
+                elif self.accepts_frame and _is_json(content_type):
+                    body = decompress(await request.body(), content_encoding)
+                    frame, body = _split_json_body(body)
+                    if frame is not None:
+                        frame_token = _request_frame.set(frame)
+                    request = _replace_body(request, body, JSON_MEDIA_TYPE)
+                elif content_encoding is not None:
+                    body = decompress(await request.body(), content_encoding)
+                    request = _replace_body(request, body, content_type)
+                response = await original_route_handler(request)
+                return _compress_response(response, request.headers.get("accept-encoding"))
+            finally:
+                if frame_token is not None:
+                    _request_frame.reset(frame_token)
+                _response_orient.reset(orient_token)
+                _response_media_type.reset(media_token)
+
+        return frame_route_handler
+
+
+def _requested_orient(header_value: Optional[str]) -> str:
+    orient = (header_value or "records").strip().lower()
+    if orient not in JSON_ORIENTS:
+        raise HTTPException(status_code=400, detail=f"{ORIENT_HEADER} must be one of {list(JSON_ORIENTS)}")
+    return orient
+
+
+def _split_json_body(body: bytes) -> Tuple[Optional[pd.DataFrame], bytes]:
+    """Decode the dataset in a JSON body, returning (DataFrame or None, body without data)"""
+    try:
+        params = orjson.loads(body)
+    except orjson.JSONDecodeError:
+        # Left for FastAPI to report as invalid JSON
+        return None, body
+    if not isinstance(params, dict) or params.get("data") is None:
+        return None, body
+    try:
+        frame = frame_from_json(params.pop("data"))
+    except ValueError as e:
+        raise RequestValidationError([{"type": "value_error", "loc": ("body", "data"), "msg": str(e), "input": None}])
+    return frame, orjson.dumps(params)
+
+
+def _compress_response(response: Response, accept_encoding: Optional[str]) -> Response:
+    """Compress a buffered response body with the client's preferred encoding"""
+    encoding = negotiate_encoding(accept_encoding)
+    body = getattr(response, "body", None)
+    if encoding is None or body is None or len(body) < COMPRESSION_MIN_SIZE \
+            or "content-encoding" in response.headers:
+        return response
+    response.body = compress(body, encoding)
+    response.headers["content-encoding"] = encoding
+    response.headers["content-length"] = str(len(response.body))
+    response.headers.append("vary", "Accept-Encoding")
+    return response
+
+
+def _replace_body(request: Request, body: bytes, content_type: Optional[str]) -> Request:
+    """Return a copy of request with a new, uncompressed body"""
+    headers = [
+        (key, value) for key, value in request.scope["headers"]
+        if key not in (b"content-type", b"content-length", b"content-encoding")
+    ]
+    if content_type is not None:
+        headers.append((b"content-type", content_type.encode("latin-1")))
+    headers.append((b"content-length", str(len(body)).encode()))
+    scope = dict(request.scope, headers=headers)
+
+    replaced = Request(scope, request.receive)
+    replaced._body = body
+    return replaced
+
+
+def _json_params_request(request: Request) -> Request:
+    params = request.headers.get(PARAMS_HEADER, "{}").encode("latin-1")
+    try:
+        orjson.loads(params)
+    except orjson.JSONDecodeError:
+        raise HTTPException(status_code=400, detail=f"{PARAMS_HEADER} header must be a JSON object")
+    return _replace_body(request, params, JSON_MEDIA_TYPE)